@@ -0,0 +1,116 @@
+"""
+Equivalence check and time/memory benchmark for
+analysis.fractional_counts_by_inventor_country.
+
+Compares it with the string-slicing implementation it replaced on generated
+RegPat rows, with filing_date as YYYYMMDD integers, strings and dates, and
+on an Arrow table. Memory is the tracemalloc peak, which covers Python
+objects and numpy buffers but not Arrow's own allocator.
+
+    PYTHONPATH=src python benchmarks/bench_analysis.py --rows 5000000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from pipeline.analysis import fractional_counts_by_inventor_country
+
+
+COUNTRIES = ["US", "JP", "DE", "CN", "KR", "FR", "GB", "NL", "CH", "SE", "IT", "ES"]
+
+
+def reference_fractional_counts(regpat_filtered: pd.DataFrame, filing_date_column: str = "filing_date") -> pd.DataFrame:
+    df = regpat_filtered.copy()
+    df = df.dropna(subset=["ctry_code", "inv_share", filing_date_column])
+    df = df[df["inv_share"] > 0]
+
+    df["year"] = df[filing_date_column].astype(str).str.slice(0, 4)
+    df = df[df["year"].str.fullmatch(r"\d{4}")]
+
+    out = (
+        df.groupby(["ctry_code", "year"], as_index=False)["inv_share"]
+        .sum()
+        .rename(columns={"ctry_code": "inventor_country", "inv_share": "fractional_patents", "year": "filing_year"})
+        .sort_values(["filing_year", "fractional_patents"], ascending=[True, False])
+        .reset_index(drop=True)
+    )
+    out["filing_year"] = out["filing_year"].astype(int)
+    return out
+
+
+def make_frame(n: int, seed: int, filing_kind: str = "int") -> pd.DataFrame:
+    """RegPat-like rows with missing values, zero shares and a few malformed dates."""
+    rng = np.random.default_rng(seed)
+    filing = pd.array(rng.integers(19780101, 20241231, size=n), dtype="Int64")
+    filing[rng.random(n) < 0.01] = pd.NA
+    if filing_kind == "str":
+        filing = filing.astype("string")
+        filing[rng.random(n) < 0.01] = "n/a"
+    elif filing_kind == "date":
+        filing = pd.to_datetime(filing.astype("string"), format="%Y%m%d", errors="coerce")
+
+    ctry = pd.array(rng.choice(COUNTRIES, size=n), dtype="string")
+    ctry[rng.random(n) < 0.01] = pd.NA
+    share = rng.choice([0.0, 0.25, 1 / 3, 0.5, 1.0], size=n)
+    share[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({"pct_key": rng.integers(0, 2**40, size=n), "ctry_code": ctry, "inv_share": share, "filing_date": filing})
+
+
+def check_equivalence(n_cases: int, rows: int) -> None:
+    for seed in range(n_cases):
+        for kind in ("int", "str", "date"):
+            df = make_frame(rows, seed, kind)
+            expected = reference_fractional_counts(df)
+            pd.testing.assert_frame_equal(fractional_counts_by_inventor_country(df), expected, check_exact=True)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pd.testing.assert_frame_equal(fractional_counts_by_inventor_country(table), expected, check_exact=True)
+    print(f"equivalent on {n_cases} random frames of {rows:,} rows per filing_date type")
+
+
+def measure(func, data, repeat: int) -> tuple[float, int]:
+    """Best wall time over repeat runs, and the tracemalloc peak of one run."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", type=int, default=10, help="Random frames for the equivalence check.")
+    args = parser.parse_args()
+
+    check_equivalence(args.cases, rows=5_000)
+
+    for kind in ("int", "str", "date"):
+        df = make_frame(args.rows, seed=12345, filing_kind=kind)
+        ref_time, ref_peak = measure(reference_fractional_counts, df, args.repeat)
+        new_time, new_peak = measure(fractional_counts_by_inventor_country, df, args.repeat)
+        print(f"filing_date as {kind}:")
+        print(f"  string slicing: {args.rows / ref_time:>12,.0f} rows/sec  peak {ref_peak / 2**20:>8,.1f} MiB")
+        print(
+            f"  numeric year:   {args.rows / new_time:>12,.0f} rows/sec  peak {new_peak / 2**20:>8,.1f} MiB"
+            f"  ({ref_time / new_time:.1f}x faster)"
+        )
+
+    table = pa.Table.from_pandas(make_frame(args.rows, seed=12345), preserve_index=False)
+    arrow_time, arrow_peak = measure(fractional_counts_by_inventor_country, table, args.repeat)
+    print(f"Arrow table input: {args.rows / arrow_time:>12,.0f} rows/sec  peak {arrow_peak / 2**20:>8,.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
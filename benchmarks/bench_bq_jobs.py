@@ -0,0 +1,111 @@
+"""
+Sequential vs concurrent BigQuery job submission, against a stub client.
+
+The stub's jobs finish a set time after they are submitted (--latency,
+one value per query), like real BigQuery jobs. The sequential path runs
+run_query_cached query by query, as run-config did; the concurrent path
+submits every job up front through QueryJobs and takes the results as they
+arrive (runner.submit_queries). Reports wall time for both; the results
+and their arrival order are checked in tests/test_query_jobs.py.
+
+    PYTHONPATH=src python benchmarks/bench_bq_jobs.py --latency 2,0.5,1 --rows 200000
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pipeline.bq_fetch import BQConfig, QueryCache, QueryJobs, run_query_cached
+from pipeline.runner import submit_queries
+
+
+class StubRows:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+    def to_dataframe(self, **kwargs) -> pd.DataFrame:
+        return self.df.copy()
+
+
+class StubJob:
+    def __init__(self, df: pd.DataFrame, latency: float):
+        self.df = df
+        self.done_at = time.monotonic() + latency
+
+    def result(self, **kwargs) -> StubRows:
+        time.sleep(max(0.0, self.done_at - time.monotonic()))
+        return StubRows(self.df)
+
+
+class StubClient:
+    """Answers "-- <name>" queries with that name's frame after its latency."""
+
+    def __init__(self, frames: dict[str, pd.DataFrame], latencies: dict[str, float]):
+        self.frames = frames
+        self.latencies = latencies
+
+    def query(self, sql: str) -> StubJob:
+        name = sql.split()[1]
+        return StubJob(self.frames[name], self.latencies[name])
+
+
+def make_result(rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    years = rng.integers(1990, 2024, size=rows)
+    serial = rng.integers(0, 1_000_000, size=rows)
+    return pd.DataFrame(
+        {
+            "publication_number": [f"WO-{y}{s:06d}-A1" for y, s in zip(years, serial)],
+            "filing_date": years * 10000 + 101,
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", default="2,0.5,1", help="Seconds per job, comma-separated; one query each.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows per query result.")
+    args = parser.parse_args()
+
+    latencies = {f"q{i}": float(value) for i, value in enumerate(args.latency.split(","))}
+    frames = {name: make_result(args.rows, seed) for seed, name in enumerate(latencies)}
+    cfg = BQConfig(project_id="bench")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        query_files = {}
+        for name in latencies:
+            query_files[name] = Path(tmp) / f"{name}.sql"
+            query_files[name].write_text(f"-- {name}\nSELECT publication_number, filing_date FROM t", encoding="utf-8")
+
+        client = StubClient(frames, latencies)
+        start = time.perf_counter()
+        sequential = {
+            name: run_query_cached(path, cfg, QueryCache(Path(tmp) / "seq"), client=client)[0]
+            for name, path in query_files.items()
+        }
+        sequential_seconds = time.perf_counter() - start
+
+        cache = QueryCache(Path(tmp) / "concurrent")
+        jobs = QueryJobs(cfg, client=StubClient(frames, latencies))
+        start = time.perf_counter()
+        arrivals = []
+        try:
+            for name in submit_queries(query_files, cfg, cache, jobs):
+                run_query_cached(query_files[name], cfg, cache, jobs=jobs)
+                arrivals.append((name, time.perf_counter() - start))
+        finally:
+            jobs.close()
+        concurrent_seconds = time.perf_counter() - start
+
+    print(f"{len(sequential)} queries; arrival order " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in arrivals))
+    print(f"sequential {sequential_seconds:6.2f}s (sum of latencies {sum(latencies.values()):.2f}s)")
+    print(f"concurrent {concurrent_seconds:6.2f}s (max latency {max(latencies.values()):.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Startup budget check for the pipeline CLI.
+
+Times `--help` and a `report` on a small generated counts CSV in fresh
+interpreters, fails when either exceeds its budget, and checks that neither
+imports modules it does not need (BigQuery for both, pandas and matplotlib
+for --help). With --importtime the slowest imports of each are listed.
+
+    PYTHONPATH=src python benchmarks/bench_startup.py --help-budget 0.5 --report-budget 4
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Runs the CLI in-process and reports which heavy modules it loaded.
+RUNNER = """
+import json, sys
+from pipeline.cli import app
+try:
+    app({args!r}, standalone_mode=False)
+finally:
+    print("LOADED " + json.dumps(sorted(m for m in {watched!r} if m in sys.modules)))
+"""
+WATCHED = ["google.cloud.bigquery", "matplotlib", "pandas", "pyarrow", "yaml"]
+NOT_ALLOWED = {
+    "--help": {"google.cloud.bigquery", "matplotlib", "pandas", "pyarrow"},
+    "report": {"google.cloud.bigquery"},
+}
+
+
+def make_counts_csv(path: Path, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    countries = ["US", "JP", "CN", "GB", "DE", "FR", "KR", "NL", "SE", "CH"]
+    years = np.arange(1985, 2024)
+    grid = pd.MultiIndex.from_product([countries, years], names=["inventor_country", "filing_year"]).to_frame(index=False)
+    grid["fractional_patents"] = rng.gamma(2.0, 50.0, size=len(grid))
+    grid.to_csv(path, index=False)
+
+
+def run_cli(args: list[str], env: dict, importtime: bool = False) -> tuple[float, list[str], str]:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", RUNNER.format(args=args, watched=WATCHED)]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"CLI {' '.join(args)} failed:\n{proc.stderr}")
+    loaded = json.loads(re.search(r"^LOADED (.*)$", proc.stdout, re.M).group(1))
+    return elapsed, loaded, proc.stderr
+
+
+def slowest_imports(importtime_log: str, n: int) -> list[tuple[int, str]]:
+    rows = []
+    for line in importtime_log.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match and match.group(2) == " ":
+            rows.append((int(match.group(1)), match.group(3)))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--help-budget", type=float, default=0.5, help="Seconds allowed for `--help`.")
+    parser.add_argument("--report-budget", type=float, default=4.0, help="Seconds allowed for `report`.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--importtime", action="store_true", help="List the slowest top-level imports.")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(Path(__file__).resolve().parents[1] / "src"), env.get("PYTHONPATH")]))
+    env.setdefault("MPLBACKEND", "Agg")
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        counts_csv = Path(tmp) / "counts.csv"
+        make_counts_csv(counts_csv)
+        cases = {
+            "--help": ["--help"],
+            "report": ["report", "--input-csv", str(counts_csv), "--out-dir", str(Path(tmp) / "reports")],
+        }
+        budgets = {"--help": args.help_budget, "report": args.report_budget}
+
+        for name, cli_args in cases.items():
+            best = float("inf")
+            for _ in range(args.repeat):
+                elapsed, loaded, _ = run_cli(cli_args, env)
+                best = min(best, elapsed)
+            status = "ok" if best <= budgets[name] else "OVER BUDGET"
+            print(f"{name:<8} {best:6.3f}s (budget {budgets[name]:.3f}s) {status}; loaded: {', '.join(loaded) or 'none'}")
+            if best > budgets[name]:
+                failures.append(f"{name} took {best:.3f}s, budget {budgets[name]:.3f}s")
+            unexpected = NOT_ALLOWED[name].intersection(loaded)
+            if unexpected:
+                failures.append(f"{name} imported {', '.join(sorted(unexpected))}")
+
+            if args.importtime:
+                _, _, log = run_cli(cli_args, env, importtime=True)
+                for micros, module in slowest_imports(log, 8):
+                    print(f"    {micros / 1000:8.1f} ms  {module}")
+
+    if failures:
+        raise SystemExit("startup budget failed: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
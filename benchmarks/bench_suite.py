@@ -0,0 +1,342 @@
+"""
+Stage benchmarks on synthetic data, written as JSON.
+
+Generates a BigQuery-shaped frame (publication_number, filing_date, category)
+whose publication numbers take every _fix_wo_century branch (WO-0.., WO-7/8/9..,
+four-digit years with 5 and 6 digit serials) plus some non-WO and missing
+values, and a RegPat file in which --match-ratio of the rows belong to those
+patents. For each size it times
+
+    transform   stata_like_pct_nbr on the BigQuery frame
+    scan        load_regpat_filtered with int64 keys
+    scan_full   the same scan parsing every line (no raw-byte pre-filter)
+    merge       attaching filing_date to the kept rows, as run does
+    counts      fractional_counts_by_inventor_country on the merged rows
+    fold        the scan with a CountFold (run's default, scan + counts)
+    report      write_report on the resulting counts
+
+and writes best/all timings per stage and size, with the package versions
+and git commit, so runs can be compared across releases. Nothing touches the
+network.
+
+    PYTHONPATH=src python benchmarks/bench_suite.py --sizes 100000,1000000 --out suite.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+matplotlib.use("Agg")
+
+from pipeline.analysis import CountFold, fractional_counts_by_inventor_country
+from pipeline.pct_codec import INVALID_KEY, encode_pct_nbr
+from pipeline.regpat import load_regpat_filtered, load_regpat_filtered_many
+from pipeline.reporting import write_report
+from pipeline.transform import stata_like_pct_nbr
+
+
+COUNTRIES = np.array(["US", "JP", "DE", "CN", "KR", "FR", "GB", "NL", "CH", "SE", "IT", "ES", "CA", "IN", "AT"])
+COUNTRY_WEIGHTS = np.array([24, 18, 10, 16, 8, 4, 4, 2, 2, 2, 2, 2, 2, 2, 2], dtype=float)
+FIRST_YEAR, LAST_YEAR = 1978, 2024
+# Serials of matching patents stay below this so every publication number
+# format can represent them; non-matching RegPat rows use larger ones.
+SHORT_SERIALS = 100_000
+STAGES = ["transform", "scan", "scan_full", "merge", "counts", "fold", "report"]
+
+
+def _choice(rng: np.random.Generator, values: np.ndarray, n: int, weights: np.ndarray | None = None) -> np.ndarray:
+    p = None if weights is None else weights / weights.sum()
+    return values[rng.choice(len(values), size=n, p=p)]
+
+
+def _inventors(rng: np.random.Generator, n_patents: int) -> np.ndarray:
+    """Inventors per patent, 1 to 5, averaging about 2.3."""
+    return rng.choice([1, 2, 3, 4, 5], size=n_patents, p=[0.3, 0.3, 0.2, 0.12, 0.08])
+
+
+def make_bq_frame(n_patents: int, seed: int, junk_ratio: float = 0.02) -> tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """
+    BigQuery-shaped frame for n_patents distinct WO patents plus junk rows.
+
+    Returns the frame and the year and serial of each patent, which fix its
+    pct_nbr (WO + year + 6-digit serial) whichever format it was written in.
+    """
+    rng = np.random.default_rng(seed)
+    n_years = LAST_YEAR - FIRST_YEAR + 1
+    slots = rng.choice(n_years * SHORT_SERIALS, size=n_patents, replace=False)
+    years = FIRST_YEAR + slots // SHORT_SERIALS
+    serials = slots % SHORT_SERIALS
+    kind = rng.integers(0, 4, size=n_patents)
+    # Two-digit years only exist for 1978-2009.
+    kind = np.where((kind < 2) & (years >= 2010), kind + 2, kind)
+
+    yy = (years % 100).astype(str)
+    yy = np.char.zfill(yy, 2)
+    serial5 = np.char.zfill(serials.astype(str), 5)
+    serial6 = np.char.zfill(serials.astype(str), 6)
+    year4 = years.astype(str)
+    suffix = np.array(["-A1", "-A2", "-A3"])[rng.integers(0, 3, size=n_patents)]
+    pub = np.select(
+        [kind < 2, kind == 2],
+        [
+            np.char.add(np.char.add("WO-", yy), serial5),  # WO-0.. (20xx) and WO-7/8/9.. (19xx)
+            np.char.add(np.char.add("WO-", year4), serial5),  # padded to a 6-digit serial
+        ],
+        default=np.char.add(np.char.add("WO-", year4), serial6),
+    )
+    pub = np.char.add(pub, suffix)
+
+    month = rng.integers(1, 13, size=n_patents)
+    day = rng.integers(1, 29, size=n_patents)
+    frame = pd.DataFrame(
+        {
+            "publication_number": pub.astype(object),
+            "filing_date": years * 10_000 + month * 100 + day,
+            "category": rng.integers(1, 14, size=n_patents),
+        }
+    )
+
+    n_junk = int(n_patents * junk_ratio)
+    junk = pd.DataFrame(
+        {
+            "publication_number": pd.Series(
+                np.where(
+                    rng.random(n_junk) < 0.5,
+                    np.char.add(np.char.add("US-", rng.integers(0, 10**9, size=n_junk).astype(str)), "-A1"),
+                    None,
+                ),
+                dtype=object,
+            ),
+            "filing_date": rng.integers(19780101, 20241231, size=n_junk),
+            "category": rng.integers(1, 14, size=n_junk),
+        }
+    )
+    frame = pd.concat([frame, junk], ignore_index=True).sample(frac=1.0, random_state=seed).reset_index(drop=True)
+    return frame, years, serials
+
+
+def write_regpat(
+    path: Path,
+    n_rows: int,
+    years: np.ndarray,
+    serials: np.ndarray,
+    match_ratio: float,
+    separator: str,
+    seed: int,
+) -> int:
+    """
+    Writes a RegPat-like inventor file of about n_rows rows; returns how many
+    of them belong to the given patents (and so should be matched).
+    """
+    rng = np.random.default_rng(seed + 1)
+    n_match_target = int(n_rows * match_ratio)
+    per_patent = _inventors(rng, len(years))
+    keep = np.cumsum(per_patent) <= n_match_target
+    match_years = np.repeat(years[keep], per_patent[keep])
+    match_serials = np.repeat(serials[keep], per_patent[keep])
+    match_share = np.repeat(1.0 / per_patent[keep], per_patent[keep])
+
+    n_other = max(n_rows - len(match_years), 0)
+    other_per = _inventors(rng, n_other)
+    other_per = other_per[np.cumsum(other_per) <= n_other]
+    other_years = np.repeat(rng.integers(FIRST_YEAR, LAST_YEAR + 1, size=len(other_per)), other_per)
+    other_serials = np.repeat(rng.integers(SHORT_SERIALS, 1_000_000, size=len(other_per)), other_per)
+    other_share = np.repeat(1.0 / other_per, other_per)
+
+    yrs = np.concatenate([match_years, other_years])
+    ser = np.concatenate([match_serials, other_serials])
+    n = len(yrs)
+    pct_nbr = np.char.add(np.char.add("WO", yrs.astype(str)), np.char.zfill(ser.astype(str), 6))
+    order = rng.permutation(n)
+    frame = pd.DataFrame(
+        {
+            "appln_id": np.arange(1, n + 1),
+            "pct_nbr": pct_nbr[order],
+            "inv_name": "INVENTOR",
+            "ctry_code": _choice(rng, COUNTRIES, n, COUNTRY_WEIGHTS),
+            "reg_code": "XX000",
+            "reg_share": 1.0,
+            "inv_share": np.concatenate([match_share, other_share])[order],
+        }
+    )
+    frame.to_csv(path, sep=separator, index=False)
+    return len(match_years)
+
+
+def timed(func, repeat: int):
+    """Runs func repeat times; returns its last result and every wall time."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def bench_size(n_rows: int, args: argparse.Namespace, work_dir: Path) -> list[dict]:
+    # About 2.3 inventors per patent, so enough patents for the wanted matches.
+    n_patents = max(int(n_rows * args.match_ratio / 2.3 * 1.2), 10)
+    bq, years, serials = make_bq_frame(n_patents, args.seed)
+    regpat_file = work_dir / f"regpat_{n_rows}.txt"
+    expected = write_regpat(regpat_file, n_rows, years, serials, args.match_ratio, args.separator, args.seed)
+    n_regpat = sum(1 for _ in open(regpat_file, "rb")) - 1
+    sizes = {"bq_rows": len(bq), "regpat_rows": n_regpat, "regpat_bytes": regpat_file.stat().st_size}
+
+    results = []
+
+    def record(stage: str, times: list[float], rows: int, **extra) -> None:
+        best = min(times)
+        results.append(
+            {
+                "stage": stage,
+                "size": n_rows,
+                "rows": rows,
+                "best_seconds": best,
+                "seconds": times,
+                "rows_per_sec": rows / best if best else None,
+                **sizes,
+                **extra,
+            }
+        )
+        print(f"  {stage:<10} {best:9.3f}s  {rows / best if best else 0:>14,.0f} rows/sec")
+
+    pct_df, times = timed(lambda: stata_like_pct_nbr(bq, extra_columns=["filing_date"]), args.repeat)
+    n_wo = int(pct_df["pct_nbr"].str.startswith("WO").sum())
+    assert n_wo == n_patents, f"transform kept {n_wo:,} of {n_patents:,} WO patents"
+    record("transform", times, len(bq))
+
+    pct_keys = encode_pct_nbr(pct_df["pct_nbr"])
+    scan = lambda: load_regpat_filtered(
+        regpat_file, pct_keys, chunksize=args.chunksize, separator=args.separator, workers=args.workers, keys=True
+    )
+    regpat_filtered, times = timed(scan, args.repeat)
+    assert len(regpat_filtered) == expected, f"scan kept {len(regpat_filtered):,} rows, expected {expected:,}"
+    record("scan", times, n_regpat, matched_rows=expected, workers=args.workers)
+
+    scan_full = lambda: load_regpat_filtered_many(
+        regpat_file,
+        {"_": pct_keys},
+        chunksize=args.chunksize,
+        separator=args.separator,
+        workers=args.workers,
+        keys=True,
+        prefilter=False,
+    )["_"]
+    full, times = timed(scan_full, args.repeat)
+    pd.testing.assert_frame_equal(full, regpat_filtered, check_exact=True)
+    record("scan_full", times, n_regpat, matched_rows=expected, workers=args.workers)
+
+    lookup = pct_df[["filing_date"]].assign(pct_key=pct_keys)
+    lookup = lookup[lookup["pct_key"] != INVALID_KEY]
+    merged, times = timed(lambda: regpat_filtered.merge(lookup, on="pct_key", how="left"), args.repeat)
+    record("merge", times, len(regpat_filtered))
+
+    counts, times = timed(lambda: fractional_counts_by_inventor_country(merged), args.repeat)
+    record("counts", times, len(merged))
+
+    def fold_scan() -> pd.DataFrame:
+        fold = CountFold(pct_keys, pct_df["filing_date"])
+        load_regpat_filtered_many(
+            regpat_file,
+            {"fold": pct_keys},
+            chunksize=args.chunksize,
+            separator=args.separator,
+            workers=args.workers,
+            keys=True,
+            folds={"fold": fold},
+        )
+        return fold.result()[0]
+
+    folded, times = timed(fold_scan, args.repeat)
+    by = ["filing_year", "inventor_country"]
+    pd.testing.assert_frame_equal(
+        folded.sort_values(by).reset_index(drop=True), counts.sort_values(by).reset_index(drop=True), check_exact=False
+    )
+    record("fold", times, n_regpat, workers=args.workers)
+
+    report_dir = work_dir / f"report_{n_rows}"
+    report_dir.mkdir(exist_ok=True)
+    cfg = {"plot_start_year": 1980, "plot_end_year": None}
+    _, times = timed(lambda: write_report(counts, report_dir, args.recent_start, cfg), args.repeat)
+    record("report", times, len(counts))
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated RegPat row counts.")
+    parser.add_argument("--match-ratio", type=float, default=0.3, help="Share of RegPat rows that match the pct list.")
+    parser.add_argument("--separator", default="|", help="RegPat field separator.")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=1, help="Workers for the RegPat scans.")
+    parser.add_argument("--recent-start", type=int, default=2015)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--out", type=Path, default=None, help="JSON file (default benchmarks/results/suite_<utc>.json).")
+    parser.add_argument("--keep-files", type=Path, default=None, help="Generate the data here and keep it.")
+    args = parser.parse_args()
+    if not 0 < args.match_ratio <= 1:
+        parser.error("--match-ratio must be in (0, 1].")
+
+    started = datetime.now(timezone.utc)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.keep_files or Path(tmp)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        for n_rows in sizes:
+            print(f"{n_rows:,} RegPat rows:")
+            results.extend(bench_size(n_rows, args, work_dir))
+
+    report = {
+        "suite": "bench_suite",
+        "created_utc": started.isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": {"numpy": np.__version__, "pandas": pd.__version__, "pyarrow": pa.__version__, "matplotlib": matplotlib.__version__},
+        "params": {
+            "sizes": sizes,
+            "match_ratio": args.match_ratio,
+            "separator": args.separator,
+            "chunksize": args.chunksize,
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "stages": STAGES,
+        "results": results,
+    }
+    out = args.out or Path(__file__).resolve().parent / "results" / f"suite_{started:%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
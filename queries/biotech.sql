@@ -3,6 +3,7 @@ SELECT
   application_number,
   pct_number,
   filing_date,
+  publication_date,
   -- This flattens the array into a single string for the CSV row
   inv_country AS inventor_country,
   
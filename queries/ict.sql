@@ -2,6 +2,7 @@ WITH categorized_patents AS (
   SELECT
     publication_number,
     filing_date,
+    publication_date,
     -- Scalar subquery to find the primary group for each patent
     (
       SELECT MIN(tech_group)
@@ -65,6 +66,7 @@ WITH categorized_patents AS (
 SELECT
   publication_number,
   filing_date,
+  publication_date,
   ict_category
 FROM
   categorized_patents
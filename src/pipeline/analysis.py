@@ -1,36 +1,234 @@
 from __future__ import annotations
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .pct_codec import INVALID_KEY
+
+
+_OUTPUT_COLUMNS = {
+    "ctry_code": "inventor_country",
+    "inv_share": "fractional_patents",
+    "year": "filing_year",
+}
+_POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+# Floats from here on print in exponent notation, so have no leading year.
+_MAX_PLAIN_FLOAT = 1e16
+
+
+def _leading_digits(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """First four decimal digits of non-negative integers with at least four digits."""
+    digits = np.searchsorted(_POWERS_OF_TEN, values, side="right")
+    valid = digits >= 4
+    scale = _POWERS_OF_TEN[np.where(valid, digits - 4, 0)]
+    return np.where(valid, values // scale, 0), valid
+
+
+def _year_from_arrow(values: pa.Array | pa.ChunkedArray) -> tuple[np.ndarray, np.ndarray]:
+    present = values.is_valid().to_numpy(zero_copy_only=False)
+    kind = values.type
+    if pa.types.is_integer(kind):
+        ints = pc.fill_null(values, 0).cast(pa.int64()).to_numpy(zero_copy_only=False)
+        year, valid = _leading_digits(ints)
+    elif pa.types.is_floating(kind):
+        floats = pc.fill_null(values, 0.0).to_numpy(zero_copy_only=False)
+        plain = np.isfinite(floats) & (floats < _MAX_PLAIN_FLOAT)
+        year, valid = _leading_digits(np.floor(np.where(plain, floats, 0)).astype(np.int64))
+        valid &= plain
+    elif pa.types.is_timestamp(kind) or pa.types.is_date(kind):
+        year = pc.fill_null(pc.year(values), 0).to_numpy(zero_copy_only=False)
+        valid = (year >= 1000) & (year <= 9999)
+    else:
+        text = values if pa.types.is_string(kind) or pa.types.is_large_string(kind) else values.cast(pa.string())
+        head = pc.utf8_slice_codeunits(text, 0, 4)
+        valid = pc.fill_null(pc.and_(pc.ascii_is_decimal(head), pc.equal(pc.utf8_length(head), 4)), False)
+        valid = valid.to_numpy(zero_copy_only=False)
+        year = pc.cast(pc.if_else(valid, head, "0"), pa.int64()).to_numpy(zero_copy_only=False)
+    return year.astype(np.int64, copy=False), valid & present
+
+
+def _year(values: pd.Series | pa.Array | pa.ChunkedArray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Filing year as int64 plus a validity mask, without formatting values as
+    text. The year is what the first four characters of the printed value
+    would give: YYYYMMDD integers, dates and 'YYYY...' strings all work.
+    """
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return _year_from_arrow(values)
+    try:
+        arrow_values = pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed object columns: fall back to their printed form.
+        arrow_values = pa.array(values.astype(str).where(values.notna()), from_pandas=True)
+    return _year_from_arrow(arrow_values)
+
+
+def filing_year(filing_date: pd.Series) -> pd.Series:
+    """Filing year of each value (nullable Int64, <NA> when there is none)."""
+    year, valid = _year(filing_date)
+    return pd.Series(pd.arrays.IntegerArray(year, ~valid), index=filing_date.index)
+
+
+def _countable(
+    data: pd.DataFrame | pa.Table,
+    filing_date_column: str,
+    extra_cols: list[str],
+) -> pd.DataFrame:
+    """
+    Rows that can be counted, as a compact frame of extra_cols, ctry_code,
+    inv_share and an integer year. Only those columns of the kept rows are
+    materialized; the input is never copied as a whole.
+    """
+    year, keep = _year(data[filing_date_column] if isinstance(data, pd.DataFrame) else data.column(filing_date_column))
+
+    if isinstance(data, pd.DataFrame):
+        share = data["inv_share"].to_numpy(dtype="float64", na_value=np.nan)
+        keep &= data["ctry_code"].notna().to_numpy() & (share > 0)
+        columns = {col: data[col].array[keep] for col in [*extra_cols, "ctry_code"]}
+        columns["inv_share"] = share[keep]
+    else:
+        share = pc.fill_null(data.column("inv_share").cast(pa.float64()), np.nan).to_numpy(zero_copy_only=False)
+        keep &= data.column("ctry_code").is_valid().to_numpy(zero_copy_only=False) & (share > 0)
+        kept = data.select([*extra_cols, "ctry_code"]).filter(pa.array(keep)).to_pandas()
+        columns = {col: kept[col].array for col in extra_cols}
+        columns["ctry_code"] = kept["ctry_code"].astype("string").array
+        columns["inv_share"] = share[keep]
+    columns["year"] = year[keep]
+    return pd.DataFrame(columns, copy=False)
+
+
+def _format_counts(grouped: pd.DataFrame, leading_cols: list[str]) -> pd.DataFrame:
+    out = (
+        grouped.rename(columns=_OUTPUT_COLUMNS)
+        .sort_values([*leading_cols, "filing_year", "fractional_patents"], ascending=[True] * (len(leading_cols) + 1) + [False])
+        .reset_index(drop=True)
+    )
+    out["filing_year"] = out["filing_year"].astype(int)
+    return out
 
 
 def fractional_counts_by_inventor_country(
-    regpat_filtered: pd.DataFrame,
+    regpat_filtered: pd.DataFrame | pa.Table,
     filing_date_column: str = "filing_date",
 ) -> pd.DataFrame:
     """
     Fractional patent counts by inventor country *and year*.
 
-    filing_date_column must contain integers or strings shaped YYYYMMDD.
+    regpat_filtered may be a DataFrame or an Arrow table. filing_date_column
+    may hold YYYYMMDD integers, dates or strings starting with the year.
     """
-    df = regpat_filtered.copy()
-    df = df.dropna(subset=["ctry_code", "inv_share", filing_date_column])
-    df = df[df["inv_share"] > 0]
+    df = _countable(regpat_filtered, filing_date_column, [])
+    grouped = df.groupby(["ctry_code", "year"], as_index=False)["inv_share"].sum()
+    return _format_counts(grouped, [])
 
-    df["year"] = df[filing_date_column].astype(str).str.slice(0, 4)
-    df = df[df["year"].str.fullmatch(r"\d{4}")]
 
-    out = (
-        df.groupby(["ctry_code", "year"], as_index=False)["inv_share"]
-        .sum()
-        .rename(
-            columns={
-                "ctry_code": "inventor_country",
-                "inv_share": "fractional_patents",
-                "year": "filing_year",
+def fractional_counts_by_category(
+    regpat_filtered: pd.DataFrame | pa.Table,
+    category_column: str,
+    filing_date_column: str = "filing_date",
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Overall and per-category fractional counts from a single groupby over
+    (category, country, year).
+
+    Returns (overall, by_category). by_category is one long table with
+    category_column in front of the usual columns. Rows without a category
+    count towards the overall table only. The overall table is summed from
+    the per-group totals.
+    """
+    df = _countable(regpat_filtered, filing_date_column, [category_column])
+    grouped = df.groupby([category_column, "ctry_code", "year"], as_index=False, dropna=False, observed=True)[
+        "inv_share"
+    ].sum()
+
+    overall = grouped.groupby(["ctry_code", "year"], as_index=False)["inv_share"].sum()
+    by_category = grouped.dropna(subset=[category_column])
+    return _format_counts(overall, []), _format_counts(by_category, [category_column])
+
+
+class CountFold:
+    """
+    Fractional counts accumulated chunk by chunk while RegPat is scanned.
+
+    Built from the pct list: each matched RegPat row finds its filing year
+    (and category) by pct_key in a sorted index, so no row-level frame is
+    merged or kept. partial() reduces a chunk of matched rows to
+    (category, country, year) sums; extend() collects them, also when they
+    come back from worker processes; result() returns the same tables as
+    fractional_counts_by_inventor_country / fractional_counts_by_category.
+    Sums are formed per chunk first, so they can differ from those
+    functions in the last bits.
+    """
+
+    def __init__(self, pct_keys: np.ndarray, filing_date: pd.Series, categories: pd.Series | None = None):
+        pct_keys = np.asarray(pct_keys, dtype=np.int64)
+        year, valid = _year(filing_date)
+        valid &= pct_keys != INVALID_KEY
+        order = np.argsort(pct_keys[valid], kind="stable")
+        self._keys = pct_keys[valid][order]
+        self._years = year[valid][order]
+        self._codes = None
+        self.category_column = None
+        if categories is not None:
+            codes, self._category_values = pd.factorize(categories, sort=True)
+            self._codes = codes[valid][order]
+            self.category_column = categories.name
+        self._partials: list[pd.DataFrame] = []
+        self.n_rows = 0
+
+    def partial(self, chunk: pd.DataFrame) -> tuple[int, pd.DataFrame]:
+        """(matched rows, their sums by category code, ctry_code and year) for a chunk with pct_key, ctry_code, inv_share."""
+        keys = chunk["pct_key"].to_numpy()
+        pos = np.minimum(np.searchsorted(self._keys, keys), max(len(self._keys) - 1, 0))
+        hit = self._keys[pos] == keys if len(self._keys) else np.zeros(len(keys), dtype=bool)
+        share = chunk["inv_share"].to_numpy(dtype="float64", na_value=np.nan)
+        keep = hit & chunk["ctry_code"].notna().to_numpy() & (share > 0)
+
+        columns = {
+            "category": self._codes[pos[keep]] if self._codes is not None else np.zeros(int(keep.sum()), dtype=np.int64),
+            "ctry_code": chunk["ctry_code"].array[keep],
+            "year": self._years[pos[keep]],
+            "inv_share": share[keep],
+        }
+        grouped = pd.DataFrame(columns).groupby(["category", "ctry_code", "year"], as_index=False, sort=False)["inv_share"].sum()
+        return int(hit.sum()), grouped
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        self.extend([self.partial(chunk)])
+
+    def extend(self, partials) -> None:
+        for n_rows, grouped in partials:
+            self.n_rows += n_rows
+            if not grouped.empty:
+                self._partials.append(grouped)
+
+    def result(self) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+        """(overall, by_category); by_category is None without categories."""
+        if self._partials:
+            sums = pd.concat(self._partials, ignore_index=True)
+        else:
+            sums = pd.DataFrame(
+                {
+                    "category": pd.Series(dtype="int64"),
+                    "ctry_code": pd.Series(dtype="string"),
+                    "year": pd.Series(dtype="int64"),
+                    "inv_share": pd.Series(dtype="float64"),
+                }
+            )
+        grouped = sums.groupby(["category", "ctry_code", "year"], as_index=False)["inv_share"].sum()
+        overall = grouped.groupby(["ctry_code", "year"], as_index=False)["inv_share"].sum()
+        if self._codes is None:
+            return _format_counts(overall, []), None
+
+        by_category = grouped[grouped["category"] >= 0]
+        by_category = pd.DataFrame(
+            {
+                self.category_column: self._category_values.take(by_category["category"].to_numpy()),
+                "ctry_code": by_category["ctry_code"].array,
+                "year": by_category["year"].to_numpy(),
+                "inv_share": by_category["inv_share"].to_numpy(),
             }
         )
-        .sort_values(["filing_year", "fractional_patents"], ascending=[True, False])
-        .reset_index(drop=True)
-    )
-    out["filing_year"] = out["filing_year"].astype(int)
-    return out
+        return _format_counts(overall, []), _format_counts(by_category, [self.category_column])
@@ -1,9 +1,18 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterator
 import pandas as pd
-from google.cloud import bigquery
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
 @dataclass(frozen=True)
@@ -12,14 +21,446 @@ class BQConfig:
     location: str = "US"
 
 
-def run_query_from_file(query_file: Path, cfg: BQConfig) -> pd.DataFrame:
-    query = query_file.read_text(encoding="utf-8")
-    client = bigquery.Client(project=cfg.project_id, location=cfg.location)
+@dataclass(frozen=True)
+class QueryCache:
+    """Where and how query results are cached; see run_query_cached."""
+
+    cache_dir: Path
+    ttl_seconds: float | None = None
+    refresh: bool = False
+    offline: bool = False
+
+
+class QueryCacheMiss(LookupError):
+    """Raised in offline mode when no usable cached result exists."""
+
+
+# Optional marker a query can use to place the incremental date filter itself.
+WATERMARK_PLACEHOLDER = "{watermark_predicate}"
+
+
+def render_query(query: str, watermark_column: str | None = None, watermark=None) -> str:
+    """
+    Fills in the watermark filter of an incremental fetch.
+
+    Queries containing {watermark_predicate} get "<column> >= <watermark>" in
+    its place (or TRUE for a full fetch). Other queries are wrapped as
+    SELECT * FROM (<query>) WHERE <column> >= <watermark>, which requires the
+    column to be part of the result. The bound is inclusive because rows can
+    still arrive with the watermark's own value (a date column); the rows
+    fetched again replace their cached copies.
+    """
+    if watermark_column is None:
+        return query.replace(WATERMARK_PLACEHOLDER, "TRUE")
+    predicate = f"{watermark_column} >= {_sql_literal(watermark)}"
+    if WATERMARK_PLACEHOLDER in query:
+        return query.replace(WATERMARK_PLACEHOLDER, predicate)
+    body = query.rstrip().rstrip(";")
+    return f"SELECT * FROM (\n{body}\n) WHERE {predicate}"
+
+
+def _sql_literal(value) -> str:
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "\\'") + "'"
+
+
+class QueryJobs:
+    """
+    BigQuery jobs of several pipelines, sent through one shared client and
+    awaited on a thread pool. submit() starts a job and returns at once, so
+    the queries run on BigQuery at the same time; frame() and job() then hand
+    over a job's result (downloaded in the background) or the job itself.
+    Jobs are keyed by their SQL, so frames are shared and must not be changed.
+    client defaults to a bigquery.Client, created on first use; pass any
+    object with a query(sql) method returning a job (e.g. a stub) instead.
+    """
+
+    def __init__(self, cfg: BQConfig, client=None, max_workers: int = 8):
+        self.cfg = cfg
+        self._client = client
+        self._lock = threading.Lock()
+        self._futures: dict[str, Future] = {}
+        self._jobs: dict[str, object] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bq-job")
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = _bigquery_client(self.cfg)
+            return self._client
+
+    def submit(self, query: str, download: bool = True) -> Future:
+        """
+        Starts query unless it already runs. The future completes once the
+        job is done, with its frame if download is set (else None; the rows
+        are then paged from job()).
+        """
+        with self._lock:
+            if query in self._futures:
+                return self._futures[query]
+        job = self.client.query(query)
+        future = self._executor.submit(_job_frame if download else _job_done, job)
+        with self._lock:
+            self._jobs[query] = job
+            self._futures[query] = future
+        return future
+
+    def frame(self, query: str) -> pd.DataFrame:
+        future = self.submit(query)
+        df = future.result()
+        if df is None:  # submitted without download
+            df = _job_frame(self._jobs[query])
+        return df
+
+    def job(self, query: str):
+        self.submit(query, download=False).result()
+        return self._jobs[query]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
 
-    job = client.query(query)
+def run_query_from_file(
+    query_file: Path,
+    cfg: BQConfig,
+    client=None,
+    watermark: tuple[str, object] | None = None,
+    jobs: QueryJobs | None = None,
+) -> pd.DataFrame:
+    query = render_query(query_file.read_text(encoding="utf-8"), *(watermark or (None, None)))
+    if jobs is not None:
+        return jobs.frame(query)
+    if client is None:
+        client = _bigquery_client(cfg)
+    return _job_frame(client.query(query))
+
+
+def _job_frame(job) -> pd.DataFrame:
     df = job.result().to_dataframe(create_bqstorage_client=True)
 
     if "publication_number" not in df.columns:
         raise ValueError("Your BigQuery result must include a 'publication_number' column.")
 
     return df
+
+
+def _job_done(job) -> None:
+    job.result()
+
+
+def iter_query_batches(
+    query_file: Path,
+    cfg: BQConfig,
+    client=None,
+    batch_rows: int = 500_000,
+    jobs: QueryJobs | None = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Runs the query and yields its result as Arrow record batches of at most
+    batch_rows rows. page_size only sizes REST pages; the BigQuery Storage
+    API sends batches of its own size, which are cut into zero-copy slices.
+    """
+    query = render_query(query_file.read_text(encoding="utf-8"))
+    if jobs is not None:
+        job = jobs.job(query)
+    else:
+        job = (client or _bigquery_client(cfg)).query(query)
+
+    rows = job.result(page_size=batch_rows)
+    checked = False
+    for batch in rows.to_arrow_iterable(bqstorage_client=_bqstorage_client()):
+        if not checked:
+            if "publication_number" not in batch.schema.names:
+                raise ValueError("Your BigQuery result must include a 'publication_number' column.")
+            checked = True
+        if batch.num_rows <= batch_rows:
+            yield batch
+            continue
+        for start in range(0, batch.num_rows, batch_rows):
+            yield batch.slice(start, batch_rows)
+
+
+def _bigquery_client(cfg: BQConfig):
+    # Imported here: the client library is slow to import and only needed on a cache miss.
+    from google.cloud import bigquery
+
+    return bigquery.Client(project=cfg.project_id, location=cfg.location)
+
+
+def _bqstorage_client():
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        return None
+    return bigquery_storage.BigQueryReadClient()
+
+
+def normalize_sql(query: str) -> str:
+    """Collapses whitespace so formatting-only edits keep the same cache key."""
+    return " ".join(query.split())
+
+
+def query_cache_key(query: str, cfg: BQConfig) -> str:
+    payload = json.dumps(
+        {"sql": normalize_sql(query), "project_id": cfg.project_id, "location": cfg.location},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def run_query_cached(
+    query_file: Path,
+    cfg: BQConfig,
+    cache: QueryCache,
+    client=None,
+    jobs: QueryJobs | None = None,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    run_query_from_file behind a content-addressed cache.
+
+    Results are stored as <key>.parquet in cache.cache_dir, where the key
+    hashes the normalized SQL, project and location. A stored result is reused
+    unless it is older than cache.ttl_seconds or cache.refresh is set; with
+    cache.offline a miss raises QueryCacheMiss instead of querying. client and
+    jobs are passed through to run_query_from_file, so a stub can stand in
+    for BigQuery and a job submitted ahead (see submit_query_cached) is used.
+
+    Returns the frame and a dict describing the cache entry (hit, key, path).
+    """
+    key, data_path, meta_path, entry, fresh = _lookup(query_file, cfg, cache)
+
+    if fresh and not cache.refresh:
+        return pd.read_parquet(data_path), _info(entry, key, data_path, hit=True)
+
+    _check_online(query_file, cache, entry, key)
+
+    df = run_query_from_file(Path(query_file), cfg, client=client, jobs=jobs)
+
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = data_path.with_suffix(".parquet.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, data_path)
+    entry = _write_entry(meta_path, query_file, cfg, n_rows=len(df))
+    return df, _info(entry, key, data_path, hit=False)
+
+
+def peek_query_cache(query_file: Path, cfg: BQConfig, cache: QueryCache) -> dict | None:
+    """The cache description run_query_cached would return on a hit, without loading the data."""
+    key, data_path, _, entry, fresh = _lookup(query_file, cfg, cache)
+    if not fresh or cache.refresh:
+        return None
+    return _info(entry, key, data_path, hit=True)
+
+
+def submit_query_cached(
+    query_file: Path,
+    cfg: BQConfig,
+    cache: QueryCache,
+    jobs: QueryJobs,
+    watermark_column: str | None = None,
+    download: bool = True,
+) -> Future | None:
+    """
+    Submits to jobs the query that run_query_cached (or, with
+    watermark_column, run_query_incremental) would run for query_file, and
+    returns its future; None when the cache answers and nothing is sent.
+    """
+    _, _, _, entry, fresh = _lookup(query_file, cfg, cache)
+    if cache.offline:
+        return None
+    if watermark_column is None:
+        if fresh and not cache.refresh:
+            return None
+        watermark = None
+    else:
+        watermark = _incremental_watermark(entry, cache, watermark_column)
+    query = render_query(Path(query_file).read_text(encoding="utf-8"), *(watermark or (None, None)))
+    return jobs.submit(query, download=download)
+
+
+def run_query_incremental(
+    query_file: Path,
+    cfg: BQConfig,
+    cache: QueryCache,
+    watermark_column: str = "publication_date",
+    client=None,
+    jobs: QueryJobs | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame | None, dict]:
+    """
+    Refreshes a cached query result with only the rows past its watermark.
+
+    The cache entry records the highest watermark_column value it holds. When
+    one exists, the query is run with "watermark_column >= watermark" (see
+    render_query) and the new rows replace any cached rows with the same
+    publication_number. Without one, or with cache.refresh, the full result is
+    fetched. In offline mode the cached result is returned as is.
+
+    Returns the merged frame, the newly fetched rows (None after a full fetch
+    or an offline hit) and the cache description.
+    """
+    key, data_path, meta_path, entry, _ = _lookup(query_file, cfg, cache)
+
+    if cache.offline:
+        if entry is None or entry.get("watermark_column") != watermark_column:
+            _check_online(query_file, cache, entry, key)
+        return pd.read_parquet(data_path), None, _info(entry, key, data_path, hit=True)
+
+    watermark = _incremental_watermark(entry, cache, watermark_column)
+    if watermark is not None:
+        previous = pd.read_parquet(data_path)
+        new_rows = run_query_from_file(Path(query_file), cfg, client=client, watermark=watermark, jobs=jobs)
+        replaced = previous["publication_number"].isin(new_rows["publication_number"])
+        df = pd.concat([previous[~replaced], new_rows], ignore_index=True)
+    else:
+        new_rows = None
+        df = run_query_from_file(Path(query_file), cfg, client=client, jobs=jobs)
+
+    if watermark_column not in df.columns:
+        raise ValueError(f"Incremental fetch needs a '{watermark_column}' column in the query result.")
+
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = data_path.with_suffix(".parquet.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, data_path)
+    entry = _write_entry(
+        meta_path,
+        query_file,
+        cfg,
+        n_rows=len(df),
+        watermark_column=watermark_column,
+        watermark=_json_scalar(df[watermark_column].max()) if len(df) else None,
+    )
+    info = _info(entry, key, data_path, hit=False)
+    info["n_new_rows"] = int(len(new_rows)) if new_rows is not None else None
+    return df, new_rows, info
+
+
+def _incremental_watermark(entry: dict | None, cache: QueryCache, watermark_column: str) -> tuple[str, object] | None:
+    """(column, value) to fetch past, or None when the full result has to be fetched."""
+    usable = entry is not None and entry.get("watermark_column") == watermark_column
+    if usable and not cache.refresh and entry.get("watermark") is not None:
+        return watermark_column, entry["watermark"]
+    return None
+
+
+def stream_query_cached(
+    query_file: Path,
+    cfg: BQConfig,
+    cache: QueryCache,
+    client=None,
+    batch_rows: int = 500_000,
+    jobs: QueryJobs | None = None,
+) -> tuple[Iterator[pa.RecordBatch], dict]:
+    """
+    Streaming form of run_query_cached: returns an iterator of Arrow record
+    batches instead of one DataFrame, so only one batch is in memory at a time.
+
+    On a hit the batches are read from the cached Parquet file. On a miss they
+    come from BigQuery and are appended to the cache file as they pass; the
+    entry is committed once the iterator is exhausted. The returned dict is
+    the same cache description as run_query_cached and is completed (n_rows,
+    created_utc) at that point too.
+    """
+    key, data_path, meta_path, entry, fresh = _lookup(query_file, cfg, cache)
+
+    if fresh and not cache.refresh:
+        batches = pq.ParquetFile(data_path).iter_batches(batch_size=batch_rows)
+        return batches, _info(entry, key, data_path, hit=True)
+
+    _check_online(query_file, cache, entry, key)
+
+    info = {"hit": False, "key": key, "path": str(data_path)}
+    batches = _store_batches(
+        iter_query_batches(Path(query_file), cfg, client=client, batch_rows=batch_rows, jobs=jobs),
+        query_file,
+        cfg,
+        data_path,
+        meta_path,
+        info,
+    )
+    return batches, info
+
+
+def _store_batches(
+    batches: Iterator[pa.RecordBatch],
+    query_file: Path,
+    cfg: BQConfig,
+    data_path: Path,
+    meta_path: Path,
+    info: dict,
+) -> Iterator[pa.RecordBatch]:
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = data_path.with_suffix(".parquet.tmp")
+    writer = None
+    n_rows = 0
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema)
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+            yield batch
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        pq.write_table(pa.table({"publication_number": pa.array([], type=pa.string())}), tmp_path)
+    os.replace(tmp_path, data_path)
+    info.update(_write_entry(meta_path, query_file, cfg, n_rows=n_rows))
+
+
+def _lookup(query_file: Path, cfg: BQConfig, cache: QueryCache) -> tuple[str, Path, Path, dict | None, bool]:
+    cache_dir = Path(cache.cache_dir)
+    key = query_cache_key(Path(query_file).read_text(encoding="utf-8"), cfg)
+    data_path = cache_dir / f"{key}.parquet"
+    meta_path = cache_dir / f"{key}.json"
+
+    entry = _read_entry(meta_path) if data_path.exists() else None
+    fresh = entry is not None and (
+        cache.ttl_seconds is None or time.time() - entry["created_ts"] <= cache.ttl_seconds
+    )
+    return key, data_path, meta_path, entry, fresh
+
+
+def _check_online(query_file: Path, cache: QueryCache, entry: dict | None, key: str) -> None:
+    if cache.offline:
+        reason = "expired" if entry is not None else "missing"
+        raise QueryCacheMiss(f"Cached result for {query_file} is {reason} and offline mode is on (key {key[:12]}).")
+
+
+def _info(entry: dict, key: str, data_path: Path, hit: bool) -> dict:
+    return {**entry, "hit": hit, "key": key, "path": str(data_path)}
+
+
+def _write_entry(meta_path: Path, query_file: Path, cfg: BQConfig, n_rows: int, **extra) -> dict:
+    entry = {
+        "created_utc": datetime.now(timezone.utc).isoformat(),
+        "created_ts": time.time(),
+        "query_file": str(query_file),
+        "project_id": cfg.project_id,
+        "location": cfg.location,
+        "n_rows": int(n_rows),
+        **extra,
+    }
+    meta_path.write_text(json.dumps(entry, indent=2), encoding="utf-8")
+    return entry
+
+
+def _json_scalar(value):
+    if pd.isna(value):
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _read_entry(meta_path: Path) -> dict | None:
+    try:
+        return json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
@@ -1,35 +1,22 @@
 from __future__ import annotations
 
-import json
 import os
+import re
+import time
 from pathlib import Path
-from datetime import datetime, timezone
+from typing import TYPE_CHECKING
 
-import pandas as pd
 import typer
 from rich import print
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
-import yaml
 
-from .bq_fetch import BQConfig, run_query_from_file
-from .transform import stata_like_pct_nbr
-from .regpat import load_regpat_filtered
-from .analysis import fractional_counts_by_inventor_country
+# Commands import the pipeline modules (and through them pandas, pyarrow,
+# BigQuery and matplotlib) only when they run, so --help and the light
+# commands start quickly.
+if TYPE_CHECKING:
+    import pandas as pd
 
-
-EU27_CODES = [
-    "AT", "BE", "BG", "HR", "CY", "CZ", "DK", "EE", "FI", "FR", "DE",
-    "GR", "HU", "IE", "IT", "LV", "LT", "LU", "MT", "NL", "PL", "PT",
-    "RO", "SK", "SI", "ES", "SE",
-]
-GROUP_DEFINITIONS = [
-    ("US", ["US"]),
-    ("JP", ["JP"]),
-    ("CN", ["CN"]),
-    ("UK", ["UK", "GB"]),
-    ("EU27", EU27_CODES),
-]
+    from .bq_fetch import QueryCache
 
 
 app = typer.Typer(add_completion=False)
@@ -38,15 +25,54 @@ app = typer.Typer(add_completion=False)
 @app.command()
 def run(
     query_file: Path = typer.Option(..., exists=True, help="Path to BigQuery SQL file."),
-    regpat_file: Path = typer.Option(..., exists=True, help="Path to OECD regpat.txt"),
+    regpat_file: Path = typer.Option(..., exists=True, help="OECD regpat.txt (may be .gz, .bz2 or .zst) or a store built by ingest-regpat."),
     out_dir: Path = typer.Option(Path("data/output"), help="Output directory."),
     cache_dir: Path = typer.Option(Path("data/processed"), help="Cache directory."),
     chunksize: int = typer.Option(1_000_000, help="Chunk size for regpat reading."),
     regpat_sep: str = typer.Option("\t", help="Column separator for regpat file (default tab)."),
+    workers: int = typer.Option(1, min=1, help="Processes used to parse the RegPat text file."),
     category_column: str | None = typer.Option(
         None,
         help="Optional column in the BigQuery result used to split counts by category.",
     ),
+    bq_cache_dir: Path = typer.Option(Path("data/processed/bq_cache"), help="Folder for cached BigQuery results."),
+    cache_ttl_hours: float | None = typer.Option(None, help="Re-run queries whose cached result is older than this."),
+    refresh: bool = typer.Option(False, "--refresh", help="Ignore cached BigQuery results and re-run the queries."),
+    offline: bool = typer.Option(False, "--offline", help="Only use cached BigQuery results, never query."),
+    stream_bq_rows: int | None = typer.Option(
+        None,
+        min=1,
+        help="Stream the BigQuery result in batches of this many rows instead of loading it whole.",
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help="Only fetch rows from the cached result's watermark on and recompute their filing years.",
+    ),
+    watermark_column: str = typer.Option("publication_date", help="Result column used as the incremental watermark."),
+    category_output: str = typer.Option(
+        "csv",
+        help="Per-category counts as one CSV per category ('csv') or one Parquet dataset partitioned by category ('parquet').",
+    ),
+    output_format: str = typer.Option(
+        "csv",
+        help="Format of the pct list, counts (and per-category files) and match diagnostics: csv, parquet or feather.",
+    ),
+    keep_regpat_filtered: bool = typer.Option(
+        False,
+        "--keep-regpat-filtered",
+        help="Also write the matched RegPat rows to regpat_filtered.parquet instead of only folding them into counts.",
+    ),
+    force: bool = typer.Option(False, "--force", help="Re-run every stage even if its inputs are unchanged."),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Profile each stage with cProfile into <out_dir>/profile/ (main process only).",
+    ),
+    memory_budget: str | None = typer.Option(
+        None,
+        help="Memory for the RegPat scan, e.g. 2G or 512MB; sizes chunks to fit (instead of --chunksize) and spills matched rows to disk.",
+    ),
 ):
     """
     Runs the full pipeline:
@@ -55,6 +81,8 @@ def run(
       3) Filter RegPat to those pct_nbr
       4) Fractional counts by inventor country
     """
+    from .runner import execute_pipeline
+
     load_dotenv()
 
     project_id = os.getenv("GCP_PROJECT_ID")
@@ -62,8 +90,9 @@ def run(
         raise typer.BadParameter("Missing GCP_PROJECT_ID. Put it in your .env or environment variables.")
 
     location = os.getenv("BQ_LOCATION", "US")
+    query_cache = _query_cache(bq_cache_dir, cache_ttl_hours, refresh, offline)
 
-    _execute_pipeline(
+    execute_pipeline(
         query_file=query_file,
         regpat_file=regpat_file,
         out_dir=out_dir,
@@ -73,143 +102,177 @@ def run(
         project_id=project_id,
         location=location,
         category_column=category_column,
+        category_output=category_output,
+        output_format=output_format,
+        workers=workers,
+        query_cache=query_cache,
+        stream_batch_rows=stream_bq_rows,
+        incremental_column=watermark_column if incremental else None,
+        keep_regpat_filtered=keep_regpat_filtered,
+        force=force,
+        profile=profile,
+        memory_budget=_memory_budget(memory_budget),
     )
 
 
-def _load_report_config(path: Path) -> dict:
-    defaults = {"plot_start_year": 1980, "plot_end_year": None}
-    if not path.exists():
-        return defaults
-    data = yaml.safe_load(path.read_text()) or {}
-    return {**defaults, **data}
-
-
-def _execute_pipeline(
-    *,
-    query_file: Path,
-    regpat_file: Path,
-    out_dir: Path,
-    cache_dir: Path,
-    chunksize: int,
-    regpat_sep: str,
-    project_id: str,
-    location: str,
-    category_column: str | None = None,
-) -> None:
-    query_file = Path(query_file)
-    regpat_file = Path(regpat_file)
-    out_dir.mkdir(parents=True, exist_ok=True)
-    cache_dir.mkdir(parents=True, exist_ok=True)
-
-    print(f"[bold]Running BigQuery query[/bold] from {query_file} ...")
-    bq_df = run_query_from_file(query_file, BQConfig(project_id=project_id, location=location))
-    bq_cache = cache_dir / "bq_raw.parquet"
-    bq_df.to_parquet(bq_cache, index=False)
-    print(f"Saved BQ raw to {bq_cache}")
-
-    print("[bold]Applying Stata-like cleaning[/bold] to build pct_nbr ...")
-    extra_cols = ["filing_date"]
-    if category_column:
-        if category_column not in bq_df.columns:
-            raise typer.BadParameter(f"Category column '{category_column}' not found in query result.")
-        extra_cols.append(category_column)
-    pct_df = stata_like_pct_nbr(
-        bq_df,
-        publication_col="publication_number",
-        extra_columns=extra_cols,
-    )
-    pct_cache = cache_dir / "pct_from_bq.csv"
-    pct_df.to_csv(pct_cache, index=False)
-    print(f"Saved pct list to {pct_cache} (n={len(pct_df):,})")
+def _memory_budget(value: str | None) -> int | None:
+    """Bytes from a size like 2G, 1.5GB, 512MiB or 1000000."""
+    if value is None:
+        return None
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*", value, re.IGNORECASE)
+    if not match:
+        raise typer.BadParameter(f"Cannot read memory budget '{value}'; use e.g. 2G or 512MB.")
+    units = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30, "t": 2**40}
+    return int(float(match.group(1)) * units[match.group(2).lower()])
 
-    print("[bold]Loading RegPat in chunks and filtering[/bold] ...")
-    regpat_filtered = load_regpat_filtered(
-        regpat_file,
-        pct_df["pct_nbr"].tolist(),
-        chunksize=chunksize,
-        separator=regpat_sep,
-    )
-    merge_cols = ["pct_nbr", "filing_date"]
-    if category_column and category_column in pct_df.columns:
-        merge_cols.append(category_column)
-    regpat_filtered = regpat_filtered.merge(
-        pct_df[merge_cols],
-        on="pct_nbr",
-        how="left",
-    )
-    regpat_cache = cache_dir / "regpat_filtered.parquet"
-    regpat_filtered.to_parquet(regpat_cache, index=False)
-    print(f"Saved filtered RegPat to {regpat_cache} (rows={len(regpat_filtered):,})")
-
-    print("[bold]Computing fractional counts by inventor country[/bold] ...")
-    counts = fractional_counts_by_inventor_country(regpat_filtered)
-    out_csv = out_dir / "inventor_country_yearly_fractional_counts.csv"
-    counts.to_csv(out_csv, index=False)
-    print(f"Saved results to {out_csv}")
-
-    category_outputs = {}
-    if category_column and category_column in regpat_filtered.columns:
-        for category_value, subset in regpat_filtered.dropna(subset=[category_column]).groupby(category_column):
-            cat_counts = fractional_counts_by_inventor_country(subset)
-            slug = _slugify(str(category_value))
-            cat_csv = out_dir / f"inventor_country_yearly_fractional_counts_{slug}.csv"
-            cat_counts.to_csv(cat_csv, index=False)
-            category_outputs[str(category_value)] = str(cat_csv)
-            print(f"  -> Saved category '{category_value}' counts to {cat_csv}")
-
-    meta = {
-        "run_utc": datetime.now(timezone.utc).isoformat(),
-        "gcp_project_id": project_id,
-        "bq_location": location,
-        "query_file": str(query_file),
-        "regpat_file": str(regpat_file),
-        "n_pct_unique": int(len(pct_df)),
-        "n_regpat_rows_kept": int(len(regpat_filtered)),
-        "outputs": {
-            "inventor_country_yearly_fractional_counts_csv": str(out_csv),
-            "categories": category_outputs,
-        },
-    }
-    meta_path = out_dir / "run_metadata.json"
-    meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
-    print(f"Saved metadata to {meta_path}")
+
+def _query_cache(
+    bq_cache_dir: Path,
+    cache_ttl_hours: float | None,
+    refresh: bool,
+    offline: bool,
+) -> QueryCache:
+    from .bq_fetch import QueryCache
+
+    if refresh and offline:
+        raise typer.BadParameter("--refresh and --offline cannot be combined.")
+    ttl_seconds = cache_ttl_hours * 3600 if cache_ttl_hours is not None else None
+    return QueryCache(cache_dir=bq_cache_dir, ttl_seconds=ttl_seconds, refresh=refresh, offline=offline)
 
 
 @app.command()
 def report(
-    input_csv: Path = typer.Option(
+    input_table: Path = typer.Option(
         Path("data/output/inventor_country_yearly_fractional_counts.csv"),
-        exists=True,
-        help="CSV produced by the run command.",
+        "--input",
+        "--input-csv",
+        help="Counts written by the run command as .csv, .parquet or .feather; the same name in another format is used if this one is missing (ignored with --cube).",
     ),
+    cube: list[Path] | None = typer.Option(
+        None,
+        help="Read counts from fractional_counts_cube.parquet written by run (file or folder, repeatable) instead of the CSV.",
+    ),
+    pipeline: list[str] | None = typer.Option(None, help="With --cube: pipelines to include (default all)."),
+    category: list[str] | None = typer.Option(None, help="With --cube: categories to include (default all)."),
     out_dir: Path = typer.Option(Path("reports"), help="Folder for charts and tables."),
     recent_start: int = typer.Option(2010, help="Start year for recent totals."),
     config_file: Path = typer.Option(Path("config/report.yml"), help="YAML config for plots."),
 ):
-    """Generate plots and summary tables from the fractional counts CSV."""
+    """Generate plots and summary tables from the fractional counts table or cube."""
+    from .cube import query_cube
+    from .reporting import load_report_config, write_report
+    from .tables import find_table, read_table
 
     out_dir.mkdir(parents=True, exist_ok=True)
-    df = pd.read_csv(input_csv)
+    if cube:
+        counts_cube = _load_cube_option(cube, pipeline)
+        df = query_cube(counts_cube, by=["inventor_country", "filing_year"], categories=category)
+    else:
+        counts_path = find_table(input_table)
+        if counts_path is None:
+            raise typer.BadParameter(f"Input table not found at {input_table}")
+        df = read_table(counts_path)
     required_cols = {"inventor_country", "filing_year", "fractional_patents"}
     if not required_cols.issubset(df.columns):
         raise typer.BadParameter(
-            f"Input CSV must contain {', '.join(sorted(required_cols))}."
+            f"Input table must contain {', '.join(sorted(required_cols))}."
         )
     df["filing_year"] = df["filing_year"].astype(int)
-    cfg = _load_report_config(config_file)
-    ts = _build_group_series(df, cfg)
-    ts_path = out_dir / "timeseries_selected_countries.png"
-    _plot_timeseries(ts, ts_path, "Fractional patents by country group")
-    print(f"Saved time-series chart to {ts_path}")
+    write_report(df, out_dir, recent_start, load_report_config(config_file))
+
+
+@app.command()
+def report_batch(
+    cube: list[Path] = typer.Option(
+        [Path("data/output")],
+        help="fractional_counts_cube.parquet written by run, or a folder searched for them (repeatable).",
+    ),
+    out_dir: Path = typer.Option(Path("reports"), help="Folder for charts and tables, one subfolder per slice."),
+    recent_start: int = typer.Option(2010, help="Start year for recent totals."),
+    config_file: Path = typer.Option(Path("config/report.yml"), help="YAML config for plots."),
+    workers: int = typer.Option(os.cpu_count() or 1, min=1, help="Processes rendering charts."),
+    dpi: int = typer.Option(300, min=50, help="Resolution of the PNGs."),
+    force: bool = typer.Option(False, "--force", help="Re-render charts even if their data and style are unchanged."),
+):
+    """
+    Charts and top tables for every pipeline and category found in the cubes.
+
+    Each slice goes to <out_dir>/<pipeline>/<category or 'all'>/. A chart is
+    re-rendered only when its data, title, style config or plotting code
+    changed since the last render (tracked in <out_dir>/manifest.json).
+    """
+    from .reporting import load_report_config, render_report_batch
+
+    counts_cube = _load_cube_option(cube, None)
+    render_report_batch(
+        counts_cube,
+        out_dir,
+        recent_start,
+        load_report_config(config_file),
+        workers=workers,
+        dpi=dpi,
+        force=force,
+    )
+
+
+@app.command()
+def query(
+    cube: list[Path] = typer.Option(
+        [Path("data/output")],
+        help="fractional_counts_cube.parquet written by run, or a folder searched for them (repeatable).",
+    ),
+    by: list[str] = typer.Option(
+        ["filing_year"],
+        help="Dimensions to group by (repeatable): pipeline, category, inventor_country, filing_year, country_group.",
+    ),
+    pipeline: list[str] | None = typer.Option(None, help="Only these pipelines (repeatable)."),
+    category: list[str] | None = typer.Option(None, help="Only these categories (repeatable)."),
+    country: list[str] | None = typer.Option(
+        None,
+        help="Only these countries (repeatable); group names such as EU27 expand to their members.",
+    ),
+    start_year: int | None = typer.Option(None, help="First filing year included."),
+    end_year: int | None = typer.Option(None, help="Last filing year included."),
+    top: int | None = typer.Option(None, min=1, help="Keep only the N largest rows."),
+    out_csv: Path | None = typer.Option(None, help="Also write the answer to this CSV."),
+):
+    """Answer a slice or top-N question from the aggregate cube, without re-running anything."""
+    from .cube import query_cube
+    from .reporting import GROUP_DEFINITIONS
+
+    counts_cube = _load_cube_option(cube, pipeline)
+    groups = dict(GROUP_DEFINITIONS)
+    countries = [code for name in country or [] for code in groups.get(name, [name])]
+    try:
+        answer = query_cube(
+            counts_cube,
+            by=by,
+            categories=category,
+            countries=countries,
+            start_year=start_year,
+            end_year=end_year,
+            top=top,
+            country_groups=groups,
+        )
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
 
-    stack_path = out_dir / "timeseries_selected_countries_share.png"
-    _plot_stacked_share(ts, stack_path, "Share of fractional patents by country group")
-    print(f"Saved stacked share chart to {stack_path}")
+    print(answer.to_string(index=False))
+    if out_csv:
+        answer.to_csv(out_csv, index=False)
+        print(f"Saved answer to {out_csv}")
 
-    table = _build_top_table(df, recent_start)
-    table_path = out_dir / "top_patenters.csv"
-    table.to_csv(table_path, index=False)
-    print(f"Saved top patenters table to {table_path}")
+
+def _load_cube_option(paths: list[Path], pipelines: list[str] | None) -> pd.DataFrame:
+    from .cube import load_cube
+
+    try:
+        counts_cube = load_cube(paths, pipelines)
+    except FileNotFoundError as exc:
+        raise typer.BadParameter(f"{exc}. Run the pipeline first.") from exc
+    if pipelines and counts_cube.empty:
+        raise typer.BadParameter(f"No cube cells for pipeline(s) {', '.join(pipelines)}.")
+    return counts_cube
 
 
 @app.command()
@@ -217,13 +280,69 @@ def run_config(
     pipelines_config: Path = typer.Option(Path("config/pipelines.yml"), help="YAML config with pipelines."),
     name: str = typer.Option(None, help="Optional pipeline name to run."),
     chunksize: int = typer.Option(1_000_000, help="Chunk size for regpat reading."),
+    workers: int = typer.Option(1, min=1, help="Processes used to parse the RegPat text file."),
+    shared_scan: bool = typer.Option(
+        True,
+        "--shared-scan/--separate-scans",
+        help="Read each RegPat file once for all selected pipelines.",
+    ),
+    bq_cache_dir: Path = typer.Option(Path("data/processed/bq_cache"), help="Folder for cached BigQuery results."),
+    cache_ttl_hours: float | None = typer.Option(None, help="Re-run queries whose cached result is older than this."),
+    refresh: bool = typer.Option(False, "--refresh", help="Ignore cached BigQuery results and re-run the queries."),
+    offline: bool = typer.Option(False, "--offline", help="Only use cached BigQuery results, never query."),
+    stream_bq_rows: int | None = typer.Option(
+        None,
+        min=1,
+        help="Stream the BigQuery result in batches of this many rows instead of loading it whole.",
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help="Only fetch rows from the cached result's watermark on and recompute their filing years.",
+    ),
+    watermark_column: str = typer.Option("publication_date", help="Result column used as the incremental watermark."),
+    category_output: str = typer.Option(
+        "csv",
+        help="Per-category counts as one CSV per category ('csv') or one Parquet dataset partitioned by category ('parquet').",
+    ),
+    output_format: str = typer.Option(
+        "csv",
+        help="Format of the pct list, counts (and per-category files) and match diagnostics: csv, parquet or feather.",
+    ),
+    keep_regpat_filtered: bool = typer.Option(
+        False,
+        "--keep-regpat-filtered",
+        help="Also write the matched RegPat rows to regpat_filtered.parquet instead of only folding them into counts.",
+    ),
+    force: bool = typer.Option(False, "--force", help="Re-run every stage even if its inputs are unchanged."),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Profile each stage with cProfile into <out_dir>/profile/ (main process only).",
+    ),
+    memory_budget: str | None = typer.Option(
+        None,
+        help="Memory for the RegPat scan, e.g. 2G or 512MB; sizes chunks to fit (instead of --chunksize) and spills matched rows to disk.",
+    ),
 ):
-    """Execute one or more pipelines defined in a YAML config."""
+    """
+    Execute one or more pipelines defined in a YAML config.
+
+    The BigQuery jobs of all selected pipelines are submitted up front through
+    one client and run at the same time; each pipeline's local stages start
+    as soon as its result is in.
+    """
+    import yaml
+
+    from .bq_fetch import BQConfig, QueryJobs
+    from .runner import execute_pipeline, prepare_pipeline, run_shared_scans, submit_queries
+
     load_dotenv()
     project_id = os.getenv("GCP_PROJECT_ID")
     if not project_id:
         raise typer.BadParameter("Missing GCP_PROJECT_ID. Put it in your .env or environment variables.")
     location = os.getenv("BQ_LOCATION", "US")
+    query_cache = _query_cache(bq_cache_dir, cache_ttl_hours, refresh, offline)
 
     if not pipelines_config.exists():
         raise typer.BadParameter(f"Config file not found at {pipelines_config}")
@@ -238,197 +357,149 @@ def run_config(
     if name and name not in pipelines:
         raise typer.BadParameter(f"Pipeline '{name}' not found. Available: {', '.join(pipelines)}")
 
+    options = {}
     for label, settings in selected.items():
-        print(f"\n[bold cyan]=== Running pipeline: {label} ===[/bold cyan]")
-        query_file = Path(settings["query_file"]).expanduser()
-        regpat_file = Path(settings.get("regpat_file", defaults.get("regpat_file", "data/raw/regpat.txt"))).expanduser()
-        out_dir = Path(settings.get("out_dir", defaults.get("out_dir", f"data/output/{label}")))
-        cache_dir = Path(settings.get("cache_dir", defaults.get("cache_dir", f"data/processed/{label}")))
-        regpat_sep = settings.get("regpat_sep", defaults.get("regpat_sep", "\t"))
-        category_column = settings.get("category_column", defaults.get("category_column"))
-
-        _execute_pipeline(
-            query_file=query_file,
-            regpat_file=regpat_file,
-            out_dir=out_dir,
-            cache_dir=cache_dir,
-            chunksize=chunksize,
-            regpat_sep=regpat_sep,
+        options[label] = dict(
+            query_file=Path(settings["query_file"]).expanduser(),
+            regpat_file=Path(settings.get("regpat_file", defaults.get("regpat_file", "data/raw/regpat.txt"))).expanduser(),
+            out_dir=Path(settings.get("out_dir", defaults.get("out_dir", f"data/output/{label}"))),
+            cache_dir=Path(settings.get("cache_dir", defaults.get("cache_dir", f"data/processed/{label}"))),
+            regpat_sep=settings.get("regpat_sep", defaults.get("regpat_sep", "\t")),
             project_id=project_id,
             location=location,
-            category_column=category_column,
+            category_column=settings.get("category_column", defaults.get("category_column")),
+            category_output=settings.get("category_output", defaults.get("category_output", category_output)),
+            output_format=settings.get("output_format", defaults.get("output_format", output_format)),
+            query_cache=query_cache,
+            stream_batch_rows=stream_bq_rows,
+            incremental_column=watermark_column if incremental else None,
+            keep_regpat_filtered=keep_regpat_filtered,
+            force=force,
+            profile=profile,
         )
 
-
-def _build_group_series(df: pd.DataFrame, cfg: dict | None = None) -> pd.DataFrame:
-    cfg = cfg or {}
-    start_year = cfg.get("plot_start_year", 1980)
-    end_year = cfg.get("plot_end_year")
-    pivot = (
-        df.pivot_table(
-            index="filing_year",
-            columns="inventor_country",
-            values="fractional_patents",
-            aggfunc="sum",
-            fill_value=0,
+    query_jobs = QueryJobs(BQConfig(project_id=project_id, location=location))
+    prepared = []
+    try:
+        arrivals = submit_queries(
+            {label: opts["query_file"] for label, opts in options.items()},
+            query_jobs.cfg,
+            query_cache,
+            query_jobs,
+            incremental_column=watermark_column if incremental else None,
+            stream=bool(stream_bq_rows),
         )
-        .sort_index()
-    )
-    pivot = pivot[pivot.index >= start_year]
-    if end_year:
-        pivot = pivot[pivot.index <= end_year]
-    groups = {}
-    for label, codes in GROUP_DEFINITIONS:
-        existing = [code for code in codes if code in pivot.columns]
-        if existing:
-            groups[label] = pivot[existing].sum(axis=1)
-        else:
-            groups[label] = pd.Series(0.0, index=pivot.index)
-    if groups:
-        selected_sum = sum(groups.values())
-        selected_sum = selected_sum.reindex(pivot.index, fill_value=0)
-    else:
-        selected_sum = pd.Series(0.0, index=pivot.index)
-    total = pivot.sum(axis=1)
-    groups["Rest of World"] = (total - selected_sum).clip(lower=0)
-    return pd.DataFrame(groups)
-
-
-def _plot_timeseries(ts: pd.DataFrame, path: Path, title: str) -> None:
-    palette = plt.get_cmap("tab20")
-    fig, ax = plt.subplots(figsize=(11, 5))
-    for idx, col in enumerate(ts.columns):
-        ax.plot(ts.index, ts[col], label=col, color=palette(idx), linewidth=2)
-    _apply_chad_style(ax, "Filing year", "Fractional patents", title)
-    ax.set_xlim(ts.index.min(), ts.index.max())
-    ax.legend(
-        loc="upper center",
-        frameon=False,
-        fontsize=10,
-        bbox_to_anchor=(0.5, -0.18),
-        ncol=3,
-    )
-    fig.subplots_adjust(left=0.12, right=0.98, top=0.90, bottom=0.28)
-    fig.savefig(path, dpi=300)
-    plt.close(fig)
-
-
-
-def _plot_stacked_share(ts: pd.DataFrame, path: Path, title: str) -> None:
-    # 1. Prepare data
-    share = ts.div(ts.sum(axis=1), axis=0).fillna(0)
-    cols = list(share.columns)
-    
-    # 2. Setup Plot
-    fig, ax = plt.subplots(figsize=(11, 5))
-    palette = plt.get_cmap("tab20")
-    colors = [palette(i) for i in range(len(cols))]
-
-    # 3. Create Stackplot
-    ax.stackplot(
-        share.index,
-        share.values.T,
-        labels=cols,
-        colors=colors,
-        edgecolor='white',
-        linewidth=0.2,
-    )
+        for label in arrivals:
+            print(f"\n[bold cyan]=== Running pipeline: {label} ===[/bold cyan]")
+            if not shared_scan:
+                execute_pipeline(
+                    label=label,
+                    **options[label],
+                    query_jobs=query_jobs,
+                    chunksize=chunksize,
+                    workers=workers,
+                    memory_budget=_memory_budget(memory_budget),
+                )
+            else:
+                prepared.append(prepare_pipeline(label=label, **options[label], query_jobs=query_jobs))
+    finally:
+        query_jobs.close()
+
+    # One RegPat pass per distinct (file, separator), shared by all pipelines reading it.
+    run_shared_scans(prepared, chunksize=chunksize, workers=workers, memory_budget=_memory_budget(memory_budget))
 
-    # Apply your custom style
-    _apply_chad_style(ax, "Filing year", "Share of fractional patents", title)
-    
-    ax.set_xlim(share.index.min(), share.index.max())
-    ax.set_ylim(0, 1)
-
-    # 4. The Legend (One single line)
-    ax.legend(
-        loc="upper center",
-        bbox_to_anchor=(0.5, -0.12), # Adjust this to bring it closer/further from axis
-        ncol=len(cols),              # Set columns to the number of items
-        frameon=False,
-        fontsize=10,
-        columnspacing=1.0            # Adjust spacing between items if they look cramped
-    )
-
-    # 5. Save Logic
-    # bbox_inches="tight" will automatically expand the PNG to fit the legend
-    fig.savefig(
-        path, 
-        dpi=300, 
-        bbox_inches="tight"
-    )
-    plt.close(fig)
-
-
-def _apply_chad_style(ax: plt.Axes, xlabel: str, ylabel: str, title: str) -> None:
-    ax.set_title(title, fontsize=13, fontweight="bold", pad=10)
-    ax.set_xlabel(xlabel, fontweight="bold", fontsize=12)
-    ax.set_ylabel(ylabel, fontweight="bold", fontsize=12)
-
-    # Keep real axis lines so ticks don't float
-    ax.spines["left"].set_visible(True)
-    ax.spines["bottom"].set_visible(True)
-    ax.spines["top"].set_visible(False)
-    ax.spines["right"].set_visible(False)
-
-    # Put ticks/labels outside
-    ax.tick_params(axis="y", left=True, right=False, labelleft=True,
-                   direction="out", pad=10, length=4, width=1.0, labelsize=11)
-    ax.tick_params(axis="x", bottom=True, top=False, labelbottom=True,
-                   direction="out", pad=6, length=4, width=1.0, labelsize=11)
 
-    ax.grid(False)
-
-    # Optional arrowheads only (no extra lines)
-    _add_axis_arrowheads(ax)
-
-
-
-def _add_axis_arrowheads(ax: plt.Axes) -> None:
-    arrowprops = dict(arrowstyle="-|>", color="black", lw=1.2, mutation_scale=18)
-
-    # short arrowhead at end of x-axis
-    ax.annotate(
-        "",
-        xy=(1.02, 0.0), xytext=(0.97, 0.0),
-        xycoords="axes fraction", textcoords="axes fraction",
-        arrowprops=arrowprops,
-        annotation_clip=False,
-    )
+@app.command()
+def ingest_regpat(
+    regpat_file: Path = typer.Option(..., exists=True, dir_okay=False, help="Path to OECD regpat.txt (plain, .gz, .bz2 or .zst)"),
+    store_dir: Path = typer.Option(Path("data/processed/regpat_store"), help="Output folder for the RegPat store."),
+    chunksize: int = typer.Option(1_000_000, help="Chunk size for regpat reading."),
+    regpat_sep: str = typer.Option("\t", help="Column separator for regpat file (default tab)."),
+    row_group_size: int = typer.Option(100_000, help="Rows per Parquet row group."),
+):
+    """
+    One-time conversion of regpat.txt into a sorted Parquet store.
+    Pass the store folder as --regpat-file to run/run-config afterwards.
+    """
+    from .regpat_store import ingest_regpat as build_regpat_store
 
-    # short arrowhead at end of y-axis
-    ax.annotate(
-        "",
-        xy=(0.0, 1.02), xytext=(0.0, 0.97),
-        xycoords="axes fraction", textcoords="axes fraction",
-        arrowprops=arrowprops,
-        annotation_clip=False,
+    print(f"[bold]Ingesting RegPat[/bold] from {regpat_file} ...")
+    meta = build_regpat_store(
+        regpat_file,
+        store_dir,
+        chunksize=chunksize,
+        separator=regpat_sep,
+        row_group_size=row_group_size,
     )
+    print(f"Saved RegPat store to {store_dir} (rows={meta['n_rows']:,}, row groups={meta['n_row_groups']:,})")
 
 
-def _slugify(value: str) -> str:
-    slug = "".join(ch if ch.isalnum() else "_" for ch in value)
-    slug = "_".join(part for part in slug.split("_") if part)
-    return slug.lower() or "category"
-
-
-def _build_top_table(df: pd.DataFrame, recent_start: int) -> pd.DataFrame:
-    min_year = int(df["filing_year"].min())
-    max_year = int(df["filing_year"].max())
-    overall_col = f"fractional_{min_year}_{max_year}"
-    recent_col = f"fractional_{recent_start}_{max_year}"
-
-    overall = df.groupby("inventor_country")["fractional_patents"].sum()
-    recent = (
-        df[df["filing_year"] >= recent_start]
-        .groupby("inventor_country")["fractional_patents"]
-        .sum()
+@app.command()
+def build_regpat_index(
+    regpat_file: Path = typer.Option(..., exists=True, dir_okay=False, help="Path to OECD regpat.txt (uncompressed)"),
+    regpat_sep: str = typer.Option("\t", help="Column separator for regpat file (default tab)."),
+):
+    """
+    Writes a sidecar index (<regpat_file>.pct_index.parquet) of the byte
+    ranges holding each pct_nbr. run/run-config then read only those ranges
+    when the pct list is small; the index is ignored once the file changes.
+    """
+    from .regpat_index import build_regpat_index as build_index, index_path
+
+    print(f"[bold]Indexing RegPat[/bold] {regpat_file} ...")
+    try:
+        meta = build_index(regpat_file, separator=regpat_sep)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc), param_hint="--regpat-file") from None
+    print(
+        f"Saved RegPat index to {index_path(regpat_file)} "
+        f"(lines={meta['n_lines']:,}, pct numbers={meta['n_pct']:,}, ranges={meta['n_entries']:,})"
     )
+    if meta["n_lines"] and not meta["n_pct"]:
+        print(
+            f"[yellow]Warning:[/yellow] the index covers no pct numbers; {meta['unsplit_bytes']:,} bytes could not be"
+            " split on raw bytes (or no pct_nbr is well-formed), so every lookup will scan the whole file."
+        )
+
 
-    table = pd.DataFrame({overall_col: overall, recent_col: recent}).fillna(0)
-    table = table.sort_values(overall_col, ascending=False).reset_index()
-    table = table.rename(columns={"inventor_country": "country"})
-    return table
+@app.command()
+def serve(
+    regpat_file: Path = typer.Option(..., exists=True, help="OECD regpat.txt (may be .gz, .bz2 or .zst) or a store built by ingest-regpat."),
+    regpat_sep: str = typer.Option("\t", help="Column separator for regpat file (default tab)."),
+    chunksize: int = typer.Option(1_000_000, help="Chunk size for regpat reading."),
+    host: str = typer.Option("127.0.0.1", help="Address to listen on."),
+    port: int = typer.Option(8765, help="Port to listen on."),
+    socket: Path | None = typer.Option(None, help="Listen on this Unix socket instead of host:port."),
+    bq_cache_dir: Path = typer.Option(Path("data/processed/bq_cache"), help="Folder of cached BigQuery results for bq_cache requests."),
+):
+    """
+    Loads RegPat into memory once and answers fractional-count requests
+    over local HTTP: POST /counts with {"pct_nbrs": [...]} (optionally
+    "filing_dates") or {"bq_cache": "<key prefix or query file>"}.
+    """
+    from .serve import CountService, RegpatMemory, is_stale_socket, make_server
+
+    if socket is not None:
+        # Before the slow RegPat load, not after it.
+        try:
+            is_stale_socket(socket)
+        except FileExistsError as exc:
+            raise typer.BadParameter(str(exc)) from exc
+    print(f"[bold]Loading RegPat[/bold] from {regpat_file} ...")
+    started = time.perf_counter()
+    memory = RegpatMemory.load(regpat_file, separator=regpat_sep, chunksize=chunksize)
+    print(f"Loaded {memory.n_rows:,} rows for {len(memory.keys):,} pct numbers in {time.perf_counter() - started:.1f}s")
+
+    server = make_server(CountService(memory, bq_cache_dir), host=host, port=port, socket_path=socket)
+    print(f"Listening on {socket if socket else f'http://{host}:{port}'} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket:
+            socket.unlink(missing_ok=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+"""
+Aggregate cube of fractional counts: pipeline x category x country x year.
+
+Every run writes its counts as cells of the cube plus precomputed rollups. A
+null category, inventor_country or filing_year marks a cell summed over that
+dimension (all categories, all countries, all years), so totals and top-N
+lists are read directly instead of being regrouped from the row level.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Mapping
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+CUBE_FILE = "fractional_counts_cube.parquet"
+CUBE_DIMENSIONS = ["pipeline", "category", "inventor_country", "filing_year"]
+# Derived from inventor_country through the country groups given to query_cube.
+COUNTRY_GROUP = "country_group"
+REST_OF_WORLD = "Rest of World"
+
+CUBE_SCHEMA = pa.schema(
+    [
+        ("pipeline", pa.string()),
+        ("category", pa.string()),
+        ("inventor_country", pa.string()),
+        ("filing_year", pa.int32()),
+        ("fractional_patents", pa.float64()),
+    ]
+)
+
+
+def build_cube(
+    pipeline: str,
+    counts: pd.DataFrame,
+    by_category: pd.DataFrame | None = None,
+    category_column: str | None = None,
+) -> pd.DataFrame:
+    """
+    Cube cells of one pipeline from its overall counts and, if any, its
+    per-category counts, with rollups over years, countries and both.
+    """
+    cells = [counts.assign(category=pd.Series(pd.NA, index=counts.index, dtype="string"))]
+    if by_category is not None:
+        cells.append(
+            by_category.rename(columns={category_column: "category"}).astype({"category": str}).astype({"category": "string"})
+        )
+    base = pd.concat(cells, ignore_index=True)[["category", "inventor_country", "filing_year", "fractional_patents"]]
+    base = base.astype({"inventor_country": "string", "filing_year": "Int32"})
+
+    levels = [base]
+    for keep in (["category", "inventor_country"], ["category", "filing_year"], ["category"]):
+        levels.append(base.groupby(keep, as_index=False, dropna=False)["fractional_patents"].sum())
+    cube = pd.concat(levels, ignore_index=True)
+    cube.insert(0, "pipeline", pd.Series(pipeline, index=cube.index, dtype="string"))
+    return cube.sort_values(CUBE_DIMENSIONS, na_position="first", kind="stable").reset_index(drop=True)
+
+
+def write_cube(cube: pd.DataFrame, path: Path) -> None:
+    table = pa.Table.from_pandas(cube[CUBE_SCHEMA.names], schema=CUBE_SCHEMA, preserve_index=False)
+    pq.write_table(table, path, compression="zstd", use_dictionary=["pipeline", "category", "inventor_country"])
+
+
+def load_cube(paths: Iterable[Path], pipelines: Iterable[str] | None = None) -> pd.DataFrame:
+    """Reads cube files; folders are searched recursively for CUBE_FILE."""
+    files = []
+    for path in paths:
+        path = Path(path)
+        files.extend(sorted(path.rglob(CUBE_FILE)) if path.is_dir() else [path])
+    if not files:
+        raise FileNotFoundError(f"No {CUBE_FILE} found in {', '.join(str(p) for p in paths)}")
+
+    pipelines = list(pipelines or [])
+    filters = [("pipeline", "in", pipelines)] if pipelines else None
+    tables = [pq.read_table(f, schema=CUBE_SCHEMA, filters=filters) for f in files]
+    return pa.concat_tables(tables).to_pandas(
+        types_mapper={pa.string(): pd.StringDtype(), pa.int32(): pd.Int32Dtype()}.get
+    )
+
+
+def query_cube(
+    cube: pd.DataFrame,
+    by: Iterable[str] = ("filing_year",),
+    pipelines: Iterable[str] | None = None,
+    categories: Iterable[str] | None = None,
+    countries: Iterable[str] | None = None,
+    start_year: int | None = None,
+    end_year: int | None = None,
+    top: int | None = None,
+    country_groups: Mapping[str, list[str]] | None = None,
+) -> pd.DataFrame:
+    """
+    Fractional patents grouped by `by` over the selected slice.
+
+    A dimension that is neither grouped on nor filtered is read from its
+    rollup cells. Without a category filter or grouping the totals are over
+    all categories. With top, the largest `top` rows are kept.
+    """
+    by = list(by)
+    known = [*CUBE_DIMENSIONS, COUNTRY_GROUP]
+    unknown = [dim for dim in by if dim not in known]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s) {', '.join(unknown)}; choose from {', '.join(known)}.")
+    if COUNTRY_GROUP in by and not country_groups:
+        raise ValueError(f"Grouping by {COUNTRY_GROUP} needs country_groups.")
+
+    pipelines, categories, countries = list(pipelines or []), list(categories or []), list(countries or [])
+    keep = pd.Series(True, index=cube.index)
+    if pipelines:
+        keep &= cube["pipeline"].isin(pipelines)
+    keep &= _dimension_mask(cube["category"], bool(categories) or "category" in by, categories)
+    keep &= _dimension_mask(
+        cube["inventor_country"],
+        bool(countries) or "inventor_country" in by or COUNTRY_GROUP in by,
+        countries,
+    )
+    years = cube["filing_year"]
+    if start_year is not None or end_year is not None or "filing_year" in by:
+        keep &= years.notna()
+        if start_year is not None:
+            keep &= years >= start_year
+        if end_year is not None:
+            keep &= years <= end_year
+    else:
+        keep &= years.isna()
+    rows = cube[keep.fillna(False).to_numpy(dtype=bool)]
+
+    if COUNTRY_GROUP in by:
+        group_of = {code: name for name, codes in country_groups.items() for code in codes}
+        rows = rows.assign(
+            **{COUNTRY_GROUP: rows["inventor_country"].map(group_of).fillna(REST_OF_WORLD).astype("string")}
+        )
+
+    if not by:
+        return pd.DataFrame({"fractional_patents": [rows["fractional_patents"].sum()]})
+    out = rows.groupby(by, as_index=False, observed=True)["fractional_patents"].sum()
+    if top is not None:
+        return out.sort_values("fractional_patents", ascending=False, kind="stable").head(top).reset_index(drop=True)
+    return out.sort_values(by, kind="stable").reset_index(drop=True)
+
+
+def _dimension_mask(values: pd.Series, sliced: bool, selected: list[str]) -> pd.Series:
+    """Base cells (optionally restricted to selected) when sliced, else the rollup cells."""
+    if not sliced:
+        return values.isna()
+    mask = values.notna()
+    if selected:
+        mask &= values.isin(selected)
+    return mask
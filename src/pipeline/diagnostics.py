@@ -0,0 +1,97 @@
+"""
+Match-rate diagnostics collected during the RegPat scan: which pct numbers
+of the BigQuery list have RegPat rows, and their inv_share sums.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from .analysis import filing_year
+from .pct_codec import PctKeySet
+
+
+# Written as .csv, .parquet or .feather (see tables.py).
+MATCH_BY_YEAR = "match_diagnostics"
+MATCH_BY_PCT_PARQUET = "match_diagnostics_by_pct.parquet"
+
+
+class MatchTally:
+    """
+    RegPat rows and inv_share per pct number of a pct list, summed while the
+    scan runs. partial() reduces a chunk of matched rows to per-key sums (it
+    needs no state, so workers call it directly); extend() adds up those of
+    keys in the list.
+    """
+
+    def __init__(self, pct_keys: np.ndarray):
+        self.keys = PctKeySet(np.asarray(pct_keys, dtype=np.int64)).keys
+        self.n_rows = np.zeros(len(self.keys), dtype=np.int64)
+        self.inv_share = np.zeros(len(self.keys), dtype=np.float64)
+
+    @staticmethod
+    def partial(chunk: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(keys, rows, inv_share sums) for a chunk with pct_key and inv_share; missing shares count as 0."""
+        keys, inverse, counts = np.unique(chunk["pct_key"].to_numpy(), return_inverse=True, return_counts=True)
+        share = np.nan_to_num(chunk["inv_share"].to_numpy(dtype="float64", na_value=np.nan))
+        return keys, counts, np.bincount(inverse, weights=share, minlength=len(keys))
+
+    def extend(self, partials) -> None:
+        if not len(self.keys):
+            return
+        for keys, counts, sums in partials:
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            hit = self.keys[pos] == keys
+            # keys are unique within a partial, so plain fancy-index adds are safe.
+            self.n_rows[pos[hit]] += counts[hit]
+            self.inv_share[pos[hit]] += sums[hit]
+
+    @property
+    def n_matched(self) -> int:
+        return int((self.n_rows > 0).sum())
+
+
+def match_table(
+    pct_df: pd.DataFrame,
+    pct_keys: np.ndarray,
+    tally: MatchTally,
+    category_column: str | None = None,
+) -> pd.DataFrame:
+    """One row per pct number of pct_df: filing year, category, RegPat rows, inv_share sum and matched."""
+    pct_keys = np.asarray(pct_keys, dtype=np.int64)
+    n_rows = np.zeros(len(pct_keys), dtype=np.int64)
+    share = np.zeros(len(pct_keys), dtype=np.float64)
+    if len(tally.keys):
+        # Malformed pct numbers (INVALID_KEY) are never among tally.keys.
+        pos = np.minimum(np.searchsorted(tally.keys, pct_keys), len(tally.keys) - 1)
+        found = tally.keys[pos] == pct_keys
+        n_rows[found] = tally.n_rows[pos[found]]
+        share[found] = tally.inv_share[pos[found]]
+
+    table = pd.DataFrame(
+        {
+            "pct_nbr": pct_df["pct_nbr"].astype("string").array,
+            "filing_year": filing_year(pct_df["filing_date"]).array,
+        }
+    )
+    if category_column:
+        table[category_column] = pct_df[category_column].array
+    table["n_regpat_rows"] = n_rows
+    table["inv_share_sum"] = share
+    table["matched"] = n_rows > 0
+    return table
+
+
+def summarize_matches(by_pct: pd.DataFrame, category_column: str | None = None) -> pd.DataFrame:
+    """Matched and unmatched pct numbers, RegPat rows and inv_share by filing year (and category)."""
+    keys = ["filing_year", category_column] if category_column else ["filing_year"]
+    summary = by_pct.groupby(keys, as_index=False, dropna=False).agg(
+        n_pct=("matched", "size"),
+        n_matched=("matched", "sum"),
+        n_regpat_rows=("n_regpat_rows", "sum"),
+        inv_share_sum=("inv_share_sum", "sum"),
+    )
+    summary.insert(summary.columns.get_loc("n_matched") + 1, "n_unmatched", summary["n_pct"] - summary["n_matched"])
+    summary["match_rate"] = summary["n_matched"] / summary["n_pct"]
+    return summary.sort_values(keys, na_position="last", kind="stable").reset_index(drop=True)
+
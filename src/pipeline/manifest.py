@@ -0,0 +1,70 @@
+"""Per-stage fingerprints so unchanged pipeline stages can be skipped."""
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from types import ModuleType
+
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_digest(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_stat_fingerprint(path: Path) -> dict:
+    """Cheap identity for big inputs (RegPat): resolved path, size and mtime."""
+    stat = Path(path).stat()
+    return {"path": str(Path(path).resolve()), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def code_version(*modules: ModuleType) -> str:
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def fingerprint(**inputs) -> str:
+    payload = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageManifest:
+    """
+    Fingerprint and artifacts of each stage's last run, kept in
+    <cache_dir>/manifest.json. A stage is current when its fingerprint is
+    unchanged and all of its artifacts still exist.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.path = Path(cache_dir) / MANIFEST_FILE
+        try:
+            self.stages = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.stages = {}
+
+    def is_current(self, stage: str, stage_fingerprint: str) -> bool:
+        entry = self.stages.get(stage)
+        if not entry or entry.get("fingerprint") != stage_fingerprint:
+            return False
+        return all(Path(p).exists() for p in entry.get("artifacts", []))
+
+    def get(self, stage: str) -> dict:
+        return self.stages.get(stage, {})
+
+    def record(self, stage: str, stage_fingerprint: str, artifacts: list[Path], **extra) -> None:
+        self.stages[stage] = {
+            "fingerprint": stage_fingerprint,
+            "artifacts": [str(p) for p in artifacts],
+            "updated_utc": datetime.now(timezone.utc).isoformat(),
+            **extra,
+        }
+        self.path.write_text(json.dumps(self.stages, indent=2), encoding="utf-8")
@@ -0,0 +1,106 @@
+"""Wall and CPU time, rows, bytes and peak memory per pipeline stage, recorded into run_metadata.json."""
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class StageMetrics:
+    """
+    Measurements of each stage a pipeline ran, in order.
+
+    stage() yields a dict the caller fills with rows_in, rows_out, bytes_read
+    and anything else worth keeping; timings and peak RSS are added when the
+    block ends. Worker CPU time only counts worker processes that finished
+    within the stage. With profile_dir set, each stage is also run under
+    cProfile and dumped to <profile_dir>/<stage>.prof and .txt (main process
+    only). Stages must not be nested.
+    """
+
+    def __init__(self, profile_dir: Path | None = None):
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.stages: list[dict] = []
+
+    @contextmanager
+    def stage(self, name: str, **info) -> Iterator[dict]:
+        record = {"stage": name, **info}
+        scope = "stage" if _reset_peak_rss() else "process"
+        profiler = cProfile.Profile() if self.profile_dir else None
+        start_wall = time.perf_counter()
+        start_cpu = os.times()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - start_wall
+            cpu = os.times()
+            record["wall_seconds"] = round(wall, 4)
+            record["cpu_seconds"] = round(cpu.user + cpu.system - start_cpu.user - start_cpu.system, 4)
+            worker_cpu = round(cpu.children_user + cpu.children_system - start_cpu.children_user - start_cpu.children_system, 4)
+            if worker_cpu > 0:
+                record["worker_cpu_seconds"] = worker_cpu
+            rows = record.get("rows_in", record.get("rows_out"))
+            if rows is not None and wall > 0:
+                record["rows_per_sec"] = round(rows / wall, 1)
+            if record.get("bytes_read") and wall > 0:
+                record["mb_per_sec"] = round(record["bytes_read"] / 2**20 / wall, 2)
+            peak = _peak_rss_bytes()
+            if peak is not None:
+                record["peak_rss_mb"] = round(peak / 2**20, 1)
+                record["peak_rss_scope"] = scope
+            if profiler:
+                record["profile"] = str(self._dump(name, profiler))
+            self.stages.append(record)
+
+    def add(self, record: dict) -> None:
+        """Records a stage measured elsewhere, e.g. a RegPat scan shared with other pipelines."""
+        self.stages.append(dict(record))
+
+    def _dump(self, name: str, profiler: cProfile.Profile) -> Path:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir / f"{name}.prof"
+        profiler.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+        path.with_suffix(".txt").write_text(text.getvalue(), encoding="utf-8")
+        return path
+
+
+def _reset_peak_rss() -> bool:
+    """Resets the kernel's peak RSS of this process (Linux); False where that is not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # Peak since the process started; kilobytes on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
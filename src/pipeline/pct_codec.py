@@ -0,0 +1,151 @@
+"""
+Reversible int64 encoding of normalized pct_nbr strings.
+
+A pct_nbr is "WO" + 4-digit year + optional 2-letter office + 1-9 digit serial
+(e.g. WO2005012345 or WO2005EP012345). The key packs
+
+    ((year * 677 + office) * 16 + serial_len) << 30 | serial
+
+where office is 0 when absent, else 1 + its base-26 value, and serial_len keeps
+leading zeros of the serial. Strings outside that shape encode to -1 and never
+match anything: RegPat pct_nbr values and the numbers built by
+stata_like_pct_nbr always fit it.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+
+INVALID_KEY = -1
+
+_MAX_LEN = 17  # WO + year + office + 9-digit serial
+_SERIAL_BITS = 30
+_SERIAL_MASK = (1 << _SERIAL_BITS) - 1
+_N_OFFICES = 26 * 26 + 1
+_ZERO, _A, _W, _O = ord("0"), ord("A"), ord("W"), ord("O")
+
+
+def encode_pct_nbr(values: Iterable[str] | pd.Series) -> np.ndarray:
+    """Encodes pct_nbr strings to int64 keys; missing or malformed values give -1."""
+    series = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype="object")
+    n = len(series)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    present = series.notna().to_numpy()
+    # One spare byte of width so over-long strings are seen as too long.
+    text = series.astype("string").fillna("").to_numpy(dtype=f"U{_MAX_LEN + 1}")
+    try:
+        raw = text.astype(f"S{_MAX_LEN + 1}")
+    except UnicodeEncodeError:
+        raw = np.char.encode(text, "ascii", "replace").astype(f"S{_MAX_LEN + 1}")
+    return _encode_bytes(raw.view(np.uint8).reshape(n, _MAX_LEN + 1), present)
+
+
+def encode_pct_fields(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Keys of the fields buf[starts[i]:ends[i]] of a raw uint8 byte buffer,
+    as encode_pct_nbr would give for those fields read as strings, without
+    building the strings.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    if len(starts) == 0:
+        return np.empty(0, dtype=np.int64)
+    width = _MAX_LEN + 1
+    cols = np.arange(width)
+    length = np.minimum(np.asarray(ends, dtype=np.int64) - starts, width)
+    b = buf[np.minimum(starts[:, None] + cols, len(buf) - 1)]
+    b[cols >= length[:, None]] = 0
+    return _encode_bytes(b, np.ones(len(b), dtype=bool))
+
+
+def _encode_bytes(b: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """Keys of the zero-padded ASCII rows of b (n x _MAX_LEN + 1 uint8)."""
+    n = len(b)
+    length = (b != 0).sum(axis=1)
+    digit = (b >= _ZERO) & (b <= _ZERO + 9)
+    upper = (b >= _A) & (b <= _A + 25)
+    d = b.astype(np.int64) - _ZERO
+
+    ok = present & (length <= _MAX_LEN) & (b[:, 0] == _W) & (b[:, 1] == _O) & digit[:, 2:6].all(axis=1)
+    year = d[:, 2] * 1000 + d[:, 3] * 100 + d[:, 4] * 10 + d[:, 5]
+
+    has_office = upper[:, 6] & upper[:, 7]
+    office = np.where(has_office, 1 + (b[:, 6].astype(np.int64) - _A) * 26 + (b[:, 7].astype(np.int64) - _A), 0)
+    start = np.where(has_office, 8, 6)
+    serial_len = length - start
+    ok &= (serial_len >= 1) & (serial_len <= 9)
+
+    serial = np.zeros(n, dtype=np.int64)
+    for j in range(6, _MAX_LEN):
+        in_serial = (j >= start) & (j < length)
+        ok &= ~in_serial | digit[:, j]
+        serial = np.where(in_serial, serial * 10 + d[:, j], serial)
+
+    keys = (((year * _N_OFFICES + office) * 16 + serial_len) << _SERIAL_BITS) | serial
+    return np.where(ok, keys, INVALID_KEY).astype(np.int64)
+
+
+def decode_pct_nbr(keys: Iterable[int] | np.ndarray) -> pd.Series:
+    """Inverse of encode_pct_nbr; -1 decodes to <NA>."""
+    keys = np.asarray(keys, dtype=np.int64)
+    n = len(keys)
+    valid = keys >= 0
+    k = np.where(valid, keys, 0)
+
+    serial = k & _SERIAL_MASK
+    rest = k >> _SERIAL_BITS
+    serial_len = rest % 16
+    rest //= 16
+    office = rest % _N_OFFICES
+    year = rest // _N_OFFICES
+
+    out = np.zeros((n, _MAX_LEN), dtype=np.uint8)
+    out[:, 0] = _W
+    out[:, 1] = _O
+    for i, div in enumerate((1000, 100, 10, 1)):
+        out[:, 2 + i] = _ZERO + (year // div) % 10
+
+    has_office = office > 0
+    out[:, 6] = np.where(has_office, _A + (office - 1) // 26, 0)
+    out[:, 7] = np.where(has_office, _A + (office - 1) % 26, 0)
+    start = np.where(has_office, 8, 6)
+
+    rows = np.arange(n)
+    for i in range(9):
+        mask = i < serial_len
+        pos = start + serial_len - 1 - i
+        out[rows[mask], pos[mask]] = _ZERO + (serial[mask] // 10**i) % 10
+
+    text = out.view(f"S{_MAX_LEN}").ravel().astype(f"U{_MAX_LEN}")
+    return pd.Series(text, dtype="string").where(valid)
+
+
+class PctKeySet:
+    """Sorted unique int64 keys with searchsorted membership, in place of a set of strings."""
+
+    def __init__(self, pct_nbrs: Iterable[str] | np.ndarray = ()):
+        if isinstance(pct_nbrs, np.ndarray) and pct_nbrs.dtype.kind in "iu":
+            keys = pct_nbrs.astype(np.int64, copy=False)
+        else:
+            keys = encode_pct_nbr(pct_nbrs)
+        self.keys = np.unique(keys[keys != INVALID_KEY])
+
+    @classmethod
+    def union(cls, sets: Iterable["PctKeySet"]) -> "PctKeySet":
+        parts = [s.keys for s in sets]
+        return cls(np.concatenate(parts) if parts else np.empty(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        pos = np.searchsorted(self.keys, keys)
+        pos[pos == len(self.keys)] = 0
+        return self.keys[pos] == keys
@@ -1,18 +1,65 @@
 from __future__ import annotations
 
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Iterable, Iterator, Mapping, Optional
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .analysis import CountFold
+from .diagnostics import MatchTally
+from .pct_codec import INVALID_KEY, PctKeySet, decode_pct_nbr, encode_pct_nbr
+from .regpat_index import RegpatIndex
+from .regpat_io import compression_of, line_blocks, line_keys, open_regpat, pct_field_position, range_blocks
+from .regpat_store import STORE_DATA_FILE, is_regpat_store, load_store_filtered
 
 
 REGPAT_USECOLS = ["pct_nbr", "ctry_code", "inv_share"]
 
+# Byte ranges handed out per worker; more than one keeps the pool busy when
+# some ranges hold many more matches than others.
+RANGES_PER_WORKER = 4
+
+# With a memory budget: the share of it for the chunk being parsed (the rest
+# holds matched rows until they are spilled to disk), and how many times a
+# parsed chunk's own size parsing and key encoding take at their peak. Raw
+# blocks are sized from the parsed rows of the block before; chunks of a full
+# parse (no usable pct_nbr position, or prefilter off) from their bytes per row.
+CHUNK_SHARE = 0.5
+CHUNK_OVERHEAD = 4
+# Rows of the first chunk, which measures bytes per row, and the smallest chunk.
+PROBE_ROWS = 50_000
+MIN_CHUNK_ROWS = 10_000
+
+# Raw bytes per block when lines are pre-filtered before parsing, and how many
+# times a block's size the line offsets and key encoding take at their peak.
+PREFILTER_BLOCK_BYTES = 16 << 20
+PREFILTER_OVERHEAD = 8
+MIN_PREFILTER_BLOCK_BYTES = 1 << 20
+
+# A sidecar index is used while the lines it points to are at most this share
+# of the file; past that, one sequential scan reads as fast as the lookups.
+MAX_INDEX_SHARE = 0.2
+
+# Set once per worker process by _init_worker, then reused for every range.
+_WORKER_SETS: dict[str, PctKeySet] | None = None
+_WORKER_FOLDS: dict[str, CountFold] | None = None
+
 
 def load_regpat_filtered(
     regpat_file: Path,
     pct_nbrs: Iterable[str],
     chunksize: int = 1_000_000,
     separator: str = "\t",
+    workers: int = 1,
+    keys: bool = False,
 ) -> pd.DataFrame:
     """
     Loads OECD regpat.txt (tab-delimited) in chunks and keeps only pct_nbr in pct_nbrs.
@@ -20,26 +67,558 @@ def load_regpat_filtered(
 
     Expected columns include:
       pct_nbr, ctry_code, inv_share
-    """
-    pct_set = set(pct_nbrs)
 
-    kept = []
-    for chunk in pd.read_csv(
+    regpat_file may also be a store directory built by ingest-regpat, in which
+    case only the row groups that can hold a wanted pct_nbr are read.
+
+    Matching is done on int64 keys (see pct_codec). pct_nbrs may be strings or
+    an int64 array of keys; with keys=True the result carries pct_key instead
+    of the pct_nbr string column.
+    """
+    return load_regpat_filtered_many(
         regpat_file,
+        {"_": pct_nbrs},
+        chunksize=chunksize,
+        separator=separator,
+        workers=workers,
+        keys=keys,
+    )["_"]
+
+
+def load_regpat_filtered_many(
+    regpat_file: Path,
+    pct_sets: Mapping[str, Iterable[str]],
+    chunksize: int = 1_000_000,
+    separator: str = "\t",
+    workers: int = 1,
+    keys: bool = False,
+    folds: Mapping[str, CountFold] | None = None,
+    chunk_stats: list[dict] | None = None,
+    memory_budget: int | None = None,
+    tallies: Mapping[str, MatchTally] | None = None,
+    prefilter: bool = True,
+    use_index: bool = True,
+) -> dict[str, pd.DataFrame]:
+    """
+    Same as load_regpat_filtered, but serves several pct lists from one pass
+    over regpat_file. Each kept row goes to every label whose pct list
+    contains its pct_nbr, so the file is read once however many labels there are.
+
+    Labels that have a CountFold in folds get no frame: their rows are added
+    to the fold chunk by chunk and never collected. Labels with a MatchTally
+    in tallies also get their matched rows and inv_share summed per pct
+    number as the chunks go by.
+
+    regpat_file may be gzip, bzip2 or zstd compressed (see regpat_io); it is
+    then decompressed while it is read.
+
+    With workers > 1 the text file is split into newline-aligned byte ranges
+    parsed in a process pool. Ranges are merged in file order, so the result
+    is the same as the serial read. Compressed files cannot be split and are
+    always read by one process.
+
+    If chunk_stats is given, one dict per chunk read (rows, rows kept and
+    seconds; plus the byte range with workers) is appended to it in file
+    order. A store read adds a single entry for the row groups it read.
+
+    memory_budget (bytes, shared by all workers) sizes the raw blocks (or,
+    without prefilter, the chunks) of text files from the in-memory size of
+    the rows parsed from the block before. Matched rows beyond the budget
+    are spilled to temporary Parquet files until the scan ends. The returned
+    frames still have to fit in memory.
+
+    With prefilter, text files are read in raw blocks and only the lines whose
+    pct_nbr field (found by its position in the header) is wanted are handed
+    to read_csv; chunksize then no longer applies. Blocks where that cannot
+    be done exactly (quotes, stray carriage returns, lines with the wrong
+    number of fields) are parsed whole, so the result is the same either way.
+
+    With use_index and a fresh sidecar index (see regpat_index), only the
+    lines the index lists for the wanted pct numbers are read, when that is
+    a small enough share of the file; otherwise the file is scanned.
+    """
+    sets = {label: PctKeySet(pct_nbrs) for label, pct_nbrs in pct_sets.items()}
+    folds = dict(folds or {})
+    tallies = dict(tallies or {})
+    text = not is_regpat_store(regpat_file)
+    pct_field = pct_field_position(regpat_file, separator) if prefilter and text else None
+    ranges = _index_ranges(regpat_file, separator, _union(sets)) if use_index and text else None
+
+    spilling = memory_budget is not None and not is_regpat_store(regpat_file)
+    with tempfile.TemporaryDirectory(prefix="regpat_spill_") if spilling else nullcontext() as spill_dir:
+        if is_regpat_store(regpat_file):
+            matched = load_store_filtered(regpat_file, _union(sets), keys=True, chunk_stats=chunk_stats)
+            kept = {label: [_route(matched, pct_set, len(sets))] for label, pct_set in sets.items()}
+            tallied = {label: [MatchTally.partial(part) for part in kept[label]] for label in tallies}
+            for label, fold in folds.items():
+                kept[label] = [fold.partial(part) for part in kept[label]]
+        elif ranges is not None:
+            kept, tallied = _scan_source(
+                regpat_file,
+                sets,
+                folds,
+                chunksize,
+                separator,
+                chunk_stats,
+                memory_budget,
+                spill_dir,
+                set(tallies),
+                ranges=ranges,
+            )
+        elif workers > 1 and compression_of(regpat_file) is None:
+            worker_budget = memory_budget // workers if memory_budget is not None else None
+            kept, tallied = _load_parallel(
+                Path(regpat_file),
+                sets,
+                folds,
+                chunksize,
+                separator,
+                workers,
+                chunk_stats,
+                worker_budget,
+                spill_dir,
+                set(tallies),
+                pct_field,
+            )
+        else:
+            kept, tallied = _scan_source(
+                regpat_file,
+                sets,
+                folds,
+                chunksize,
+                separator,
+                chunk_stats,
+                memory_budget,
+                spill_dir,
+                set(tallies),
+                pct_field,
+            )
+
+        for label, tally in tallies.items():
+            tally.extend(tallied[label])
+        for label, fold in folds.items():
+            fold.extend(kept.pop(label))
+        return {label: _finalize(_concat_kept(parts), keys) for label, parts in kept.items()}
+
+
+def iter_regpat_rows(regpat_file: Path, chunksize: int = 1_000_000, separator: str = "\t") -> Iterator[pd.DataFrame]:
+    """
+    Every RegPat row with a well-formed pct_nbr and a ctry_code, in chunks of
+    pct_key, ctry_code and inv_share (float64), from a text file or a store.
+    """
+    if is_regpat_store(regpat_file):
+        parquet = pq.ParquetFile(Path(regpat_file) / STORE_DATA_FILE)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=["pct_key", "ctry_code", "inv_share"]):
+            yield batch.to_pandas().astype({"ctry_code": "string"})
+        return
+    for chunk in _read_chunks(regpat_file, separator, chunksize, None):
+        chunk = chunk.dropna(subset=["pct_nbr", "ctry_code"])
+        pct_keys = encode_pct_nbr(chunk["pct_nbr"])
+        valid = pct_keys != INVALID_KEY
+        yield pd.DataFrame(
+            {
+                "pct_key": pct_keys[valid],
+                "ctry_code": chunk["ctry_code"].array[valid],
+                "inv_share": pd.to_numeric(chunk["inv_share"], errors="coerce").astype("float64").to_numpy()[valid],
+            }
+        )
+
+
+def _scan_source(
+    source,
+    sets: dict[str, PctKeySet],
+    folds: dict[str, CountFold],
+    chunksize: int,
+    separator: str,
+    chunk_stats: list[dict] | None = None,
+    memory_budget: int | None = None,
+    spill_dir: str | None = None,
+    tallied_labels: set[str] = frozenset(),
+    pct_field: int | None = None,
+    ranges: tuple[np.ndarray, np.ndarray] | None = None,
+) -> tuple[dict[str, list], dict[str, list]]:
+    """
+    Matched rows per label: chunk frames, or CountFold partials for labels in
+    folds. With memory_budget, frames held past its share are spilled to
+    Parquet files in spill_dir and listed by path instead. Also returns the
+    MatchTally partials of each label in tallied_labels. With pct_field, lines
+    are pre-filtered on that field before parsing; with ranges (offsets and
+    lengths from an index), only those bytes of source are read.
+    """
+    union = _union(sets)
+    kept: dict[str, list] = {label: [] for label in sets}
+    tallied: dict[str, list] = {label: [] for label in tallied_labels}
+    held_budget = memory_budget * (1 - CHUNK_SHARE) if memory_budget is not None else None
+    held = 0
+    started = time.perf_counter()
+    if ranges is not None:
+        chunks = _indexed_chunks(source, separator, ranges, memory_budget)
+    elif pct_field is not None:
+        chunks = _prefiltered_chunks(source, separator, pct_field, union, memory_budget)
+    else:
+        chunks = ((chunk, {"rows": len(chunk)}) for chunk in _read_chunks(source, separator, chunksize, memory_budget))
+    for chunk, info in chunks:
+        chunk = chunk.dropna(subset=["pct_nbr", "ctry_code"])
+        pct_keys = encode_pct_nbr(chunk["pct_nbr"])
+        mask = union.contains(pct_keys)
+        n_kept = int(mask.sum())
+        stats = {**info, "rows_kept": n_kept}
+        if chunk_stats is not None:
+            now = time.perf_counter()
+            # Includes parsing the chunk, which read_csv does while iterating.
+            stats["seconds"] = round(now - started, 4)
+            chunk_stats.append(stats)
+            started = now
+        if not n_kept:
+            continue
+        chunk = chunk[mask]
+        chunk.insert(chunk.columns.get_loc("pct_nbr") + 1, "pct_key", pct_keys[mask])
+        # inv_share might be read as string depending on file quirks. Always
+        # float64 so the dtype does not depend on where chunks are cut.
+        chunk["inv_share"] = pd.to_numeric(chunk["inv_share"], errors="coerce").astype("float64")
+        for label, pct_set in sets.items():
+            part = _route(chunk, pct_set, len(sets))
+            if part.empty:
+                continue
+            if label in tallied:
+                tallied[label].append(MatchTally.partial(part))
+            if label in folds:
+                kept[label].append(folds[label].partial(part))
+            else:
+                kept[label].append(part)
+                if held_budget is not None:
+                    held += _bytes_per_row(part) * len(part)
+        if held_budget is not None and held > held_budget:
+            stats["rows_spilled"] = _spill(kept, folds, spill_dir)
+            held = 0
+    return kept, tallied
+
+
+def _read_chunks(source, separator: str, chunksize: int, memory_budget: int | None) -> Iterator[pd.DataFrame]:
+    """
+    read_csv chunks of chunksize rows or, with memory_budget, of as many rows
+    as keep one chunk and its processing within CHUNK_SHARE of the budget,
+    judged from the bytes per row of the chunk before.
+    """
+    size = chunksize if memory_budget is None else min(chunksize, PROBE_ROWS)
+    plain = not isinstance(source, (str, Path)) or compression_of(source) is None
+    with nullcontext(source) if plain else open_regpat(source) as handle, pd.read_csv(
+        handle,
         sep=separator,
         dtype={"pct_nbr": "string", "ctry_code": "string"},
         usecols=lambda c: c in set(REGPAT_USECOLS),
-        chunksize=chunksize,
+        # Fields always map to the header from the left, even when the first
+        # line read has a trailing extra field; blocks then parse like the file.
+        index_col=False,
+        iterator=True,
         low_memory=False,
-    ):
-        chunk = chunk.dropna(subset=["pct_nbr", "ctry_code"])
-        chunk = chunk[chunk["pct_nbr"].isin(pct_set)]
-        if not chunk.empty:
-            # inv_share might be read as string depending on file quirks
-            chunk["inv_share"] = pd.to_numeric(chunk["inv_share"], errors="coerce")
-            kept.append(chunk)
+        memory_map=isinstance(handle, (str, Path)),
+    ) as reader:
+        while True:
+            try:
+                chunk = reader.get_chunk(size)
+            except StopIteration:
+                return
+            if chunk.empty:
+                return
+            if memory_budget is not None:
+                per_row = _bytes_per_row(chunk) * CHUNK_OVERHEAD
+                size = max(MIN_CHUNK_ROWS, int(memory_budget * CHUNK_SHARE / per_row))
+            yield chunk
 
-    if not kept:
-        return pd.DataFrame(columns=REGPAT_USECOLS)
 
+def _prefiltered_chunks(
+    source,
+    separator: str,
+    pct_field: int,
+    union: PctKeySet,
+    memory_budget: int | None,
+) -> Iterator[tuple[pd.DataFrame, dict]]:
+    """
+    (parsed rows, stats) per raw block of source: the parsed rows are only
+    the lines whose pct_nbr field is in union, or the whole block when it
+    cannot be filtered exactly.
+    """
+    sep = ord(separator)
+    size = _block_bytes(memory_budget)
+    with line_blocks(source, lambda: size) as (header, blocks):
+        if not header.endswith(b"\n"):
+            header += b"\n"
+        n_fields = header.count(separator.encode("ascii")) + 1
+        for block in blocks:
+            lines = _matching_lines(block, sep, n_fields, pct_field, union)
+            if lines is None:
+                chunk = _parse(header + block, separator)
+                parsed_bytes = len(block)
+                stats = {"rows": len(chunk), "rows_parsed": len(chunk)}
+            else:
+                starts, ends, n_lines = lines
+                body = b"\n".join(block[start:end] for start, end in zip(starts.tolist(), ends.tolist()))
+                chunk = _parse(header + body, separator)
+                parsed_bytes = len(body)
+                stats = {"rows": n_lines, "rows_parsed": len(chunk)}
+            if memory_budget is not None and len(chunk):
+                size = _block_bytes(memory_budget, _bytes_per_row(chunk) * len(chunk) / parsed_bytes)
+            yield chunk, stats
+
+
+def _indexed_chunks(
+    source: Path,
+    separator: str,
+    ranges: tuple[np.ndarray, np.ndarray],
+    memory_budget: int | None,
+) -> Iterator[tuple[pd.DataFrame, dict]]:
+    """(parsed rows, stats) per block of the byte ranges an index picked; one empty chunk if there are none."""
+    with open(source, "rb") as fh:
+        header = fh.readline()
+    if not header.endswith(b"\n"):
+        header += b"\n"
+    offsets, lengths = ranges
+    if not len(offsets):
+        yield _parse(header, separator), {"rows": 0, "bytes": 0, "index": True}
+        return
+    size = _block_bytes(memory_budget)
+    for block in range_blocks(source, offsets, lengths, lambda: size):
+        chunk = _parse(header + block, separator)
+        if memory_budget is not None and len(chunk):
+            size = _block_bytes(memory_budget, _bytes_per_row(chunk) * len(chunk) / len(block))
+        yield chunk, {"rows": len(chunk), "bytes": len(block), "index": True}
+
+
+def _index_ranges(
+    regpat_file: Path, separator: str, wanted: PctKeySet
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    Byte ranges to read from a fresh sidecar index, or None when there is
+    none or the wanted lines are too large a share of the file: judged first
+    from the pct list's size, then from the ranges themselves.
+    """
+    index = RegpatIndex.open(regpat_file, separator)
+    if index is None:
+        return None
+    limit = MAX_INDEX_SHARE * index.meta["source_size"]
+    if len(wanted) * index.bytes_per_pct > limit:
+        return None
+    offsets, lengths = index.ranges(wanted)
+    if lengths.sum() > limit:
+        return None
+    return offsets, lengths
+
+
+def _block_bytes(memory_budget: int | None, parsed_per_raw_byte: float = 0.0) -> int:
+    """
+    Raw bytes per block read before parsing: PREFILTER_BLOCK_BYTES, less under
+    a tight budget. parsed_per_raw_byte is the in-memory size of the rows
+    parsed from the block before over their raw size; a block that has to be
+    parsed whole then takes CHUNK_OVERHEAD times that at its peak.
+    """
+    if memory_budget is None:
+        return PREFILTER_BLOCK_BYTES
+    overhead = max(PREFILTER_OVERHEAD, parsed_per_raw_byte * CHUNK_OVERHEAD)
+    share = int(memory_budget * CHUNK_SHARE / overhead)
+    return min(PREFILTER_BLOCK_BYTES, max(MIN_PREFILTER_BLOCK_BYTES, share))
+
+
+def _matching_lines(
+    block, sep: int, n_fields: int, pct_field: int, union: PctKeySet
+) -> tuple[np.ndarray, np.ndarray, int] | None:
+    """
+    Start and end offsets of the lines of block whose pct_nbr field is in
+    union, and the number of non-blank lines; None when line_keys cannot
+    split the block.
+    """
+    lines = line_keys(block, sep, n_fields, pct_field)
+    if lines is None:
+        return None
+    starts, ends, _, keys = lines
+    keep = union.contains(keys)
+    return starts[keep], ends[keep], len(starts)
+
+
+def _parse(data: bytes, separator: str) -> pd.DataFrame:
+    return pd.read_csv(
+        io.BytesIO(data),
+        sep=separator,
+        dtype={"pct_nbr": "string", "ctry_code": "string"},
+        usecols=lambda c: c in set(REGPAT_USECOLS),
+        index_col=False,
+        low_memory=False,
+    )
+
+
+def _bytes_per_row(frame: pd.DataFrame, sample: int = 10_000) -> float:
+    """In-memory bytes per row (string contents included), measured on the first rows."""
+    head = frame.head(sample)
+    return head.memory_usage(deep=True, index=False).sum() / max(len(head), 1)
+
+
+def _spill(kept: dict[str, list], folds: dict[str, CountFold], spill_dir: str) -> int:
+    """Writes the frames held for each label to one Parquet file, keeping its place in the list."""
+    n_rows = 0
+    for label, parts in kept.items():
+        frames = [part for part in parts if isinstance(part, pd.DataFrame)]
+        if label in folds or not frames:
+            continue
+        fd, path = tempfile.mkstemp(suffix=".parquet", dir=spill_dir)
+        os.close(fd)
+        frame = pd.concat(frames, ignore_index=True)
+        frame.to_parquet(path, index=False)
+        n_rows += len(frame)
+        kept[label] = [part for part in parts if isinstance(part, Path)] + [Path(path)]
+    return n_rows
+
+
+def _load_parallel(
+    regpat_file: Path,
+    sets: dict[str, PctKeySet],
+    folds: dict[str, CountFold],
+    chunksize: int,
+    separator: str,
+    workers: int,
+    chunk_stats: list[dict] | None = None,
+    worker_budget: int | None = None,
+    spill_dir: str | None = None,
+    tallied_labels: set[str] = frozenset(),
+    pct_field: int | None = None,
+) -> tuple[dict[str, list], dict[str, list]]:
+    header, ranges = _byte_ranges(regpat_file, workers * RANGES_PER_WORKER)
+    tasks = [
+        (str(regpat_file), header, start, end, chunksize, separator, worker_budget, spill_dir, tallied_labels, pct_field)
+        for start, end in ranges
+    ]
+
+    kept: dict[str, list] = {label: [] for label in sets}
+    tallied: dict[str, list] = {label: [] for label in tallied_labels}
+    with ProcessPoolExecutor(
+        max_workers=min(workers, max(len(tasks), 1)),
+        initializer=_init_worker,
+        initargs=(sets, folds),
+    ) as pool:
+        # map() yields in submission order, which is file order.
+        for (start, end), (result, tally_parts, stats) in zip(ranges, pool.map(_scan_range, tasks)):
+            for label, parts in result.items():
+                kept[label].extend(parts)
+            for label, parts in tally_parts.items():
+                tallied[label].extend(parts)
+            if chunk_stats is not None:
+                chunk_stats.extend({"byte_range": [start, end], **entry} for entry in stats)
+    return kept, tallied
+
+
+def _byte_ranges(regpat_file: Path, n_ranges: int) -> tuple[bytes, list[tuple[int, int]]]:
+    """Header line plus [start, end) offsets that each begin at a line start."""
+    size = os.path.getsize(regpat_file)
+    with open(regpat_file, "rb") as fh:
+        header = fh.readline()
+        data_start = fh.tell()
+        step = max((size - data_start) // max(n_ranges, 1), 1)
+
+        bounds = [data_start]
+        for target in range(data_start + step, size, step):
+            if target <= bounds[-1]:
+                continue
+            fh.seek(target - 1)
+            fh.readline()  # finish the line that target falls into
+            pos = fh.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+        bounds.append(size)
+
+    ranges = [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    return header, ranges
+
+
+def _init_worker(sets: dict[str, PctKeySet], folds: dict[str, CountFold]) -> None:
+    global _WORKER_SETS, _WORKER_FOLDS
+    _WORKER_SETS = sets
+    _WORKER_FOLDS = folds
+
+
+def _scan_range(task: tuple) -> tuple[dict[str, list], dict[str, list], list[dict]]:
+    path, header, start, end, chunksize, separator, memory_budget, spill_dir, tallied_labels, pct_field = task
+    stats: list[dict] = []
+    with io.BufferedReader(_ByteRange(path, header, start, end), buffer_size=1 << 20) as source:
+        kept, tallied = _scan_source(
+            source,
+            _WORKER_SETS,
+            _WORKER_FOLDS,
+            chunksize,
+            separator,
+            stats,
+            memory_budget,
+            spill_dir,
+            tallied_labels,
+            pct_field,
+        )
+    return kept, tallied, stats
+
+
+class _ByteRange(io.RawIOBase):
+    """The header line followed by bytes [start, end) of a file, read as the parser asks for them."""
+
+    def __init__(self, path: str, header: bytes, start: int, end: int):
+        self._fh = open(path, "rb")
+        self._fh.seek(start)
+        self._header = header
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer)
+        if self._header:
+            n = min(len(view), len(self._header))
+            view[:n] = self._header[:n]
+            self._header = self._header[n:]
+            return n
+        n = self._fh.readinto(view[: min(len(view), self._remaining)])
+        self._remaining -= n
+        return n
+
+    def close(self) -> None:
+        self._fh.close()
+        super().close()
+
+
+def _union(sets: dict[str, PctKeySet]) -> PctKeySet:
+    if len(sets) == 1:
+        return next(iter(sets.values()))
+    return PctKeySet.union(sets.values())
+
+
+def _route(chunk: pd.DataFrame, pct_set: PctKeySet, n_labels: int) -> pd.DataFrame:
+    if n_labels == 1:
+        return chunk.reset_index(drop=True)
+    return chunk[pct_set.contains(chunk["pct_key"].to_numpy())].reset_index(drop=True)
+
+
+def _concat_kept(kept: list[pd.DataFrame | Path]) -> pd.DataFrame:
+    if any(isinstance(part, Path) for part in kept):
+        # Spilled parts: gather as Arrow and convert once, freeing each column as it goes.
+        tables = [
+            pq.read_table(part) if isinstance(part, Path) else pa.Table.from_pandas(part, preserve_index=False)
+            for part in kept
+        ]
+        return pa.concat_tables(tables).to_pandas(self_destruct=True, split_blocks=True)
+    if not kept:
+        return pd.DataFrame(
+            {
+                "pct_nbr": pd.Series(dtype="string"),
+                "pct_key": pd.Series(dtype="int64"),
+                "ctry_code": pd.Series(dtype="string"),
+                "inv_share": pd.Series(dtype="float64"),
+            }
+        )
     return pd.concat(kept, ignore_index=True)
+
+
+def _finalize(frame: pd.DataFrame, keys: bool) -> pd.DataFrame:
+    """Keeps either the int64 pct_key or the pct_nbr string, whichever was asked for."""
+    if keys:
+        return frame.drop(columns=["pct_nbr"], errors="ignore")
+    if "pct_nbr" not in frame.columns:
+        frame.insert(frame.columns.get_loc("pct_key"), "pct_nbr", decode_pct_nbr(frame["pct_key"]).array)
+    return frame.drop(columns=["pct_key"])
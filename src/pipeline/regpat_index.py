@@ -0,0 +1,239 @@
+"""
+Sidecar byte-offset index of a plain RegPat text file.
+
+build_regpat_index writes <regpat_file>.pct_index.parquet with one entry per
+run of consecutive lines sharing a pct_nbr: its key, byte offset, byte
+length and line count, sorted by key. A block whose lines cannot be split
+on raw bytes (see regpat_io.line_keys) is cut at line breaks into smaller
+pieces until they can, or are single lines; those lines are listed under
+INVALID_KEY and read by every lookup, so a lookup parses the same lines a
+full scan keeps.
+The index records the file's size and mtime, and RegpatIndex.open ignores
+an index that no longer matches them.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .pct_codec import INVALID_KEY, PctKeySet
+from .regpat_io import compression_of, line_blocks, line_keys, pct_field_position
+
+
+INDEX_SUFFIX = ".pct_index.parquet"
+INDEX_FORMAT_VERSION = 1
+INDEX_META_KEY = b"regpat_index"
+INDEX_BLOCK_BYTES = 64 << 20
+INDEX_ROW_GROUP_SIZE = 1_000_000
+# A block that cannot be split on raw bytes is cut into INDEX_SPLIT_WAYS
+# pieces, and each of those again, down to pieces of INDEX_MIN_PIECE_BYTES.
+# Where quotes are sparser than one per INDEX_MIN_PIECE_BYTES, the lines
+# holding them are also cut out right away, so a quoted field costs only its
+# own lines.
+INDEX_SPLIT_WAYS = 16
+INDEX_MIN_PIECE_BYTES = 4 << 10
+
+INDEX_SCHEMA = pa.schema(
+    [
+        ("pct_key", pa.int64()),
+        ("offset", pa.int64()),
+        ("length", pa.int64()),
+        ("n_lines", pa.int64()),
+    ]
+)
+
+
+def index_path(regpat_file: Path) -> Path:
+    return Path(str(regpat_file) + INDEX_SUFFIX)
+
+
+def build_regpat_index(regpat_file: Path, separator: str = "\t") -> dict:
+    """Writes the sidecar index of regpat_file next to it and returns its metadata."""
+    regpat_file = Path(regpat_file)
+    if compression_of(regpat_file) is not None:
+        raise ValueError(f"{regpat_file} is compressed; an offset index needs the plain text file.")
+    pct_field = pct_field_position(regpat_file, separator)
+    if pct_field is None:
+        raise ValueError(f"Cannot find a pct_nbr column in the header of {regpat_file} split on {separator!r}.")
+    stat = regpat_file.stat()
+
+    sep = ord(separator)
+    tables = []
+    n_lines = 0
+    unsplit_bytes = 0
+    with line_blocks(regpat_file, INDEX_BLOCK_BYTES) as (header, blocks):
+        n_fields = header.count(separator.encode("ascii")) + 1
+        offset = len(header)
+        for block in blocks:
+            block_tables, block_lines, block_unsplit = _block_entries(block, offset, sep, n_fields, pct_field)
+            tables += block_tables
+            n_lines += block_lines
+            unsplit_bytes += block_unsplit
+            offset += len(block)
+
+    table = pa.concat_tables(tables) if tables else INDEX_SCHEMA.empty_table()
+    table = table.sort_by([("pct_key", "ascending"), ("offset", "ascending")])
+    keys = table["pct_key"].to_numpy()
+    meta = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "created_utc": datetime.now(timezone.utc).isoformat(),
+        "source_file": str(regpat_file),
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "separator": separator,
+        "n_lines": n_lines,
+        "n_entries": table.num_rows,
+        "n_pct": int(len(np.unique(keys[keys != INVALID_KEY]))),
+        "unsplit_bytes": unsplit_bytes,
+    }
+    table = table.replace_schema_metadata({INDEX_META_KEY: json.dumps(meta)})
+    pq.write_table(
+        table,
+        index_path(regpat_file),
+        row_group_size=INDEX_ROW_GROUP_SIZE,
+        write_statistics=["pct_key"],
+        compression="zstd",
+    )
+    return meta
+
+
+@dataclass(frozen=True)
+class RegpatIndex:
+    """A fresh sidecar index of a RegPat text file."""
+
+    path: Path
+    meta: dict
+
+    @classmethod
+    def open(cls, regpat_file: Path, separator: str) -> RegpatIndex | None:
+        """The index of regpat_file, or None if there is none or it no longer matches the file."""
+        path = index_path(regpat_file)
+        if not path.is_file():
+            return None
+        schema_meta = pq.read_schema(path).metadata or {}
+        if INDEX_META_KEY not in schema_meta:
+            return None
+        meta = json.loads(schema_meta[INDEX_META_KEY])
+        stat = Path(regpat_file).stat()
+        fresh = (
+            meta.get("format_version") == INDEX_FORMAT_VERSION
+            and meta.get("source_size") == stat.st_size
+            and meta.get("source_mtime") == stat.st_mtime
+            and meta.get("separator") == separator
+        )
+        return cls(path, meta) if fresh else None
+
+    @property
+    def bytes_per_pct(self) -> float:
+        return self.meta["source_size"] / max(self.meta["n_pct"], 1)
+
+    def ranges(self, wanted: PctKeySet) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Offsets and lengths, in file order and with adjacent ranges merged,
+        of the lines that can hold a wanted pct number. Only the row groups
+        whose pct_key range can contain one are read.
+        """
+        pf = pq.ParquetFile(self.path)
+        key_idx = pf.schema_arrow.get_field_index("pct_key")
+        row_groups = []
+        for i in range(pf.num_row_groups):
+            stats = pf.metadata.row_group(i).column(key_idx).statistics
+            if stats is None or not stats.has_min_max or stats.min == INVALID_KEY:
+                row_groups.append(i)
+                continue
+            pos = np.searchsorted(wanted.keys, stats.min, side="left")
+            if pos < len(wanted.keys) and wanted.keys[pos] <= stats.max:
+                row_groups.append(i)
+
+        table = pf.read_row_groups(row_groups) if row_groups else INDEX_SCHEMA.empty_table()
+        keys = table["pct_key"].to_numpy()
+        hit = wanted.contains(keys) | (keys == INVALID_KEY)
+        offsets = table["offset"].to_numpy()[hit]
+        lengths = table["length"].to_numpy()[hit]
+        order = np.argsort(offsets, kind="stable")
+        return _merge_adjacent(offsets[order], lengths[order])
+
+
+def _block_entries(block, offset: int, sep: int, n_fields: int, pct_field: int) -> tuple[list[pa.Table], int, int]:
+    """
+    Index entries of block (which starts at offset in the file), its number
+    of lines and how many of its bytes are listed under INVALID_KEY.
+    """
+    lines = line_keys(block, sep, n_fields, pct_field)
+    if lines is not None:
+        starts, _, stops, keys = lines
+        if not len(keys):
+            return [], 0, 0
+        new_run = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        first = np.concatenate(([0], new_run))
+        last = np.concatenate((new_run - 1, [len(keys) - 1]))
+        keyed = keys[first] != INVALID_KEY
+        entries = _entries(
+            keys[first][keyed],
+            offset + starts[first][keyed],
+            (stops[last] - starts[first])[keyed],
+            (last - first + 1)[keyed],
+        )
+        return [entries], len(keys), 0
+
+    buf = np.frombuffer(block, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == ord("\n"))
+    # Line starts inside the block where a record can end: not inside a quoted
+    # field, which may hold line breaks.
+    quotes = _field_quotes(buf, sep)
+    outside = np.searchsorted(quotes, newlines) % 2 == 0
+    cuts = newlines[outside & (newlines < len(block) - 1)] + 1
+    pieces = []
+    if len(cuts) and len(block) >= INDEX_SPLIT_WAYS * INDEX_MIN_PIECE_BYTES:
+        even = np.arange(1, INDEX_SPLIT_WAYS) * len(block) // INDEX_SPLIT_WAYS
+        pieces.append(cuts[np.minimum(np.searchsorted(cuts, even), len(cuts) - 1)])
+    if len(cuts) and len(quotes) * INDEX_MIN_PIECE_BYTES <= len(block):
+        after = np.searchsorted(cuts, quotes, side="right")
+        pieces += [cuts[after[after < len(cuts)]], cuts[after[after > 0] - 1]]
+    cuts = np.unique(np.concatenate(pieces)) if pieces else cuts[:0]
+    if not len(cuts):
+        n_lines = max(len(newlines), 1)
+        return [_entries([INVALID_KEY], [offset], [len(block)], [n_lines])], n_lines, len(block)
+    bounds = [0, *cuts.tolist(), len(block)]
+    tables, n_lines, unsplit_bytes = [], 0, 0
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        piece_tables, piece_lines, piece_unsplit = _block_entries(block[start:end], offset + start, sep, n_fields, pct_field)
+        tables += piece_tables
+        n_lines += piece_lines
+        unsplit_bytes += piece_unsplit
+    return tables, n_lines, unsplit_bytes
+
+
+def _field_quotes(buf: np.ndarray, sep: int) -> np.ndarray:
+    """
+    Offsets of the quotes in buf that open or close a field (next to a
+    separator or line break); quotes within a field's text are left out.
+    """
+    quotes = np.flatnonzero(buf == ord('"'))
+    boundary = np.array([sep, ord("\n"), ord("\r")], dtype=np.uint8)
+    before = np.isin(buf[np.maximum(quotes - 1, 0)], boundary) | (quotes == 0)
+    after = np.isin(buf[np.minimum(quotes + 1, len(buf) - 1)], boundary) | (quotes == len(buf) - 1)
+    return quotes[before | after]
+
+
+def _entries(keys, offsets, lengths, n_lines) -> pa.Table:
+    return pa.Table.from_arrays(
+        [pa.array(np.asarray(column, dtype=np.int64)) for column in (keys, offsets, lengths, n_lines)],
+        schema=INDEX_SCHEMA,
+    )
+
+
+def _merge_adjacent(offsets: np.ndarray, lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    if not len(offsets):
+        return offsets, lengths
+    ends = offsets + lengths
+    starts_run = np.concatenate(([True], offsets[1:] != ends[:-1]))
+    first = np.flatnonzero(starts_run)
+    last = np.concatenate((first[1:] - 1, [len(offsets) - 1]))
+    return offsets[first], ends[last] - offsets[first]
@@ -0,0 +1,257 @@
+"""
+Reading RegPat text files, plain or compressed, and splitting raw blocks of
+them into lines and pct_nbr keys without the CSV parser.
+
+gzip, bzip2 and zstd files are recognised by their first bytes, whatever
+their name, and decompressed on a background thread while the parser reads
+the previous blocks (zlib, bz2 and zstandard release the GIL, so the two
+overlap). zstd needs the optional zstandard package. Plain files are
+memory-mapped.
+"""
+from __future__ import annotations
+
+import codecs
+import io
+import mmap
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator
+
+import numpy as np
+
+from .pct_codec import encode_pct_fields
+
+
+MAGIC = {b"\x1f\x8b": "gzip", b"BZh": "bz2", b"\x28\xb5\x2f\xfd": "zstd"}
+
+# Decompressed bytes per read-ahead block, and how many blocks may wait for the parser.
+READ_AHEAD_BYTES = 4 << 20
+READ_AHEAD_BLOCKS = 4
+
+
+def compression_of(path: Path) -> str | None:
+    """"gzip", "bz2" or "zstd" from the file's magic bytes, None for plain text."""
+    with open(path, "rb") as fh:
+        head = fh.read(4)
+    for magic, name in MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_regpat(path: Path) -> BinaryIO:
+    """Binary file object over the (decompressed) contents of path."""
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, "rb")
+    return io.BufferedReader(_ReadAhead(_decompressed(path, compression)), buffer_size=1 << 20)
+
+
+def pct_field_position(path: Path, separator: str) -> int | None:
+    """Position of pct_nbr among the header's fields, or None if lines cannot be split on raw bytes."""
+    if len(separator) != 1 or not separator.isascii() or separator in "\"\r\n":
+        return None
+    with open_regpat(path) as fh:
+        header = fh.readline()
+    header = header.removeprefix(codecs.BOM_UTF8).rstrip(b"\r\n")
+    if b'"' in header or b"\r" in header:
+        return None
+    names = header.split(separator.encode("ascii"))
+    return names.index(b"pct_nbr") if b"pct_nbr" in names else None
+
+
+def line_keys(
+    block, sep: int, n_fields: int, pct_field: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] | None:
+    """
+    Start, end (before the line break) and stop (after it) offsets of the
+    non-blank lines of block, with the key of each one's pct_nbr field. None
+    when the block holds something read_csv would not split as plainly:
+    quotes, a carriage return not ending a line, or a line with another
+    number of fields than n_fields.
+    """
+    buf = np.frombuffer(block, dtype=np.uint8)
+    if not len(buf):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    if (buf == ord('"')).any():
+        return None
+    newlines = np.flatnonzero(buf == ord("\n"))
+    ends = newlines if buf[-1] == ord("\n") else np.append(newlines, len(buf))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    stops = np.minimum(ends + 1, len(buf))
+    returns = np.flatnonzero(buf == ord("\r"))
+    if len(returns):
+        if returns[-1] + 1 >= len(buf) or not (buf[returns + 1] == ord("\n")).all():
+            return None
+        ends = ends - (buf[np.maximum(ends - 1, 0)] == ord("\r")) * (ends > starts)
+    # read_csv skips blank lines.
+    filled = ends > starts
+    starts, ends, stops = starts[filled], ends[filled], stops[filled]
+
+    seps = np.flatnonzero(buf == sep)
+    first = np.searchsorted(seps, starts)
+    if not (np.searchsorted(seps, ends) - first == n_fields - 1).all():
+        return None
+    field_start = starts if pct_field == 0 else seps[first + pct_field - 1] + 1
+    field_end = ends if pct_field == n_fields - 1 else seps[first + pct_field]
+    return starts, ends, stops, encode_pct_fields(buf, field_start, field_end)
+
+
+@contextmanager
+def line_blocks(source, block_bytes: int | Callable[[], int]) -> Iterator[tuple[bytes, Iterator]]:
+    """
+    The header line and an iterator of blocks of about block_bytes that each
+    end with a complete line. block_bytes may be a function, called before
+    each block, so the size can change as the blocks are read. source is a
+    path (plain files are memory-mapped and blocks are views of the map) or
+    a binary file object.
+    """
+    if not callable(block_bytes):
+        fixed = block_bytes
+        block_bytes = lambda: fixed
+    if isinstance(source, (str, Path)) and compression_of(source) is None:
+        with open(source, "rb") as fh:
+            size = fh.seek(0, io.SEEK_END)
+            # The map stays alive for as long as a block viewing it does.
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        header_end = _line_end(mapped, 0)
+        yield bytes(mapped[:header_end]), _mapped_blocks(mapped, header_end, block_bytes)
+        return
+
+    with open_regpat(source) if isinstance(source, (str, Path)) else _borrowed(source) as fh:
+        yield fh.readline(), _read_blocks(fh, block_bytes)
+
+
+def range_blocks(
+    path: Path, offsets: np.ndarray, lengths: np.ndarray, block_bytes: int | Callable[[], int]
+) -> Iterator[bytes]:
+    """
+    Bytes [offset, offset + length) of a memory-mapped plain file for each
+    range, in the order given, joined into blocks of about block_bytes (an
+    int, or a function called before each block as in line_blocks). Ranges
+    hold whole lines; a last line without a line break gets one.
+    """
+    if not callable(block_bytes):
+        fixed = block_bytes
+        block_bytes = lambda: fixed
+    if not len(offsets):
+        return
+    with open(path, "rb") as fh:
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    with mapped:
+        parts, size, limit = [], 0, block_bytes()
+        for offset, length in zip(offsets.tolist(), lengths.tolist()):
+            part = mapped[offset : offset + length]
+            parts.append(part if part.endswith(b"\n") else part + b"\n")
+            size += length
+            if size >= limit:
+                yield b"".join(parts)
+                parts, size, limit = [], 0, block_bytes()
+        if parts:
+            yield b"".join(parts)
+
+
+def _mapped_blocks(mapped, start: int, block_bytes: Callable[[], int]) -> Iterator[memoryview]:
+    view = memoryview(mapped)
+    while start < len(mapped):
+        end = _line_end(mapped, min(start + block_bytes(), len(mapped)) - 1)
+        yield view[start:end]
+        start = end
+
+
+def _line_end(mapped, pos: int) -> int:
+    """Offset just past the newline at or after pos (or the end of the data)."""
+    newline = mapped.find(b"\n", pos)
+    return len(mapped) if newline < 0 else newline + 1
+
+
+def _read_blocks(fh: BinaryIO, block_bytes: Callable[[], int]) -> Iterator[bytes]:
+    while True:
+        block = fh.read(block_bytes())
+        if not block:
+            return
+        if not block.endswith(b"\n"):
+            block += fh.readline()  # finish the last line
+        yield block
+
+
+@contextmanager
+def _borrowed(fh: BinaryIO) -> Iterator[BinaryIO]:
+    yield fh
+
+
+def _decompressed(path: Path, compression: str) -> BinaryIO:
+    if compression == "gzip":
+        import gzip
+
+        return gzip.open(path, "rb")
+    if compression == "bz2":
+        import bz2
+
+        return bz2.open(path, "rb")
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError(f"{path} is zstd-compressed; reading it needs the zstandard package.") from None
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+
+
+class _ReadAhead(io.RawIOBase):
+    """Reads a file object on a background thread, READ_AHEAD_BLOCKS blocks ahead of the consumer."""
+
+    def __init__(self, raw: BinaryIO):
+        self._raw = raw
+        self._queue: queue.Queue = queue.Queue(maxsize=READ_AHEAD_BLOCKS)
+        self._stop = threading.Event()
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, name="regpat-read-ahead", daemon=True)
+        self._thread.start()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._pending = memoryview(item)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._raw.close()
+        super().close()
+
+    def _fill(self) -> None:
+        try:
+            while not self._stop.is_set():
+                block = self._raw.read(READ_AHEAD_BYTES)
+                self._put(block)
+                if not block:
+                    return
+        except BaseException as exc:  # handed to the reading thread
+            self._put(exc)
+
+    def _put(self, item) -> None:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
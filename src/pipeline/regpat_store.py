@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .pct_codec import INVALID_KEY, PctKeySet, decode_pct_nbr, encode_pct_nbr
+from .regpat_io import open_regpat
+
+
+STORE_FORMAT_VERSION = 2
+STORE_DATA_FILE = "regpat.parquet"
+STORE_META_FILE = "_store.json"
+STORE_COLUMNS = ["pct_key", "ctry_code", "inv_share"]
+
+STORE_SCHEMA = pa.schema(
+    [
+        ("pct_key", pa.int64()),
+        ("ctry_code", pa.string()),
+        ("inv_share", pa.float64()),
+    ]
+)
+
+
+def is_regpat_store(path: Path) -> bool:
+    path = Path(path)
+    return path.is_dir() and (path / STORE_META_FILE).exists()
+
+
+def ingest_regpat(
+    regpat_file: Path,
+    store_dir: Path,
+    chunksize: int = 1_000_000,
+    separator: str = "\t",
+    row_group_size: int = 100_000,
+) -> dict:
+    """
+    Converts OECD regpat.txt (plain or compressed) into a Parquet store sorted by pct_key.
+
+    Only the columns the pipeline reads are kept, already typed, and pct_nbr
+    is stored as its int64 key (see pct_codec). Rows are written in row groups
+    of row_group_size so that min/max statistics on pct_key let the loader
+    skip every row group without a wanted pct_nbr.
+    """
+    regpat_file = Path(regpat_file)
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    tables = []
+    n_unkeyed = 0
+    with open_regpat(regpat_file) as source:
+        for chunk in pd.read_csv(
+            source,
+            sep=separator,
+            dtype={"pct_nbr": "string", "ctry_code": "string"},
+            usecols=lambda c: c in {"pct_nbr", "ctry_code", "inv_share"},
+            index_col=False,
+            chunksize=chunksize,
+            low_memory=False,
+        ):
+            chunk = chunk.dropna(subset=["pct_nbr", "ctry_code"])
+            pct_keys = encode_pct_nbr(chunk["pct_nbr"])
+            valid = pct_keys != INVALID_KEY
+            n_unkeyed += int((~valid).sum())
+            typed = pd.DataFrame(
+                {
+                    "pct_key": pct_keys[valid],
+                    "ctry_code": chunk["ctry_code"].to_numpy()[valid],
+                    "inv_share": pd.to_numeric(chunk["inv_share"], errors="coerce").astype("float64").to_numpy()[valid],
+                }
+            )
+            tables.append(pa.Table.from_pandas(typed, schema=STORE_SCHEMA, preserve_index=False))
+
+    table = pa.concat_tables(tables) if tables else STORE_SCHEMA.empty_table()
+    table = table.sort_by("pct_key")
+    pq.write_table(
+        table,
+        store_dir / STORE_DATA_FILE,
+        row_group_size=row_group_size,
+        write_statistics=["pct_key"],
+        compression="zstd",
+    )
+
+    stat = regpat_file.stat()
+    meta = {
+        "format_version": STORE_FORMAT_VERSION,
+        "created_utc": datetime.now(timezone.utc).isoformat(),
+        "source_file": str(regpat_file),
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "separator": separator,
+        "n_rows": table.num_rows,
+        "n_rows_without_key": n_unkeyed,
+        "n_row_groups": pq.ParquetFile(store_dir / STORE_DATA_FILE).num_row_groups,
+        "row_group_size": row_group_size,
+    }
+    (store_dir / STORE_META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+def load_store_filtered(store_dir: Path, pct_nbrs, keys: bool = False, chunk_stats: list[dict] | None = None) -> pd.DataFrame:
+    """
+    Reads only the row groups of a RegPat store whose pct_key range can
+    contain one of pct_nbrs, then keeps the exact matches.
+
+    pct_nbrs may be strings, int64 keys or a PctKeySet. The result has
+    pct_nbr strings, or pct_key when keys=True. If chunk_stats is given, the row
+    groups, rows and compressed bytes read are appended to it.
+    """
+    store_dir = Path(store_dir)
+    meta = json.loads((store_dir / STORE_META_FILE).read_text(encoding="utf-8"))
+    if meta.get("format_version") != STORE_FORMAT_VERSION:
+        raise ValueError(
+            f"RegPat store at {store_dir} has format {meta.get('format_version')}, "
+            f"expected {STORE_FORMAT_VERSION}. Re-run ingest-regpat."
+        )
+
+    wanted = pct_nbrs if isinstance(pct_nbrs, PctKeySet) else PctKeySet(pct_nbrs)
+    pf = pq.ParquetFile(store_dir / STORE_DATA_FILE)
+    key_idx = pf.schema_arrow.get_field_index("pct_key")
+
+    row_groups = []
+    for i in range(pf.num_row_groups):
+        stats = pf.metadata.row_group(i).column(key_idx).statistics
+        if stats is None or not stats.has_min_max:
+            row_groups.append(i)
+            continue
+        # First wanted key >= min must also be <= max for the group to matter.
+        pos = np.searchsorted(wanted.keys, stats.min, side="left")
+        if pos < len(wanted.keys) and wanted.keys[pos] <= stats.max:
+            row_groups.append(i)
+
+    started = time.perf_counter()
+    if not row_groups or len(wanted) == 0:
+        row_groups = []
+        table = STORE_SCHEMA.empty_table()
+    else:
+        table = pf.read_row_groups(row_groups, columns=STORE_COLUMNS)
+        table = table.filter(pc.is_in(table["pct_key"], value_set=pa.array(wanted.keys, type=pa.int64())))
+    if chunk_stats is not None:
+        chunk_stats.append(
+            {
+                "row_groups_read": len(row_groups),
+                "row_groups": pf.num_row_groups,
+                "rows": sum(pf.metadata.row_group(i).num_rows for i in row_groups),
+                "rows_kept": table.num_rows,
+                "bytes": sum(_compressed_size(pf.metadata.row_group(i)) for i in row_groups),
+                "seconds": round(time.perf_counter() - started, 4),
+            }
+        )
+
+    df = table.to_pandas().astype({"pct_key": "int64", "ctry_code": "string", "inv_share": "float64"})
+    if keys:
+        return df
+    df.insert(0, "pct_nbr", decode_pct_nbr(df["pct_key"]).array)
+    return df.drop(columns=["pct_key"])
+
+
+def _compressed_size(row_group: pq.RowGroupMetaData) -> int:
+    return sum(row_group.column(j).total_compressed_size for j in range(row_group.num_columns))
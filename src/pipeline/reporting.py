@@ -0,0 +1,313 @@
+"""
+Charts and tables for the report commands, from fractional counts by
+inventor country and year.
+"""
+from __future__ import annotations
+
+import hashlib
+import inspect
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pandas as pd
+import yaml
+from rich import print
+
+from .cube import query_cube
+from .manifest import StageManifest, fingerprint
+from .tables import slugify
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+
+EU27_CODES = [
+    "AT", "BE", "BG", "HR", "CY", "CZ", "DK", "EE", "FI", "FR", "DE",
+    "GR", "HU", "IE", "IT", "LV", "LT", "LU", "MT", "NL", "PL", "PT",
+    "RO", "SK", "SI", "ES", "SE",
+]
+
+GROUP_DEFINITIONS = [
+    ("US", ["US"]),
+    ("JP", ["JP"]),
+    ("CN", ["CN"]),
+    ("UK", ["UK", "GB"]),
+    ("EU27", EU27_CODES),
+]
+
+
+def load_report_config(path: Path) -> dict:
+    defaults = {"plot_start_year": 1980, "plot_end_year": None}
+    if not path.exists():
+        return defaults
+    data = yaml.safe_load(path.read_text()) or {}
+    return {**defaults, **data}
+
+
+def build_group_series(df: pd.DataFrame, cfg: dict | None = None) -> pd.DataFrame:
+    cfg = cfg or {}
+    start_year = cfg.get("plot_start_year", 1980)
+    end_year = cfg.get("plot_end_year")
+    pivot = (
+        df.pivot_table(
+            index="filing_year",
+            columns="inventor_country",
+            values="fractional_patents",
+            aggfunc="sum",
+            fill_value=0,
+        )
+        .sort_index()
+    )
+    pivot = pivot[pivot.index >= start_year]
+    if end_year:
+        pivot = pivot[pivot.index <= end_year]
+    groups = {}
+    for label, codes in GROUP_DEFINITIONS:
+        existing = [code for code in codes if code in pivot.columns]
+        if existing:
+            groups[label] = pivot[existing].sum(axis=1)
+        else:
+            groups[label] = pd.Series(0.0, index=pivot.index)
+    if groups:
+        selected_sum = sum(groups.values())
+        selected_sum = selected_sum.reindex(pivot.index, fill_value=0)
+    else:
+        selected_sum = pd.Series(0.0, index=pivot.index)
+    total = pivot.sum(axis=1)
+    groups["Rest of World"] = (total - selected_sum).clip(lower=0)
+    return pd.DataFrame(groups)
+
+
+def plot_timeseries(ts: pd.DataFrame, path: Path, title: str, dpi: int = 300) -> None:
+    import matplotlib.pyplot as plt
+
+    palette = plt.get_cmap("tab20")
+    fig, ax = plt.subplots(figsize=(11, 5))
+    for idx, col in enumerate(ts.columns):
+        ax.plot(ts.index, ts[col], label=col, color=palette(idx), linewidth=2)
+    _apply_chad_style(ax, "Filing year", "Fractional patents", title)
+    ax.set_xlim(ts.index.min(), ts.index.max())
+    ax.legend(
+        loc="upper center",
+        frameon=False,
+        fontsize=10,
+        bbox_to_anchor=(0.5, -0.18),
+        ncol=3,
+    )
+    fig.subplots_adjust(left=0.12, right=0.98, top=0.90, bottom=0.28)
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+
+
+def plot_stacked_share(ts: pd.DataFrame, path: Path, title: str, dpi: int = 300) -> None:
+    import matplotlib.pyplot as plt
+
+    # 1. Prepare data
+    share = ts.div(ts.sum(axis=1), axis=0).fillna(0)
+    cols = list(share.columns)
+    
+    # 2. Setup Plot
+    fig, ax = plt.subplots(figsize=(11, 5))
+    palette = plt.get_cmap("tab20")
+    colors = [palette(i) for i in range(len(cols))]
+
+    # 3. Create Stackplot
+    ax.stackplot(
+        share.index,
+        share.values.T,
+        labels=cols,
+        colors=colors,
+        edgecolor='white',
+        linewidth=0.2,
+    )
+
+    # Apply your custom style
+    _apply_chad_style(ax, "Filing year", "Share of fractional patents", title)
+    
+    ax.set_xlim(share.index.min(), share.index.max())
+    ax.set_ylim(0, 1)
+
+    # 4. The Legend (One single line)
+    ax.legend(
+        loc="upper center",
+        bbox_to_anchor=(0.5, -0.12), # Adjust this to bring it closer/further from axis
+        ncol=len(cols),              # Set columns to the number of items
+        frameon=False,
+        fontsize=10,
+        columnspacing=1.0            # Adjust spacing between items if they look cramped
+    )
+
+    # 5. Save Logic
+    # bbox_inches="tight" will automatically expand the PNG to fit the legend
+    fig.savefig(
+        path, 
+        dpi=dpi, 
+        bbox_inches="tight"
+    )
+    plt.close(fig)
+
+
+# Chart kind -> (file name, title prefix, renderer).
+CHARTS = {
+    "timeseries": ("timeseries_selected_countries.png", "Fractional patents by country group", plot_timeseries),
+    "share": ("timeseries_selected_countries_share.png", "Share of fractional patents by country group", plot_stacked_share),
+}
+
+
+def _render_chart(kind: str, ts: pd.DataFrame, path: Path, title: str, dpi: int) -> None:
+    """Process-pool entry point: one chart to one PNG."""
+    CHARTS[kind][2](ts, path, title, dpi)
+
+
+def _plotting_code_version() -> str:
+    """Hash of the plotting functions' source, so style edits re-render cached charts."""
+    funcs = [plot_timeseries, plot_stacked_share, _apply_chad_style, _add_axis_arrowheads, build_group_series]
+    return fingerprint(code=[inspect.getsource(func) for func in funcs])
+
+
+def _apply_chad_style(ax: plt.Axes, xlabel: str, ylabel: str, title: str) -> None:
+    ax.set_title(title, fontsize=13, fontweight="bold", pad=10)
+    ax.set_xlabel(xlabel, fontweight="bold", fontsize=12)
+    ax.set_ylabel(ylabel, fontweight="bold", fontsize=12)
+
+    # Keep real axis lines so ticks don't float
+    ax.spines["left"].set_visible(True)
+    ax.spines["bottom"].set_visible(True)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+
+    # Put ticks/labels outside
+    ax.tick_params(axis="y", left=True, right=False, labelleft=True,
+                   direction="out", pad=10, length=4, width=1.0, labelsize=11)
+    ax.tick_params(axis="x", bottom=True, top=False, labelbottom=True,
+                   direction="out", pad=6, length=4, width=1.0, labelsize=11)
+
+    ax.grid(False)
+
+    # Optional arrowheads only (no extra lines)
+    _add_axis_arrowheads(ax)
+
+
+def _add_axis_arrowheads(ax: plt.Axes) -> None:
+    arrowprops = dict(arrowstyle="-|>", color="black", lw=1.2, mutation_scale=18)
+
+    # short arrowhead at end of x-axis
+    ax.annotate(
+        "",
+        xy=(1.02, 0.0), xytext=(0.97, 0.0),
+        xycoords="axes fraction", textcoords="axes fraction",
+        arrowprops=arrowprops,
+        annotation_clip=False,
+    )
+
+    # short arrowhead at end of y-axis
+    ax.annotate(
+        "",
+        xy=(0.0, 1.02), xytext=(0.0, 0.97),
+        xycoords="axes fraction", textcoords="axes fraction",
+        arrowprops=arrowprops,
+        annotation_clip=False,
+    )
+
+
+def build_top_table(df: pd.DataFrame, recent_start: int) -> pd.DataFrame:
+    min_year = int(df["filing_year"].min())
+    max_year = int(df["filing_year"].max())
+    overall_col = f"fractional_{min_year}_{max_year}"
+    recent_col = f"fractional_{recent_start}_{max_year}"
+
+    overall = df.groupby("inventor_country")["fractional_patents"].sum()
+    recent = (
+        df[df["filing_year"] >= recent_start]
+        .groupby("inventor_country")["fractional_patents"]
+        .sum()
+    )
+
+    table = pd.DataFrame({overall_col: overall, recent_col: recent}).fillna(0)
+    table = table.sort_values(overall_col, ascending=False).reset_index()
+    table = table.rename(columns={"inventor_country": "country"})
+    return table
+
+
+def write_report(df: pd.DataFrame, out_dir: Path, recent_start: int, cfg: dict) -> None:
+    """The report command's charts and top table for one country x year table."""
+    ts = build_group_series(df, cfg)
+    ts_path = out_dir / "timeseries_selected_countries.png"
+    plot_timeseries(ts, ts_path, "Fractional patents by country group")
+    print(f"Saved time-series chart to {ts_path}")
+
+    stack_path = out_dir / "timeseries_selected_countries_share.png"
+    plot_stacked_share(ts, stack_path, "Share of fractional patents by country group")
+    print(f"Saved stacked share chart to {stack_path}")
+
+    table = build_top_table(df, recent_start)
+    table_path = out_dir / "top_patenters.csv"
+    table.to_csv(table_path, index=False)
+    print(f"Saved top patenters table to {table_path}")
+
+
+def render_report_batch(
+    counts_cube: pd.DataFrame,
+    out_dir: Path,
+    recent_start: int,
+    cfg: dict,
+    workers: int,
+    dpi: int = 300,
+    force: bool = False,
+) -> None:
+    """
+    Charts and top tables for every pipeline and category in counts_cube.
+
+    Each slice goes to <out_dir>/<pipeline>/<category or 'all'>/. A chart is
+    re-rendered only when its data, title, style config or plotting code
+    changed since the last render (tracked in <out_dir>/manifest.json).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = StageManifest(out_dir)
+    style = fingerprint(config=cfg, dpi=dpi, code=_plotting_code_version())
+
+    jobs = []
+    n_slices = 0
+    slices = counts_cube[["pipeline", "category"]].drop_duplicates().sort_values(["pipeline", "category"], na_position="first")
+    for pipeline, category in slices.itertuples(index=False):
+        category = None if pd.isna(category) else str(category)
+        df = query_cube(
+            counts_cube,
+            by=["inventor_country", "filing_year"],
+            pipelines=[pipeline],
+            categories=[category] if category is not None else None,
+        )
+        if df.empty:
+            continue
+        n_slices += 1
+        df["filing_year"] = df["filing_year"].astype(int)
+        slice_dir = out_dir / slugify(pipeline) / (slugify(category) if category is not None else "all")
+        slice_dir.mkdir(parents=True, exist_ok=True)
+        build_top_table(df, recent_start).to_csv(slice_dir / "top_patenters.csv", index=False)
+
+        ts = build_group_series(df, cfg)
+        data_hash = hashlib.sha256(ts.to_csv().encode("utf-8")).hexdigest()
+        label = pipeline if category is None else f"{pipeline}, category {category}"
+        for kind, (filename, title_prefix, _) in CHARTS.items():
+            path = slice_dir / filename
+            title = f"{title_prefix} ({label})"
+            chart_fp = fingerprint(data=data_hash, title=title, style=style)
+            key = path.relative_to(out_dir).as_posix()
+            if force or not manifest.is_current(key, chart_fp):
+                jobs.append((key, chart_fp, kind, ts, path, title))
+
+    n_charts = n_slices * len(CHARTS)
+    print(f"{n_slices} slices, {n_charts} charts: {n_charts - len(jobs)} unchanged, {len(jobs)} to render")
+    if jobs:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = {
+                pool.submit(_render_chart, kind, ts, path, title, dpi): (key, chart_fp, path)
+                for key, chart_fp, kind, ts, path, title in jobs
+            }
+            for future in as_completed(futures):
+                key, chart_fp, path = futures[future]
+                future.result()
+                manifest.record(key, chart_fp, [path])
+                print(f"Saved chart to {path}")
+    print(f"Reports under {out_dir}")
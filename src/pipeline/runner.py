@@ -0,0 +1,850 @@
+"""
+Pipeline execution behind the run and run-config commands: BigQuery fetch,
+Stata-like cleaning, RegPat scan and aggregation, each stage skipped when
+its fingerprint is unchanged.
+"""
+from __future__ import annotations
+
+import json
+import shutil
+from concurrent.futures import Future, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import typer
+from rich import print
+
+from . import analysis as analysis_module
+from . import cube as cube_module
+from . import diagnostics as diagnostics_module
+from . import pct_codec as pct_codec_module
+from . import regpat as regpat_module
+from . import regpat_index as regpat_index_module
+from . import regpat_io as regpat_io_module
+from . import regpat_store as regpat_store_module
+from . import transform as transform_module
+from .bq_fetch import (
+    BQConfig,
+    QueryCache,
+    QueryCacheMiss,
+    QueryJobs,
+    peek_query_cache,
+    run_query_cached,
+    run_query_incremental,
+    stream_query_cached,
+    submit_query_cached,
+)
+from .transform import stata_like_pct_nbr
+from .pct_codec import INVALID_KEY, PctKeySet, decode_pct_nbr, encode_pct_nbr
+from .manifest import StageManifest, code_version, file_digest, file_stat_fingerprint, fingerprint
+from .metrics import StageMetrics
+from .regpat import load_regpat_filtered_many
+from .regpat_store import STORE_DATA_FILE, is_regpat_store
+from .cube import CUBE_FILE, build_cube, write_cube
+from .analysis import CountFold, filing_year, fractional_counts_by_category, fractional_counts_by_inventor_country
+from .diagnostics import MATCH_BY_PCT_PARQUET, MATCH_BY_YEAR, MatchTally, match_table, summarize_matches
+from .tables import TABLE_FORMATS, read_table, slugify, table_path, write_table
+
+
+COUNTS_TABLE = "inventor_country_yearly_fractional_counts"
+
+CATEGORY_OUTPUTS = ("csv", "parquet")
+
+
+@dataclass
+class PreparedPipeline:
+    """A pipeline whose pct list is built and that waits for its RegPat rows."""
+
+    label: str
+    query_file: Path
+    regpat_file: Path
+    out_dir: Path
+    cache_dir: Path
+    regpat_sep: str
+    project_id: str
+    location: str
+    category_column: str | None
+    category_output: str
+    # csv, parquet or feather, for the pct list, counts and match diagnostics.
+    output_format: str
+    pct_df: pd.DataFrame
+    pct_keys: np.ndarray
+    bq_cache_info: dict
+    # Keys to look up in RegPat: all of pct_keys, or those of the affected
+    # filing years after an incremental fetch (affected_years is then set).
+    scan_keys: np.ndarray
+    manifest: StageManifest
+    regpat_fingerprint: str
+    # True when the scan stage's outputs already match regpat_fingerprint, so
+    # the RegPat scan can be skipped. With fold, matched rows are summed into
+    # counts during the scan and regpat_fingerprint covers the aggregation too.
+    regpat_current: bool
+    fold: bool
+    stages: dict[str, str]
+    metrics: StageMetrics
+    force: bool = False
+    affected_years: set[int] | None = None
+    # Keys of the pct numbers the incremental fetch returned again.
+    refreshed_keys: np.ndarray | None = None
+
+
+def execute_pipeline(
+    *,
+    label: str | None = None,
+    query_file: Path,
+    regpat_file: Path,
+    out_dir: Path,
+    cache_dir: Path,
+    chunksize: int,
+    regpat_sep: str,
+    project_id: str,
+    location: str,
+    category_column: str | None = None,
+    category_output: str = "csv",
+    output_format: str = "csv",
+    workers: int = 1,
+    query_cache: QueryCache | None = None,
+    query_jobs: QueryJobs | None = None,
+    stream_batch_rows: int | None = None,
+    incremental_column: str | None = None,
+    keep_regpat_filtered: bool = False,
+    force: bool = False,
+    profile: bool = False,
+    memory_budget: int | None = None,
+) -> None:
+    prepared = prepare_pipeline(
+        label=label or Path(query_file).stem,
+        query_file=query_file,
+        regpat_file=regpat_file,
+        out_dir=out_dir,
+        cache_dir=cache_dir,
+        regpat_sep=regpat_sep,
+        project_id=project_id,
+        location=location,
+        category_column=category_column,
+        category_output=category_output,
+        output_format=output_format,
+        query_cache=query_cache,
+        query_jobs=query_jobs,
+        stream_batch_rows=stream_batch_rows,
+        incremental_column=incremental_column,
+        keep_regpat_filtered=keep_regpat_filtered,
+        force=force,
+        profile=profile,
+    )
+
+    scanned, tally = None, None
+    if not prepared.regpat_current:
+        print("[bold]Loading RegPat in chunks and filtering[/bold] ...")
+        results, tallies = _scan_regpat([prepared], chunksize, workers, memory_budget)
+        scanned, tally = results[prepared.label], tallies[prepared.label]
+    finish_pipeline(prepared, scanned, tally)
+
+
+def run_shared_scans(
+    prepared: list[PreparedPipeline], chunksize: int, workers: int, memory_budget: int | None = None
+) -> None:
+    """Finishes prepared pipelines with one RegPat pass per distinct (file, separator)."""
+    scan_groups: dict[tuple[Path, str], list[PreparedPipeline]] = {}
+    for item in prepared:
+        if item.regpat_current:
+            print(f"\n[bold cyan]=== Finishing pipeline: {item.label} ===[/bold cyan]")
+            finish_pipeline(item, None)
+            continue
+        scan_groups.setdefault((item.regpat_file.resolve(), item.regpat_sep), []).append(item)
+
+    for (regpat_file, regpat_sep), items in scan_groups.items():
+        labels = ", ".join(item.label for item in items)
+        print(f"\n[bold]Loading RegPat in chunks and filtering[/bold] for {labels} ...")
+        scanned, tallies = _scan_regpat(items, chunksize, workers, memory_budget)
+        for item in items:
+            print(f"\n[bold cyan]=== Finishing pipeline: {item.label} ===[/bold cyan]")
+            finish_pipeline(item, scanned[item.label], tallies[item.label])
+
+
+def submit_queries(
+    query_files: dict[str, Path],
+    bq_config: BQConfig,
+    query_cache: QueryCache,
+    query_jobs: QueryJobs,
+    incremental_column: str | None = None,
+    stream: bool = False,
+) -> Iterator[str]:
+    """
+    Submits the BigQuery job of every pipeline (label -> query file) whose
+    result is not cached, so they all run at once, and returns the labels in
+    the order their local stages can start: cached ones right away, the
+    others as their jobs finish (failed ones too; preparing them raises).
+    """
+    ready: list[str] = []
+    pending: dict[Future, list[str]] = {}
+    for label, query_file in query_files.items():
+        future = submit_query_cached(
+            query_file,
+            bq_config,
+            query_cache,
+            query_jobs,
+            watermark_column=incremental_column,
+            download=not stream,
+        )
+        if future is None:
+            ready.append(label)
+        else:
+            pending.setdefault(future, []).append(label)
+    if pending:
+        print(f"Submitted {len(pending)} BigQuery job(s); pipelines start as their results arrive")
+    return _arrival_order(ready, pending)
+
+
+def _arrival_order(ready: list[str], pending: dict[Future, list[str]]) -> Iterator[str]:
+    yield from ready
+    for future in as_completed(pending):
+        yield from pending[future]
+
+
+def _scan_regpat(
+    items: list[PreparedPipeline], chunksize: int, workers: int, memory_budget: int | None = None
+) -> tuple[dict[str, pd.DataFrame | CountFold], dict[str, MatchTally]]:
+    """
+    One pass over the RegPat file shared by items; returns each one's matched
+    rows, or its CountFold when it folds, and its MatchTally. The scan's
+    metrics, with per-chunk stats, go to every item (measured once, under
+    the first one).
+    """
+    first = items[0]
+    folds = {item.label: _new_fold(item) for item in items if item.fold}
+    tallies = {item.label: MatchTally(item.scan_keys) for item in items}
+    chunk_stats: list[dict] = []
+    with first.metrics.stage("regpat_scan", status="executed", workers=workers, memory_budget=memory_budget) as record:
+        filtered = load_regpat_filtered_many(
+            first.regpat_file,
+            {item.label: item.scan_keys for item in items},
+            chunksize=chunksize,
+            separator=first.regpat_sep,
+            workers=workers,
+            keys=True,
+            folds=folds,
+            chunk_stats=chunk_stats,
+            memory_budget=memory_budget,
+            tallies=tallies,
+        )
+        record["rows_in"] = sum(entry["rows"] for entry in chunk_stats)
+        record["rows_out"] = sum(entry["rows_kept"] for entry in chunk_stats)
+        record["rows_spilled"] = sum(entry.get("rows_spilled", 0) for entry in chunk_stats)
+        if any(entry.get("index") for entry in chunk_stats):
+            record["regpat_index"] = True
+        if is_regpat_store(first.regpat_file) or record.get("regpat_index"):
+            record["bytes_read"] = sum(entry["bytes"] for entry in chunk_stats)
+        else:
+            record["bytes_read"] = Path(first.regpat_file).stat().st_size
+    scanned = {item.label: folds[item.label] if item.fold else filtered[item.label] for item in items}
+    record["rows_out_by_pipeline"] = {
+        label: result.n_rows if isinstance(result, CountFold) else len(result) for label, result in scanned.items()
+    }
+    record["chunks"] = chunk_stats
+    if len(items) > 1:
+        record["shared_with"] = [item.label for item in items]
+        for item in items[1:]:
+            item.metrics.add(record)
+    return scanned, tallies
+
+
+def prepare_pipeline(
+    *,
+    label: str,
+    query_file: Path,
+    regpat_file: Path,
+    out_dir: Path,
+    cache_dir: Path,
+    regpat_sep: str,
+    project_id: str,
+    location: str,
+    category_column: str | None = None,
+    category_output: str = "csv",
+    output_format: str = "csv",
+    query_cache: QueryCache | None = None,
+    query_jobs: QueryJobs | None = None,
+    stream_batch_rows: int | None = None,
+    incremental_column: str | None = None,
+    keep_regpat_filtered: bool = False,
+    force: bool = False,
+    profile: bool = False,
+) -> PreparedPipeline:
+    """
+    Steps 1-2: BigQuery fetch (or cached result) and Stata-like cleaning.
+
+    Each stage's inputs are fingerprinted into <cache_dir>/manifest.json; a
+    stage whose fingerprint and artifacts are unchanged is reused instead of
+    re-run, unless force is set. Every stage's time, rows and peak memory
+    end up in run_metadata.json; with profile, each stage is also profiled
+    into <out_dir>/profile/.
+    """
+    query_file = Path(query_file)
+    regpat_file = Path(regpat_file)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    query_cache = query_cache or QueryCache(cache_dir=Path("data/processed/bq_cache"))
+    bq_config = BQConfig(project_id=project_id, location=location)
+    extra_cols = ["filing_date"]
+    if category_column:
+        extra_cols.append(category_column)
+    if output_format not in TABLE_FORMATS:
+        raise typer.BadParameter(f"output_format must be one of {', '.join(TABLE_FORMATS)}.")
+    pct_cache = table_path(cache_dir, "pct_from_bq", output_format)
+    manifest = StageManifest(cache_dir)
+    stages: dict[str, str] = {}
+    metrics = StageMetrics(out_dir / "profile" if profile else None)
+
+    if category_output not in CATEGORY_OUTPUTS:
+        raise typer.BadParameter(f"category_output must be one of {', '.join(CATEGORY_OUTPUTS)}.")
+    if stream_batch_rows and incremental_column:
+        raise typer.BadParameter("Streaming and incremental fetches cannot be combined.")
+
+    # On a cache hit the BigQuery result is known without loading it, so an
+    # unchanged pct list can be reused straight away.
+    peeked = None if (incremental_column or force) else peek_query_cache(query_file, bq_config, query_cache)
+    new_rows = None
+    if peeked is not None and manifest.is_current("transform", _transform_fingerprint(peeked, extra_cols, output_format)):
+        print(f"[bold]Reusing pct list[/bold] {pct_cache} (BigQuery result and cleaning unchanged)")
+        with metrics.stage("transform", status="reused", bytes_read=pct_cache.stat().st_size) as record:
+            pct_df = _read_pct_list(pct_cache)
+            record["rows_out"] = len(pct_df)
+        bq_cache_info = peeked
+        stages.update(bq="reused", transform="reused")
+    else:
+        pct_df, bq_cache_info, new_rows = _fetch_and_clean(
+            query_file=query_file,
+            bq_config=bq_config,
+            query_cache=query_cache,
+            query_jobs=query_jobs,
+            cache_dir=cache_dir,
+            category_column=category_column,
+            extra_cols=extra_cols,
+            pct_cache=pct_cache,
+            manifest=manifest,
+            stream_batch_rows=stream_batch_rows,
+            incremental_column=incremental_column,
+            metrics=metrics,
+        )
+        manifest.record("transform", _transform_fingerprint(bq_cache_info, extra_cols, output_format), [pct_cache], n_rows=len(pct_df))
+        stages.update(bq="reused" if bq_cache_info["hit"] else "executed", transform="executed")
+
+    pct_keys = encode_pct_nbr(pct_df["pct_nbr"])
+    affected_years = None
+    refreshed_keys = None
+    if new_rows is not None:
+        print(f"Incremental fetch returned {len(new_rows):,} rows from the watermark on")
+        if _previous_run_reusable(out_dir, cache_dir, regpat_file, category_column):
+            new_pct = stata_like_pct_nbr(new_rows, publication_col="publication_number")["pct_nbr"]
+            affected = pct_df.loc[pct_df["pct_nbr"].isin(new_pct), "filing_date"]
+            affected_years = set(filing_year(affected).dropna().astype(int))
+            refreshed_keys = encode_pct_nbr(new_pct)
+            print(f"Recomputing filing years: {sorted(affected_years) or 'none'}")
+        else:
+            print("No reusable previous run for this RegPat file; recomputing all years")
+    scan_keys = pct_keys
+    if affected_years is not None:
+        scan_keys = pct_keys[filing_year(pct_df["filing_date"]).isin(affected_years).to_numpy()]
+
+    regpat_fp = fingerprint(
+        regpat=file_stat_fingerprint(_regpat_data_path(regpat_file)),
+        separator=regpat_sep,
+        pct_list=file_digest(pct_cache),
+        affected_years=sorted(affected_years) if affected_years is not None else None,
+        # The stage writes its diagnostics (and, folded, the counts) there.
+        out_dir=out_dir.resolve(),
+        code=code_version(
+            regpat_module,
+            regpat_io_module,
+            regpat_index_module,
+            pct_codec_module,
+            regpat_store_module,
+            diagnostics_module,
+        ),
+    )
+    # Incremental runs splice from regpat_filtered.parquet, so they always keep it.
+    fold = not (keep_regpat_filtered or incremental_column)
+    if fold:
+        # Scan and aggregation are one stage: its outputs are the counts.
+        regpat_fp = fingerprint(
+            regpat=regpat_fp,
+            category_column=category_column if category_column in pct_df.columns else None,
+            category_output=category_output,
+            output_format=output_format,
+            label=label,
+            code=code_version(analysis_module, cube_module),
+        )
+
+    return PreparedPipeline(
+        label=label,
+        query_file=query_file,
+        regpat_file=regpat_file,
+        out_dir=out_dir,
+        cache_dir=cache_dir,
+        regpat_sep=regpat_sep,
+        project_id=project_id,
+        location=location,
+        category_column=category_column,
+        category_output=category_output,
+        output_format=output_format,
+        pct_df=pct_df,
+        pct_keys=pct_keys,
+        bq_cache_info=bq_cache_info,
+        scan_keys=scan_keys,
+        manifest=manifest,
+        regpat_fingerprint=regpat_fp,
+        regpat_current=not force and manifest.is_current("fold" if fold else "regpat", regpat_fp),
+        fold=fold,
+        stages=stages,
+        metrics=metrics,
+        force=force,
+        affected_years=affected_years,
+        refreshed_keys=refreshed_keys,
+    )
+
+
+def _fetch_and_clean(
+    *,
+    query_file: Path,
+    bq_config: BQConfig,
+    query_cache: QueryCache,
+    query_jobs: QueryJobs | None,
+    cache_dir: Path,
+    category_column: str | None,
+    extra_cols: list[str],
+    pct_cache: Path,
+    manifest: StageManifest,
+    stream_batch_rows: int | None,
+    incremental_column: str | None,
+    metrics: StageMetrics,
+) -> tuple[pd.DataFrame, dict, pd.DataFrame | None]:
+    print(f"[bold]Running BigQuery query[/bold] from {query_file} ...")
+    new_rows = None
+    # Streaming cleans each batch as it arrives, so its bq stage includes the transform.
+    with metrics.stage("bq", **({"includes_transform": True} if stream_batch_rows else {})) as record:
+        try:
+            if incremental_column:
+                bq_df, new_rows, bq_cache_info = run_query_incremental(
+                    query_file, bq_config, query_cache, watermark_column=incremental_column, jobs=query_jobs
+                )
+            elif stream_batch_rows:
+                print(f"[bold]Streaming and cleaning[/bold] in batches of {stream_batch_rows:,} rows ...")
+                pct_df, bq_cache_info = _stream_pct_list(
+                    query_file, bq_config, query_cache, stream_batch_rows, category_column, pct_cache, query_jobs
+                )
+            else:
+                bq_df, bq_cache_info = run_query_cached(query_file, bq_config, query_cache, jobs=query_jobs)
+        except QueryCacheMiss as exc:
+            raise typer.BadParameter(str(exc)) from exc
+
+        bq_cache = cache_dir / "bq_raw.parquet"
+        if bq_cache_info["hit"]:
+            print(f"Reusing cached BigQuery result {bq_cache_info['path']} (from {bq_cache_info['created_utc']})")
+        bq_fp = fingerprint(key=bq_cache_info["key"], created=bq_cache_info["created_ts"])
+        if not manifest.is_current("bq", bq_fp):
+            shutil.copyfile(bq_cache_info["path"], bq_cache)
+            manifest.record("bq", bq_fp, [bq_cache])
+            print(f"Saved BQ raw to {bq_cache}")
+        record.update(
+            status="reused" if bq_cache_info["hit"] else "executed",
+            rows_out=len(pct_df) if stream_batch_rows else len(bq_df),
+            bytes_read=Path(bq_cache_info["path"]).stat().st_size,
+        )
+
+    if not stream_batch_rows:
+        print("[bold]Applying Stata-like cleaning[/bold] to build pct_nbr ...")
+        with metrics.stage("transform", status="executed", rows_in=len(bq_df)) as record:
+            _check_category_column(category_column, bq_df.columns)
+            pct_df = stata_like_pct_nbr(
+                bq_df,
+                publication_col="publication_number",
+                extra_columns=extra_cols,
+            )
+            write_table(pct_df, pct_cache)
+            record["rows_out"] = len(pct_df)
+    print(f"Saved pct list to {pct_cache} (n={len(pct_df):,})")
+    return pct_df, bq_cache_info, new_rows
+
+
+def _transform_fingerprint(bq_cache_info: dict, extra_cols: list[str], output_format: str) -> str:
+    return fingerprint(
+        bq_key=bq_cache_info["key"],
+        bq_created=bq_cache_info["created_ts"],
+        columns=extra_cols,
+        output_format=output_format,
+        code=code_version(transform_module),
+    )
+
+
+def _read_pct_list(pct_cache: Path) -> pd.DataFrame:
+    if pct_cache.suffix != ".csv":
+        return read_table(pct_cache)
+    pct_df = read_table(pct_cache, dtype={"pct_nbr": str})
+    # Integer columns with gaps come back as float; restore nullable ints so
+    # category names stay the same as on the first run.
+    return pct_df.convert_dtypes(infer_objects=False, convert_string=False, convert_boolean=False)
+
+
+def _stream_pct_list(
+    query_file: Path,
+    bq_config: BQConfig,
+    query_cache: QueryCache,
+    batch_rows: int,
+    category_column: str | None,
+    pct_cache: Path,
+    query_jobs: QueryJobs | None = None,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Cleans the query result batch by batch and writes the new pct numbers of
+    all batches to pct_cache. Only one raw batch is held at a time; the first
+    occurrence of a pct_nbr wins across batches, as in the one-shot path.
+    """
+    extra_cols = ["filing_date", category_column] if category_column else ["filing_date"]
+    batches, bq_cache_info = stream_query_cached(
+        query_file, bq_config, query_cache, batch_rows=batch_rows, jobs=query_jobs
+    )
+    seen: set[str] = set()
+    parts = []
+    for batch in batches:
+        if not parts:
+            _check_category_column(category_column, batch.schema.names)
+        part = stata_like_pct_nbr(
+            batch.to_pandas(),
+            publication_col="publication_number",
+            extra_columns=extra_cols,
+        )
+        part = part[~part["pct_nbr"].isin(seen)]
+        seen.update(part["pct_nbr"])
+        parts.append(part)
+
+    if parts:
+        pct_df = pd.concat(parts, ignore_index=True)
+    else:
+        pct_df = pd.DataFrame({col: pd.Series(dtype=object) for col in ["pct_nbr", *extra_cols]})
+    write_table(pct_df, pct_cache)
+    return pct_df, bq_cache_info
+
+
+def _regpat_data_path(regpat_file: Path) -> Path:
+    """The file whose size and mtime identify a RegPat input (the data file of a store)."""
+    regpat_file = Path(regpat_file)
+    if is_regpat_store(regpat_file):
+        return regpat_file / STORE_DATA_FILE
+    return regpat_file
+
+
+def _previous_run_reusable(out_dir: Path, cache_dir: Path, regpat_file: Path, category_column: str | None) -> bool:
+    """True when the last run's outputs were built from the same RegPat file and split."""
+    meta_path = out_dir / "run_metadata.json"
+    if not meta_path.exists() or not (cache_dir / "regpat_filtered.parquet").exists():
+        return False
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except ValueError:
+        return False
+    return (
+        # Runs that only folded counts did not refresh regpat_filtered.parquet.
+        meta.get("outputs", {}).get("regpat_filtered_parquet", "") is not None
+        and meta.get("regpat_fingerprint") == file_stat_fingerprint(_regpat_data_path(regpat_file))
+        and meta.get("category_column") == category_column
+    )
+
+
+def _check_category_column(category_column: str | None, columns) -> None:
+    if category_column and category_column not in columns:
+        raise typer.BadParameter(f"Category column '{category_column}' not found in query result.")
+
+
+def finish_pipeline(
+    prepared: PreparedPipeline,
+    scanned: pd.DataFrame | CountFold | None,
+    tally: MatchTally | None = None,
+) -> None:
+    """Completes a pipeline from its scan result and match tally (None when the scan stage was current)."""
+    if prepared.fold:
+        _finish_folded(prepared, scanned, tally)
+    else:
+        _finish_from_rows(prepared, scanned, tally)
+
+
+def _new_fold(prepared: PreparedPipeline) -> CountFold:
+    categories = prepared.pct_df[prepared.category_column] if _splits_categories(prepared) else None
+    return CountFold(prepared.pct_keys, prepared.pct_df["filing_date"], categories)
+
+
+def _splits_categories(prepared: PreparedPipeline) -> bool:
+    return bool(prepared.category_column) and prepared.category_column in prepared.pct_df.columns
+
+
+def _finish_folded(prepared: PreparedPipeline, fold: CountFold | None, tally: MatchTally | None) -> None:
+    """Step 4 when the counts were folded during the RegPat scan: write them out."""
+    manifest = prepared.manifest
+    if fold is None:
+        print(f"[bold]Reusing fractional counts[/bold] {table_path(prepared.out_dir, COUNTS_TABLE, prepared.output_format)} (inputs unchanged)")
+        category_outputs = manifest.get("fold").get("categories", {})
+        n_regpat_rows = manifest.get("fold").get("n_rows")
+        prepared.stages["fold"] = "reused"
+    else:
+        with prepared.metrics.stage("aggregate", status="executed", rows_in=fold.n_rows) as record:
+            counts, by_category = fold.result()
+            record["rows_out"] = len(counts)
+        category_outputs, artifacts = _write_counts(prepared, counts, by_category)
+        artifacts += _write_match_diagnostics(prepared, tally)
+        n_regpat_rows = fold.n_rows
+        manifest.record(
+            "fold",
+            prepared.regpat_fingerprint,
+            artifacts,
+            categories=category_outputs,
+            n_rows=n_regpat_rows,
+            n_pct_matched=tally.n_matched,
+        )
+        prepared.stages["fold"] = "executed"
+    _write_run_metadata(prepared, category_outputs, n_regpat_rows)
+
+
+def _finish_from_rows(prepared: PreparedPipeline, regpat_filtered: pd.DataFrame | None, tally: MatchTally | None) -> None:
+    """
+    Steps 3-4: attach filing dates to the RegPat rows and aggregate.
+
+    regpat_filtered is None when the RegPat stage is current; the previous
+    regpat_filtered.parquet is then used (and only loaded if aggregation has
+    to run again).
+    """
+    pct_df = prepared.pct_df
+    category_column = prepared.category_column
+    manifest = prepared.manifest
+    stages = prepared.stages
+    regpat_cache = prepared.cache_dir / "regpat_filtered.parquet"
+
+    if regpat_filtered is None:
+        print(f"[bold]Reusing filtered RegPat[/bold] {regpat_cache} (inputs unchanged)")
+        n_regpat_rows = manifest.get("regpat").get("n_rows")
+        stages["regpat"] = "reused"
+    else:
+        with prepared.metrics.stage("merge", status="executed", rows_in=len(regpat_filtered)) as record:
+            merge_cols = ["filing_date"]
+            if _splits_categories(prepared):
+                merge_cols.append(category_column)
+            pct_lookup = pct_df[merge_cols].assign(pct_key=prepared.pct_keys)
+            regpat_filtered = regpat_filtered.merge(
+                pct_lookup[pct_lookup["pct_key"] != INVALID_KEY],
+                on="pct_key",
+                how="left",
+            )
+            if prepared.affected_years is not None:
+                # Rows of untouched filing years come from the previous run unchanged,
+                # except those of refreshed pct numbers, whose filing year may have moved.
+                previous = _read_regpat_cache(regpat_cache)
+                refreshed = PctKeySet(prepared.refreshed_keys).contains(previous["pct_key"].to_numpy())
+                previous = previous[~filing_year(previous["filing_date"]).isin(prepared.affected_years).to_numpy() & ~refreshed]
+                regpat_filtered = pd.concat([previous[regpat_filtered.columns], regpat_filtered], ignore_index=True)
+            record["rows_out"] = len(regpat_filtered)
+        with prepared.metrics.stage("write_regpat_filtered", status="executed", rows_out=len(regpat_filtered)) as record:
+            _with_pct_nbr(regpat_filtered).to_parquet(regpat_cache, index=False)
+            record["bytes_written"] = regpat_cache.stat().st_size
+        print(f"Saved filtered RegPat to {regpat_cache} (rows={len(regpat_filtered):,})")
+        n_regpat_rows = len(regpat_filtered)
+        if prepared.affected_years is not None:
+            # The scan only covered the affected years; tally the spliced rows instead.
+            tally = MatchTally(prepared.pct_keys)
+            tally.extend([MatchTally.partial(regpat_filtered)])
+        diagnostics = _write_match_diagnostics(prepared, tally)
+        manifest.record(
+            "regpat",
+            prepared.regpat_fingerprint,
+            [regpat_cache, *diagnostics],
+            n_rows=n_regpat_rows,
+            n_pct_matched=tally.n_matched,
+        )
+        stages["regpat"] = "executed"
+
+    aggregate_fp = fingerprint(
+        regpat_filtered=file_digest(regpat_cache),
+        category_column=category_column if _splits_categories(prepared) else None,
+        category_output=prepared.category_output,
+        output_format=prepared.output_format,
+        label=prepared.label,
+        out_dir=prepared.out_dir.resolve(),
+        code=code_version(analysis_module, cube_module),
+    )
+    if not prepared.force and manifest.is_current("aggregate", aggregate_fp):
+        print(f"[bold]Reusing fractional counts[/bold] {table_path(prepared.out_dir, COUNTS_TABLE, prepared.output_format)} (inputs unchanged)")
+        category_outputs = manifest.get("aggregate").get("categories", {})
+        stages["aggregate"] = "reused"
+    else:
+        print("[bold]Computing fractional counts by inventor country[/bold] ...")
+        with prepared.metrics.stage("aggregate", status="executed") as record:
+            if regpat_filtered is None:
+                regpat_filtered = _read_regpat_cache(regpat_cache)
+                record["bytes_read"] = regpat_cache.stat().st_size
+            record["rows_in"] = len(regpat_filtered)
+            by_category = None
+            if _splits_categories(prepared):
+                counts, by_category = fractional_counts_by_category(regpat_filtered, category_column)
+            else:
+                counts = fractional_counts_by_inventor_country(regpat_filtered)
+            record["rows_out"] = len(counts)
+        category_outputs, artifacts = _write_counts(prepared, counts, by_category)
+        manifest.record("aggregate", aggregate_fp, artifacts, categories=category_outputs)
+        stages["aggregate"] = "executed"
+
+    _write_run_metadata(prepared, category_outputs, n_regpat_rows)
+
+
+def _write_counts(
+    prepared: PreparedPipeline,
+    counts: pd.DataFrame,
+    by_category: pd.DataFrame | None,
+) -> tuple[dict[str, str], list[Path]]:
+    """Writes the overall and per-category counts; returns the category outputs and all written paths."""
+    n_rows = len(counts) + (len(by_category) if by_category is not None else 0)
+    with prepared.metrics.stage("write_counts", status="executed", rows_out=n_rows) as record:
+        category_outputs, artifacts = _write_count_files(prepared, counts, by_category)
+        record["bytes_written"] = sum(_size_on_disk(path) for path in artifacts)
+    return category_outputs, artifacts
+
+
+def _write_count_files(
+    prepared: PreparedPipeline,
+    counts: pd.DataFrame,
+    by_category: pd.DataFrame | None,
+) -> tuple[dict[str, str], list[Path]]:
+    out_dir = prepared.out_dir
+    category_column = prepared.category_column
+    counts_path = table_path(out_dir, COUNTS_TABLE, prepared.output_format)
+    write_table(counts, counts_path)
+    print(f"Saved results to {counts_path}")
+
+    category_outputs = {}
+    artifacts = [counts_path]
+    if by_category is not None and prepared.category_output == "parquet":
+        dataset_dir = out_dir / "inventor_country_yearly_fractional_counts_by_category"
+        _write_category_dataset(by_category, category_column, dataset_dir)
+        category_outputs = {str(value): str(dataset_dir) for value in by_category[category_column].unique()}
+        artifacts.append(dataset_dir)
+        print(f"  -> Saved {len(category_outputs)} category tables to {dataset_dir}")
+    elif by_category is not None:
+        for category_value, cat_counts in by_category.groupby(category_column, sort=False):
+            slug = slugify(str(category_value))
+            cat_path = table_path(out_dir, f"{COUNTS_TABLE}_{slug}", prepared.output_format)
+            write_table(cat_counts.drop(columns=[category_column]), cat_path)
+            category_outputs[str(category_value)] = str(cat_path)
+            artifacts.append(cat_path)
+            print(f"  -> Saved category '{category_value}' counts to {cat_path}")
+
+    cube_path = out_dir / CUBE_FILE
+    write_cube(build_cube(prepared.label, counts, by_category, category_column), cube_path)
+    artifacts.append(cube_path)
+    print(f"Saved aggregate cube to {cube_path}")
+    return category_outputs, artifacts
+
+
+def _write_match_diagnostics(prepared: PreparedPipeline, tally: MatchTally) -> list[Path]:
+    """Match rates by filing year (and category) and per pct number, from the scan's tally."""
+    category_column = prepared.category_column if _splits_categories(prepared) else None
+    by_year_path = table_path(prepared.out_dir, MATCH_BY_YEAR, prepared.output_format)
+    by_pct_path = prepared.out_dir / MATCH_BY_PCT_PARQUET
+    with prepared.metrics.stage("write_diagnostics", status="executed") as record:
+        by_pct = match_table(prepared.pct_df, prepared.pct_keys, tally, category_column)
+        write_table(summarize_matches(by_pct, category_column), by_year_path)
+        by_pct.to_parquet(by_pct_path, index=False)
+        record.update(
+            rows_out=len(by_pct),
+            bytes_written=by_year_path.stat().st_size + by_pct_path.stat().st_size,
+        )
+    n_pct = len(by_pct)
+    print(
+        f"Matched {tally.n_matched:,} of {n_pct:,} pct numbers"
+        f" ({tally.n_matched / n_pct:.1%}); diagnostics in {by_year_path}"
+        if n_pct
+        else f"No pct numbers to match; diagnostics in {by_year_path}"
+    )
+    return [by_year_path, by_pct_path]
+
+
+def _write_run_metadata(prepared: PreparedPipeline, category_outputs: dict[str, str], n_regpat_rows: int | None) -> None:
+    stages = prepared.stages
+    scan_stage = prepared.manifest.get("fold" if prepared.fold else "regpat")
+    meta = {
+        "run_utc": datetime.now(timezone.utc).isoformat(),
+        "gcp_project_id": prepared.project_id,
+        "bq_location": prepared.location,
+        "query_file": str(prepared.query_file),
+        "bq_cache": {
+            "hit": prepared.bq_cache_info["hit"],
+            "key": prepared.bq_cache_info["key"],
+            "path": prepared.bq_cache_info["path"],
+            "created_utc": prepared.bq_cache_info["created_utc"],
+        },
+        "regpat_file": str(prepared.regpat_file),
+        "regpat_fingerprint": file_stat_fingerprint(_regpat_data_path(prepared.regpat_file)),
+        "category_column": prepared.category_column,
+        "output_format": prepared.output_format,
+        "incremental": {
+            "n_new_rows": prepared.bq_cache_info.get("n_new_rows"),
+            "recomputed_years": sorted(prepared.affected_years) if prepared.affected_years is not None else "all",
+        },
+        "stages": stages,
+        "stage_metrics": prepared.metrics.stages,
+        "n_pct_unique": int(len(prepared.pct_df)),
+        "n_regpat_rows_kept": int(n_regpat_rows) if n_regpat_rows is not None else None,
+        "n_pct_matched": scan_stage.get("n_pct_matched"),
+        "outputs": {
+            "inventor_country_yearly_fractional_counts": str(table_path(prepared.out_dir, COUNTS_TABLE, prepared.output_format)),
+            "categories": category_outputs,
+            "cube": str(prepared.out_dir / CUBE_FILE),
+            "regpat_filtered_parquet": None if prepared.fold else str(prepared.cache_dir / "regpat_filtered.parquet"),
+            "match_diagnostics": str(table_path(prepared.out_dir, MATCH_BY_YEAR, prepared.output_format)),
+            "match_diagnostics_by_pct": str(prepared.out_dir / MATCH_BY_PCT_PARQUET),
+        },
+    }
+    meta_path = prepared.out_dir / "run_metadata.json"
+    meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    print(f"Saved metadata to {meta_path}")
+
+    reused = [stage for stage, status in stages.items() if status == "reused"]
+    executed = [stage for stage, status in stages.items() if status == "executed"]
+    print(f"Stages reused: {', '.join(reused) or 'none'}; executed: {', '.join(executed) or 'none'}")
+    timings = ", ".join(f"{m['stage']} {m['wall_seconds']:.2f}s" for m in prepared.metrics.stages)
+    print(f"Stage timings: {timings or 'none'}")
+    if prepared.metrics.profile_dir:
+        print(f"Saved stage profiles to {prepared.metrics.profile_dir}")
+
+
+def _size_on_disk(path: Path) -> int:
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size
+
+
+def _write_category_dataset(by_category: pd.DataFrame, category_column: str, dataset_dir: Path) -> None:
+    """Writes per-category counts as one Parquet dataset partitioned by category_column."""
+    if dataset_dir.exists():
+        shutil.rmtree(dataset_dir)
+    table = pa.Table.from_pandas(
+        by_category.astype({category_column: "string"}),
+        preserve_index=False,
+    )
+    pq.write_to_dataset(table, dataset_dir, partition_cols=[category_column])
+
+
+def _read_regpat_cache(regpat_cache: Path) -> pd.DataFrame:
+    """regpat_filtered.parquet with pct_nbr turned back into the int64 pct_key."""
+    previous = pd.read_parquet(regpat_cache)
+    previous.insert(0, "pct_key", encode_pct_nbr(previous["pct_nbr"]))
+    return previous.drop(columns=["pct_nbr"])
+
+
+def _with_pct_nbr(regpat_filtered: pd.DataFrame) -> pd.DataFrame:
+    """Swaps the int64 pct_key back to the pct_nbr string for files people read."""
+    out = regpat_filtered.drop(columns=["pct_key"])
+    out.insert(0, "pct_nbr", decode_pct_nbr(regpat_filtered["pct_key"]).array)
+    return out
@@ -0,0 +1,266 @@
+"""
+Long-running query service: RegPat loaded once into memory, fractional
+counts by inventor country and year for a pct list over local HTTP (TCP or
+a Unix socket).
+
+    POST /counts  {"pct_nbrs": [...], "filing_dates": [...]}
+                  {"bq_cache": "<cache key prefix or query file name>"}
+    GET  /health
+
+filing_dates is optional; without it the year in each pct number is used.
+A bq_cache request reads a cached BigQuery result from the cache folder and
+cleans it as run does. Counts come out as JSON records, or as CSV with
+"format": "csv", shaped like fractional_counts_by_inventor_country.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socketserver
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .analysis import CountFold
+from .pct_codec import INVALID_KEY, encode_pct_nbr
+from .regpat import iter_regpat_rows
+
+
+class RequestError(ValueError):
+    """A request the service cannot answer; status is the HTTP status to send."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class RegpatMemory:
+    """
+    RegPat rows with a pct key, sorted by key: the rows of keys[i] are
+    offsets[i]:offsets[i + 1] of the country code and inv_share arrays.
+    Read-only once built, so any number of request threads can share it.
+    """
+
+    def __init__(self, row_keys: np.ndarray, country_codes: np.ndarray, countries: list[str], inv_share: np.ndarray):
+        order = np.argsort(row_keys, kind="stable")
+        row_keys = row_keys[order]
+        self.country_codes = country_codes[order]
+        self.inv_share = inv_share[order]
+        self.countries = pd.array(countries, dtype="string")
+        self.keys, starts = np.unique(row_keys, return_index=True)
+        self.offsets = np.append(starts, len(row_keys))
+
+    @classmethod
+    def load(cls, regpat_file: Path, separator: str = "\t", chunksize: int = 1_000_000) -> RegpatMemory:
+        keys, codes, shares = [], [], []
+        countries: dict[str, int] = {}
+        for chunk in iter_regpat_rows(regpat_file, chunksize=chunksize, separator=separator):
+            values, inverse = np.unique(chunk["ctry_code"].to_numpy(dtype=object), return_inverse=True)
+            code_of = np.array([countries.setdefault(value, len(countries)) for value in values], dtype=np.int16)
+            keys.append(chunk["pct_key"].to_numpy(dtype=np.int64))
+            codes.append(code_of[inverse.reshape(-1)])
+            shares.append(chunk["inv_share"].to_numpy(dtype="float64", na_value=np.nan))
+        if not keys:
+            return cls(np.empty(0, np.int64), np.empty(0, np.int16), [], np.empty(0, np.float64))
+        return cls(np.concatenate(keys), np.concatenate(codes), list(countries), np.concatenate(shares))
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.inv_share)
+
+    def rows(self, pct_keys: np.ndarray) -> pd.DataFrame:
+        """pct_key, ctry_code and inv_share of the rows of each distinct wanted key."""
+        wanted = np.unique(pct_keys[pct_keys != INVALID_KEY])
+        if len(self.keys):
+            pos = np.minimum(np.searchsorted(self.keys, wanted), len(self.keys) - 1)
+            pos = pos[self.keys[pos] == wanted]
+        else:
+            pos = np.empty(0, dtype=np.int64)
+        starts, lengths = self.offsets[pos], self.offsets[pos + 1] - self.offsets[pos]
+        # Row indices of every matched key's slice, laid end to end.
+        idx = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return pd.DataFrame(
+            {
+                "pct_key": np.repeat(self.keys[pos], lengths),
+                "ctry_code": self.countries.take(self.country_codes[idx]),
+                "inv_share": self.inv_share[idx],
+            }
+        )
+
+
+class CountService:
+    """Answers count requests from a RegpatMemory; cleaned BigQuery lists are kept per cache file."""
+
+    def __init__(self, memory: RegpatMemory, bq_cache_dir: Path):
+        self.memory = memory
+        self.bq_cache_dir = Path(bq_cache_dir)
+        self._lists: dict[tuple[str, float], tuple[np.ndarray, pd.Series]] = {}
+        self._lock = threading.Lock()
+
+    def health(self) -> dict:
+        return {"status": "ok", "regpat_rows": self.memory.n_rows, "regpat_pct": len(self.memory.keys)}
+
+    def counts(self, request: dict) -> pd.DataFrame | dict:
+        started = time.perf_counter()
+        pct_keys, filing_date = self._pct_list(request)
+        rows = self.memory.rows(pct_keys)
+        fold = CountFold(pct_keys, filing_date)
+        fold.add(rows)
+        counts = fold.result()[0]
+        if request.get("format") == "csv":
+            return counts
+        return {
+            "n_pct": len(pct_keys),
+            "n_pct_matched": int(len(np.unique(rows["pct_key"].to_numpy()))),
+            "n_regpat_rows": len(rows),
+            "seconds": round(time.perf_counter() - started, 4),
+            "counts": counts.to_dict(orient="records"),
+        }
+
+    def _pct_list(self, request: dict) -> tuple[np.ndarray, pd.Series]:
+        if "bq_cache" in request:
+            return self._cached_list(str(request["bq_cache"]))
+        pct_nbrs = request.get("pct_nbrs")
+        if not isinstance(pct_nbrs, list):
+            raise RequestError('Send "pct_nbrs" (a list) or "bq_cache".')
+        pct_nbrs = pd.Series(pct_nbrs, dtype="string")
+        filing_dates = request.get("filing_dates")
+        if filing_dates is None:
+            # "WO2005EP012345" -> "2005EP012345", whose first four characters are the year.
+            filing_date = pct_nbrs.str.slice(2)
+        elif isinstance(filing_dates, list) and len(filing_dates) == len(pct_nbrs):
+            if not all(value is None or _is_date_value(value) for value in filing_dates):
+                raise RequestError('"filing_dates" must hold strings, integers (YYYYMMDD) or nulls.')
+            filing_date = pd.Series(filing_dates, dtype="object")
+        else:
+            raise RequestError('"filing_dates" must be a list as long as "pct_nbrs".')
+        return encode_pct_nbr(pct_nbrs), filing_date
+
+    def _cached_list(self, name: str) -> tuple[np.ndarray, pd.Series]:
+        data_path = self._find_cached(name)
+        cache_key = (str(data_path), data_path.stat().st_mtime)
+        with self._lock:
+            if cache_key in self._lists:
+                return self._lists[cache_key]
+        from .transform import stata_like_pct_nbr
+
+        bq = pd.read_parquet(data_path, columns=["publication_number", "filing_date"])
+        pct_df = stata_like_pct_nbr(bq, extra_columns=["filing_date"])
+        entry = (encode_pct_nbr(pct_df["pct_nbr"]), pct_df["filing_date"])
+        with self._lock:
+            self._lists[cache_key] = entry
+        return entry
+
+    def _find_cached(self, name: str) -> Path:
+        """The cached result whose key starts with name or whose query file is called name."""
+        matches = []
+        for meta_path in sorted(self.bq_cache_dir.glob("*.json")):
+            data_path = meta_path.with_suffix(".parquet")
+            if not data_path.exists():
+                continue
+            try:
+                query_file = Path(json.loads(meta_path.read_text(encoding="utf-8")).get("query_file", ""))
+            except (OSError, ValueError):
+                continue
+            if (len(name) >= 6 and meta_path.stem.startswith(name)) or name in (str(query_file), query_file.name, query_file.stem):
+                matches.append(data_path)
+        if not matches:
+            raise RequestError(f"No cached BigQuery result matches {name!r} in {self.bq_cache_dir}.", status=404)
+        if len(matches) > 1:
+            raise RequestError(f"{name!r} matches {len(matches)} cached results; use a longer key prefix.")
+        return matches[0]
+
+
+def _is_date_value(value) -> bool:
+    """A string, or an integer that fits int64 (bool is an int in Python, but not a date)."""
+    if isinstance(value, str):
+        return True
+    return isinstance(value, int) and not isinstance(value, bool) and -(2**63) <= value < 2**63
+
+
+def make_handler(service: CountService) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "pipeline-serve"
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/") == "/health":
+                self._send_json(200, service.health())
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self) -> None:
+            if self.path.rstrip("/") != "/counts":
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(request, dict):
+                    raise RequestError("The request body must be a JSON object.")
+                result = service.counts(request)
+            except RequestError as exc:
+                self._send_json(exc.status, {"error": str(exc)})
+                return
+            except ValueError as exc:  # malformed JSON or values
+                self._send_json(400, {"error": str(exc)})
+                return
+            except Exception as exc:
+                # Logged here; the client still gets an answer instead of a dropped connection.
+                self.log_error("Request failed: %r", exc)
+                self._send_json(500, {"error": f"Internal error: {type(exc).__name__}"})
+                return
+            if isinstance(result, pd.DataFrame):
+                self._send(200, result.to_csv(index=False).encode("utf-8"), "text/csv")
+            else:
+                self._send_json(200, result)
+
+        def address_string(self) -> str:
+            # Unix socket clients have no (host, port) address.
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def _send_json(self, status: int, payload: dict) -> None:
+            self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+        def _send(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: CountService, host: str = "127.0.0.1", port: int = 8765, socket_path: Path | None = None):
+    """A threading HTTP server for service on host:port, or on socket_path when given."""
+    handler = make_handler(service)
+    if socket_path is None:
+        return ThreadingHTTPServer((host, port), handler)
+    socket_path = Path(socket_path)
+    if is_stale_socket(socket_path):
+        os.unlink(socket_path)
+    return UnixHTTPServer(str(socket_path), handler)
+
+
+def is_stale_socket(socket_path: Path) -> bool:
+    """
+    True when socket_path is a socket left behind by an earlier server, False
+    when nothing is there. Anything else at that path raises FileExistsError,
+    so a mistyped --socket never deletes a file.
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket; pass another --socket path.")
+    return True
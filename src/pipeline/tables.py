@@ -0,0 +1,60 @@
+"""
+Tables the pipeline writes and reads back (pct list, counts, match
+diagnostics) as CSV, Parquet or Arrow IPC (Feather) files, told apart by
+their suffix. Parquet and Feather keep the pandas dtypes, so pct_nbr and
+filing_date come back as written. Feather is written uncompressed and read
+memory-mapped, so its numeric columns are not copied. Also the slugs that
+turn category values into file and directory names.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+
+TABLE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+
+def table_path(directory: Path, stem: str, table_format: str) -> Path:
+    if table_format not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format '{table_format}'; use one of {', '.join(TABLE_FORMATS)}.")
+    return Path(directory) / f"{stem}{TABLE_FORMATS[table_format]}"
+
+
+def slugify(value: str) -> str:
+    slug = "".join(ch if ch.isalnum() else "_" for ch in value)
+    slug = "_".join(part for part in slug.split("_") if part)
+    return slug.lower() or "category"
+
+
+def write_table(df: pd.DataFrame, path: Path) -> None:
+    path = Path(path)
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False, compression="zstd")
+    elif path.suffix == ".feather":
+        feather.write_feather(df.reset_index(drop=True), path, compression="uncompressed")
+    else:
+        df.to_csv(path, index=False)
+
+
+def read_table(path: Path, columns: list[str] | None = None, **csv_options) -> pd.DataFrame:
+    """A table written by write_table; csv_options only apply to CSV files."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if path.suffix == ".feather":
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    return pd.read_csv(path, usecols=columns, **csv_options)
+
+
+def find_table(path: Path) -> Path | None:
+    """path if it exists, else the most recent table with its stem in another format, else None."""
+    path = Path(path)
+    if path.exists():
+        return path
+    siblings = [path.with_suffix(suffix) for suffix in TABLE_FORMATS.values()]
+    siblings = [p for p in siblings if p.exists()]
+    return max(siblings, key=lambda p: p.stat().st_mtime) if siblings else None
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
 
 def _fix_wo_century(pub: str) -> str:
@@ -8,6 +10,9 @@ def _fix_wo_century(pub: str) -> str:
     Replicates:
       replace publication_number = "WO-20"+substr(publication_number,4,.) if substr(...,1,4)=="WO-0"
       replace publication_number = "WO-19"+substr(publication_number,4,.) if substr(...,1,4) in {"WO-7","WO-8","WO-9"}
+
+    Per-row reference for the vectorized fix in stata_like_pct_nbr; see
+    benchmarks/bench_transform.py.
     """
     if not isinstance(pub, str):
         return pub
@@ -20,31 +25,60 @@ def _fix_wo_century(pub: str) -> str:
     return pub
 
 
+def _to_arrow_strings(text: pd.Series) -> pa.Array:
+    """Arrow view of a string Series; zero-copy when pandas already stores it in Arrow."""
+    if hasattr(text.array, "__arrow_array__"):
+        arr = pa.array(text.array)
+        if isinstance(arr, pa.ChunkedArray):
+            arr = arr.combine_chunks()
+        return arr.cast(pa.string())
+    return pa.array(text.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+
+
 def stata_like_pct_nbr(
     df: pd.DataFrame,
     publication_col: str = "publication_number",
     extra_columns: list[str] | None = None,
 ) -> pd.DataFrame:
-    out = df.copy()
+    """
+    Builds the Stata pct_nbr from publication numbers.
+
+    Same steps as _fix_wo_century followed by the hyphen removal, split at 'A'
+    and 11-character padding below, run as Arrow string kernels over the whole
+    column instead of per-row Python calls. df is not copied.
+    """
+    # astype(str) happens before the century fix here, after it in the
+    # per-row version; only strings can start with "WO-", so it is the same.
+    text = df[publication_col].astype(str)
+    pub = _to_arrow_strings(text)
 
     # Fix century in WO numbers
-    out[publication_col] = out[publication_col].map(_fix_wo_century)
+    pub = pc.replace_substring_regex(pub, pattern=r"^WO-(0)", replacement=r"WO-20\1", max_replacements=1)
+    pub = pc.replace_substring_regex(pub, pattern=r"^WO-([789])", replacement=r"WO-19\1", max_replacements=1)
 
     # Remove hyphens
-    pct = out[publication_col].astype(str).str.replace("-", "", regex=False)
+    pct = pc.replace_substring(pub, pattern="-", replacement="")
 
     # Split at 'A' and keep left part
-    pct_left = pct.str.split("A", n=1, expand=True)[0]
+    pct_left = pc.list_element(pc.split_pattern(pct, pattern="A", max_splits=1), 0)
 
     # Pad if length == 11 by inserting '0' after 6th character
-    lengths = pct_left.str.len()
-    pct_left = pct_left.where(lengths != 11, pct_left.str.slice(0, 6) + "0" + pct_left.str.slice(6))
+    padded = pc.binary_join_element_wise(
+        pc.utf8_slice_codeunits(pct_left, 0, 6),
+        pc.utf8_slice_codeunits(pct_left, 6),
+        "0",
+    )
+    pct_left = pc.if_else(pc.equal(pc.utf8_length(pct_left), 11), padded, pct_left)
 
-    data = {"pct_nbr": pct_left}
+    if text.dtype == object:
+        pct_values = pct_left.to_numpy(zero_copy_only=False)
+    else:
+        pct_values = pd.array(pct_left, dtype=text.dtype)
+    data = {"pct_nbr": pd.Series(pct_values, index=df.index)}
     extras = extra_columns or []
     for col in extras:
-        if col in out.columns:
-            data[col] = out[col].values
+        if col in df.columns:
+            data[col] = df[col].values
 
     pct_df = pd.DataFrame(data)
     subset_cols = ["pct_nbr"]
@@ -1,11 +1,15 @@
-import pandas as pd
+from pathlib import Path
 
-pct = pd.read_csv("data/processed/pct_from_bq.csv")          # from step 2 (pct list)
-reg = pd.read_parquet("data/processed/regpat_filtered.parquet")
+import pandas as pd
 
-pct["filing_year"] = pct["filing_date"].astype(str).str[:4].astype(int)
-matched_pct = reg["pct_nbr"].unique()
-pct["matched"] = pct["pct_nbr"].isin(matched_pct)
+# Written by the run from the RegPat scan itself (see "Match diagnostics" in README.md),
+# as .csv, .parquet or .feather depending on --output-format; the newest one is read.
+written = [p for p in Path("data/output").glob("match_diagnostics.*") if p.suffix in (".csv", ".parquet", ".feather")]
+if not written:
+    raise SystemExit("No data/output/match_diagnostics file yet; run the pipeline first.")
+path = max(written, key=lambda p: p.stat().st_mtime)
+readers = {".csv": pd.read_csv, ".parquet": pd.read_parquet, ".feather": pd.read_feather}
+diag = readers[path.suffix](path)
 
-summary = pct.groupby(["filing_year", "matched"]).size().unstack(fill_value=0)
-print(summary.tail(15))
\ No newline at end of file
+summary = diag.groupby("filing_year")[["n_matched", "n_unmatched"]].sum()
+print(summary.tail(15))
@@ -0,0 +1,81 @@
+"""
+Stand-in for google.cloud.bigquery.Client. Queries are answered with a fixed
+frame, or, for SQL starting with "-- <name>", with that name's frame. The
+"WHERE <column> >= <value>" (or >) that render_query wraps around an
+incremental fetch is applied to it. Jobs can take a set time to finish after
+they are submitted, or fail.
+"""
+from __future__ import annotations
+
+import re
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+
+class StubRows:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+    def to_dataframe(self, **kwargs) -> pd.DataFrame:
+        return self.df.copy()
+
+    def to_arrow_iterable(self, **kwargs):
+        # One batch for the whole result, like a BigQuery Storage API stream.
+        yield from pa.Table.from_pandas(self.df, preserve_index=False).to_batches()
+
+
+class StubJob:
+    def __init__(self, df: pd.DataFrame, latency: float = 0.0, error: Exception | None = None):
+        self.df = df
+        self.error = error
+        self.done_at = time.monotonic() + latency
+
+    def result(self, **kwargs) -> StubRows:
+        time.sleep(max(0.0, self.done_at - time.monotonic()))
+        if self.error is not None:
+            raise self.error
+        return StubRows(self.df)
+
+
+class StubClient:
+    """Records the SQL of every query it is sent."""
+
+    def __init__(
+        self,
+        results: pd.DataFrame | dict[str, pd.DataFrame],
+        latencies: dict[str, float] | None = None,
+        failing: tuple[str, ...] = (),
+    ):
+        self.results = results
+        self.latencies = latencies or {}
+        self.failing = failing
+        self.queries: list[str] = []
+
+    def query(self, sql: str) -> StubJob:
+        self.queries.append(sql)
+        name = sql.split()[1] if sql.startswith("--") else None
+        df = self.results[name] if isinstance(self.results, dict) else self.results
+        df = _apply_watermark(df, sql)
+        error = RuntimeError(f"job {name} failed") if name in self.failing else None
+        return StubJob(df, self.latencies.get(name, 0.0), error)
+
+
+def _apply_watermark(df: pd.DataFrame, sql: str) -> pd.DataFrame:
+    match = re.search(r"\) WHERE (\w+) (>=|>) (.+)$", sql.rstrip())
+    if match is None:
+        return df
+    column, op, literal = match.groups()
+    value = literal.strip("'") if literal.startswith("'") else float(literal)
+    keep = df[column] >= value if op == ">=" else df[column] > value
+    return df[keep].reset_index(drop=True)
+
+
+def bq_result(n: int = 3, year: int = 2005) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "publication_number": [f"WO-{year}{i:06d}-A1" for i in range(n)],
+            "filing_date": [year * 10000 + 101 + i for i in range(n)],
+        }
+    )
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the package from src/, as the CLI does with PYTHONPATH=src.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
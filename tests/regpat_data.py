@@ -0,0 +1,28 @@
+"""Small RegPat text files for tests: a few inventor rows per pct number, plus rows for unknown numbers."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+COUNTRIES = ["DE", "US", "FR", "JP", "CN"]
+
+
+def regpat_frame(pct_nbrs: list[str], seed: int = 0, n_other: int = 50) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    other = [f"WO1990{i:06d}" for i in range(n_other)]
+    pct = [p for p in pct_nbrs + other for _ in range(int(rng.integers(1, 4)))]
+    return pd.DataFrame(
+        {
+            "app_nbr": rng.integers(0, 10**9, len(pct)),
+            "pct_nbr": pct,
+            "ctry_code": rng.choice(COUNTRIES, len(pct)),
+            "inv_share": rng.choice([0.25, 0.5, 1.0], len(pct)),
+        }
+    )
+
+
+def write_regpat(path: Path, pct_nbrs: list[str], seed: int = 0, n_other: int = 50) -> Path:
+    regpat_frame(pct_nbrs, seed, n_other).to_csv(path, sep="\t", index=False)
+    return path
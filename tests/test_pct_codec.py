@@ -0,0 +1,99 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline.pct_codec import INVALID_KEY, PctKeySet, decode_pct_nbr, encode_pct_fields, encode_pct_nbr
+
+MALFORMED = [
+    None,
+    pd.NA,
+    float("nan"),
+    "",
+    "WO",
+    "WO2005",
+    "wo2005012345",
+    "Wo2005012345",
+    "WO2005ep012345",
+    "WO2005E012345",
+    "WO2005EP",
+    "WO20O5012345",
+    "WO2005012345678901",
+    "WO20050123456789",
+    " WO2005012345",
+    "WO2005012345 ",
+    "WO2005-012345",
+    "US2005012345",
+    "WO2005é12345",
+    "WO2005012345A1",
+]
+
+
+def random_pct_nbrs(n: int, seed: int) -> list[str]:
+    """Well-formed pct numbers: any year, with or without an office, serials of 1-9 digits (leading zeros kept)."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        office = "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ", k=2)) if rng.random() < 0.5 else ""
+        serial = "".join(rng.choices("0123456789", k=rng.randint(1, 9)))
+        out.append(f"WO{rng.randint(0, 9999):04d}{office}{serial}")
+    return out
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_round_trip(seed):
+    pct_nbrs = random_pct_nbrs(5_000, seed) + ["WO2005012345", "WO2005EP012345", "WO00000", "WO9999ZZ999999999"]
+    keys = encode_pct_nbr(pct_nbrs)
+    assert (keys != INVALID_KEY).all()
+    assert decode_pct_nbr(keys).tolist() == pct_nbrs
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_distinct_numbers_get_distinct_keys(seed):
+    pct_nbrs = random_pct_nbrs(20_000, seed)
+    # Same digits with and without leading zeros or an office must not collide.
+    pct_nbrs += ["WO20051", "WO200501", "WO2005001", "WO2005AA1", "WO2005AB1", "WO2005BA1", "WO2005ZZ01"]
+    keys = encode_pct_nbr(pct_nbrs)
+    assert len(np.unique(keys)) == len(set(pct_nbrs))
+    by_key = dict(zip(keys.tolist(), pct_nbrs))
+    assert all(by_key[key] == pct for key, pct in zip(keys.tolist(), pct_nbrs))
+
+
+def test_malformed_values_are_invalid():
+    keys = encode_pct_nbr(pd.Series(MALFORMED, dtype="object"))
+    assert keys.tolist() == [INVALID_KEY] * len(MALFORMED)
+    assert decode_pct_nbr(keys).isna().all()
+    assert encode_pct_nbr([]).dtype == np.int64
+
+
+def test_raw_fields_encode_like_strings():
+    values = random_pct_nbrs(2_000, 7) + [v for v in MALFORMED if isinstance(v, str)]
+    raw = [v.encode("utf-8") for v in values]
+    buf = np.frombuffer(b"\t".join(raw), dtype=np.uint8)
+    ends = np.cumsum([len(r) + 1 for r in raw]) - 1
+    starts = ends - [len(r) for r in raw]
+    np.testing.assert_array_equal(encode_pct_fields(buf, starts, ends), encode_pct_nbr(values))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_key_set_contains_like_a_set(seed):
+    rng = np.random.default_rng(seed)
+    pct_nbrs = random_pct_nbrs(3_000, seed)
+    members = [p for p in pct_nbrs if rng.random() < 0.3] + ["not a pct", None]
+    key_set = PctKeySet(members)
+    plain = set(members)
+
+    probe = encode_pct_nbr(pct_nbrs + ["not a pct"])
+    expected = np.array([p in plain for p in pct_nbrs] + [False])
+    np.testing.assert_array_equal(key_set.contains(probe), expected)
+    assert len(key_set) == len({p for p in members if p is not None and p.startswith("WO")})
+    np.testing.assert_array_equal(PctKeySet(encode_pct_nbr(members)).contains(probe), expected)
+    np.testing.assert_array_equal(PctKeySet.union([key_set, PctKeySet()]).contains(probe), expected)
+
+
+def test_empty_key_set():
+    keys = encode_pct_nbr(["WO2005012345", "bad"])
+    assert not PctKeySet().contains(keys).any()
+    assert not PctKeySet(["bad", None]).contains(keys).any()
+    assert len(PctKeySet.union([])) == 0
@@ -0,0 +1,119 @@
+import json
+
+import pandas as pd
+import pytest
+from bq_stub import StubClient, bq_result
+
+from pipeline.bq_fetch import (
+    BQConfig,
+    QueryCache,
+    QueryCacheMiss,
+    query_cache_key,
+    run_query_cached,
+    stream_query_cached,
+)
+
+CFG = BQConfig(project_id="demo", location="US")
+
+
+@pytest.fixture
+def query_file(tmp_path):
+    path = tmp_path / "q.sql"
+    path.write_text("SELECT publication_number, filing_date\nFROM t", encoding="utf-8")
+    return path
+
+
+def _age_entry(info: dict, seconds: float) -> None:
+    meta_path = info["path"].replace(".parquet", ".json")
+    with open(meta_path, encoding="utf-8") as fh:
+        entry = json.load(fh)
+    entry["created_ts"] -= seconds
+    with open(meta_path, "w", encoding="utf-8") as fh:
+        json.dump(entry, fh)
+
+
+def test_miss_then_hit(tmp_path, query_file):
+    client = StubClient(bq_result())
+    cache = QueryCache(tmp_path / "cache")
+    df, info = run_query_cached(query_file, CFG, cache, client=client)
+    assert not info["hit"]
+    assert len(client.queries) == 1
+
+    cached, info = run_query_cached(query_file, CFG, cache, client=client)
+    assert info["hit"]
+    assert len(client.queries) == 1
+    pd.testing.assert_frame_equal(cached, df)
+
+
+def test_expired_entry_is_queried_again(tmp_path, query_file):
+    client = StubClient(bq_result())
+    cache = QueryCache(tmp_path / "cache", ttl_seconds=3600)
+    _, info = run_query_cached(query_file, CFG, cache, client=client)
+    _age_entry(info, 7200)
+
+    _, info = run_query_cached(query_file, CFG, cache, client=client)
+    assert not info["hit"]
+    assert len(client.queries) == 2
+
+
+def test_refresh_ignores_fresh_entry(tmp_path, query_file):
+    client = StubClient(bq_result())
+    run_query_cached(query_file, CFG, QueryCache(tmp_path / "cache"), client=client)
+
+    _, info = run_query_cached(query_file, CFG, QueryCache(tmp_path / "cache", refresh=True), client=client)
+    assert not info["hit"]
+    assert len(client.queries) == 2
+
+
+def test_offline(tmp_path, query_file):
+    client = StubClient(bq_result())
+    with pytest.raises(QueryCacheMiss, match="missing"):
+        run_query_cached(query_file, CFG, QueryCache(tmp_path / "cache", offline=True), client=client)
+
+    _, info = run_query_cached(query_file, CFG, QueryCache(tmp_path / "cache"), client=client)
+    _, hit = run_query_cached(query_file, CFG, QueryCache(tmp_path / "cache", offline=True), client=client)
+    assert hit["hit"]
+
+    _age_entry(info, 7200)
+    expiring = QueryCache(tmp_path / "cache", ttl_seconds=3600, offline=True)
+    with pytest.raises(QueryCacheMiss, match="expired"):
+        run_query_cached(query_file, CFG, expiring, client=client)
+    assert len(client.queries) == 1
+
+
+def test_key_normalization(tmp_path, query_file):
+    sql = query_file.read_text(encoding="utf-8")
+    assert query_cache_key("  SELECT publication_number,\tfiling_date FROM t\n", CFG) == query_cache_key(sql, CFG)
+    assert query_cache_key(sql, BQConfig(project_id="other", location="US")) != query_cache_key(sql, CFG)
+    assert query_cache_key(sql, BQConfig(project_id="demo", location="EU")) != query_cache_key(sql, CFG)
+    assert query_cache_key(sql.replace("t", "u"), CFG) != query_cache_key(sql, CFG)
+
+    client = StubClient(bq_result())
+    cache = QueryCache(tmp_path / "cache")
+    run_query_cached(query_file, CFG, cache, client=client)
+    reformatted = tmp_path / "reformatted.sql"
+    reformatted.write_text("SELECT   publication_number,\n    filing_date\nFROM t\n", encoding="utf-8")
+    _, info = run_query_cached(reformatted, CFG, cache, client=client)
+    assert info["hit"]
+    assert len(client.queries) == 1
+
+
+def test_result_without_publication_number(tmp_path, query_file):
+    client = StubClient(bq_result().rename(columns={"publication_number": "pub"}))
+    with pytest.raises(ValueError, match="publication_number"):
+        run_query_cached(query_file, CFG, QueryCache(tmp_path / "cache"), client=client)
+    assert not list((tmp_path / "cache").glob("*.json"))
+
+
+def test_stream_batches_are_cut_to_batch_rows(tmp_path, query_file):
+    df = bq_result(25)
+    client = StubClient(df)
+    cache = QueryCache(tmp_path / "cache")
+    batches, info = stream_query_cached(query_file, CFG, cache, client=client, batch_rows=10)
+    sizes = [batch.num_rows for batch in batches]
+    assert sizes == [10, 10, 5]
+    assert info["n_rows"] == 25
+
+    cached, hit = run_query_cached(query_file, CFG, cache, client=client)
+    assert hit["hit"]
+    pd.testing.assert_frame_equal(cached, df)
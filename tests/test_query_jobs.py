@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+from bq_stub import StubClient, bq_result
+
+from pipeline.bq_fetch import BQConfig, QueryCache, QueryJobs, run_query_cached
+from pipeline.runner import submit_queries
+
+CFG = BQConfig(project_id="demo", location="US")
+LATENCIES = {"slow": 0.6, "fast": 0.05, "middle": 0.3}
+FRAMES = {name: bq_result(n, 2000 + n) for n, name in enumerate(LATENCIES, start=2)}
+
+
+@pytest.fixture
+def query_files(tmp_path):
+    files = {}
+    for name in LATENCIES:
+        files[name] = tmp_path / f"{name}.sql"
+        files[name].write_text(f"-- {name}\nSELECT publication_number, filing_date FROM t", encoding="utf-8")
+    return files
+
+
+@pytest.fixture
+def jobs_for():
+    opened = []
+
+    def make(client):
+        jobs = QueryJobs(CFG, client=client)
+        opened.append(jobs)
+        return jobs
+
+    yield make
+    for jobs in opened:
+        jobs.close()
+
+
+def test_concurrent_results_match_sequential_in_arrival_order(tmp_path, query_files, jobs_for):
+    sequential_client = StubClient(FRAMES)
+    sequential = {
+        name: run_query_cached(path, CFG, QueryCache(tmp_path / "seq"), client=sequential_client)[0]
+        for name, path in query_files.items()
+    }
+
+    client = StubClient(FRAMES, LATENCIES)
+    jobs = jobs_for(client)
+    cache = QueryCache(tmp_path / "concurrent")
+    arrivals = []
+    for name in submit_queries(query_files, CFG, cache, jobs):
+        df, info = run_query_cached(query_files[name], CFG, cache, jobs=jobs)
+        assert not info["hit"]
+        pd.testing.assert_frame_equal(df, sequential[name])
+        arrivals.append(name)
+
+    assert arrivals == ["fast", "middle", "slow"]
+    assert len(client.queries) == 3
+
+
+def test_cached_pipelines_come_first_without_a_query(tmp_path, query_files, jobs_for):
+    cache = QueryCache(tmp_path / "cache")
+    run_query_cached(query_files["slow"], CFG, cache, client=StubClient(FRAMES))
+
+    client = StubClient(FRAMES, LATENCIES)
+    arrivals = list(submit_queries(query_files, CFG, cache, jobs_for(client)))
+
+    assert arrivals == ["slow", "fast", "middle"]
+    assert not any(sql.startswith("-- slow") for sql in client.queries)
+
+
+def test_same_query_is_submitted_once(tmp_path, query_files, jobs_for):
+    client = StubClient(FRAMES, LATENCIES)
+    files = {"a": query_files["fast"], "b": query_files["fast"]}
+
+    assert list(submit_queries(files, CFG, QueryCache(tmp_path / "cache"), jobs_for(client))) == ["a", "b"]
+    assert len(client.queries) == 1
+
+
+def test_failed_job_raises_when_its_turn_comes(tmp_path, query_files, jobs_for):
+    client = StubClient(FRAMES, LATENCIES, failing=("middle",))
+    jobs = jobs_for(client)
+    cache = QueryCache(tmp_path / "cache")
+    arrivals = submit_queries(query_files, CFG, cache, jobs)
+
+    assert next(arrivals) == "fast"
+    run_query_cached(query_files["fast"], CFG, cache, jobs=jobs)
+    assert next(arrivals) == "middle"
+    with pytest.raises(RuntimeError, match="job middle failed"):
+        run_query_cached(query_files["middle"], CFG, cache, jobs=jobs)
+    assert next(arrivals) == "slow"
+    df, _ = run_query_cached(query_files["slow"], CFG, cache, jobs=jobs)
+    pd.testing.assert_frame_equal(df, FRAMES["slow"])
+    assert len(list((tmp_path / "cache").glob("*.json"))) == 2
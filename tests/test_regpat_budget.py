@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import regpat
+from pipeline.regpat import load_regpat_filtered_many
+
+
+@pytest.fixture
+def regpat_file(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 20_000
+    df = pd.DataFrame(
+        {
+            "app_nbr": rng.integers(0, 10**9, n),
+            "pct_nbr": [f"WO2005{i:06d}" for i in range(n)],
+            "ctry_code": rng.choice(["DE", "US", "FR"], n),
+            "inv_share": rng.random(n),
+        }
+    )
+    path = tmp_path / "regpat.txt"
+    df.to_csv(path, sep="\t", index=False)
+    return path
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(regpat, "PREFILTER_BLOCK_BYTES", 64 << 10)
+    monkeypatch.setattr(regpat, "MIN_PREFILTER_BLOCK_BYTES", 4 << 10)
+
+
+def wanted() -> list[str]:
+    return [f"WO2005{i:06d}" for i in range(0, 20_000, 3)]
+
+
+def scan(path, **kwargs) -> tuple[pd.DataFrame, list[dict]]:
+    stats: list[dict] = []
+    frame = load_regpat_filtered_many(path, {"a": wanted()}, chunk_stats=stats, use_index=False, **kwargs)["a"]
+    return frame, stats
+
+
+def test_budget_blocks_follow_parsed_size(regpat_file, small_blocks, monkeypatch):
+    expected, _ = scan(regpat_file)
+    # Enough for PREFILTER_BLOCK_BYTES blocks as long as nothing is measured.
+    budget = int((64 << 10) * regpat.PREFILTER_OVERHEAD / regpat.CHUNK_SHARE)
+
+    _, unmeasured = scan(regpat_file, memory_budget=budget)
+    monkeypatch.setattr(regpat, "CHUNK_OVERHEAD", 100)
+    frame, measured = scan(regpat_file, memory_budget=budget)
+
+    pd.testing.assert_frame_equal(frame, expected)
+    # The first block is sized before anything is measured, later ones shrink.
+    assert measured[0]["rows"] == unmeasured[0]["rows"]
+    assert measured[1]["rows"] < unmeasured[1]["rows"]
+    assert len(measured) > len(unmeasured)
+
+
+def test_budget_without_prefilter_matches(regpat_file, small_blocks):
+    expected, _ = scan(regpat_file)
+    frame, _ = scan(regpat_file, memory_budget=1 << 20, prefilter=False)
+    pd.testing.assert_frame_equal(frame, expected)
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from test_regpat_prefilter import CASES, HEADER, rows, text
+
+from pipeline import regpat, regpat_index
+from pipeline.regpat import load_regpat_filtered_many
+from pipeline.regpat_index import build_regpat_index
+
+# WO2005000006 is also the number on the middle line of multiline_quoted;
+# without it, that record's first and last lines are separate ranges.
+LOOKUPS = {
+    "with_6": ["WO2005000006", "WO2005000010", "WO2005000022", "WO2005000040"],
+    "without_6": ["WO2005000010", "WO2005000022", "WO2005000040"],
+}
+
+
+def multiline_quoted() -> list[str]:
+    # The quoted app_nbr holds line breaks; its middle line looks like a row of its own.
+    lines = rows()
+    lines[5] = '"5 first\n6\tWO2005000006\tDE\t0.5\nlast"\tWO2005000005\tDE\t0.5'
+    del lines[6]
+    return lines
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Several index blocks per file; lookups parse every range on its own.
+    monkeypatch.setattr(regpat_index, "INDEX_BLOCK_BYTES", 512)
+    monkeypatch.setattr(regpat_index, "INDEX_MIN_PIECE_BYTES", 16)
+    monkeypatch.setattr(regpat, "PREFILTER_BLOCK_BYTES", 1)
+
+
+def scan(path, wanted, **kwargs) -> tuple[pd.DataFrame, list[dict]]:
+    stats: list[dict] = []
+    frame = load_regpat_filtered_many(path, {"a": wanted}, chunk_stats=stats, **kwargs)["a"]
+    return frame.reset_index(drop=True), stats
+
+
+@pytest.mark.parametrize("lookup", LOOKUPS)
+@pytest.mark.parametrize("case", [*CASES, "multiline_quoted"])
+def test_index_lookup_matches_scan(tmp_path, case, lookup):
+    path = tmp_path / "regpat.txt"
+    path.write_bytes(text(multiline_quoted()) if case == "multiline_quoted" else CASES[case])
+    expected, _ = scan(path, LOOKUPS[lookup], prefilter=False, use_index=False)
+
+    build_regpat_index(path)
+    looked_up, stats = scan(path, LOOKUPS[lookup])
+    assert stats[0].get("index")
+    pd.testing.assert_frame_equal(looked_up, expected)
+
+
+def test_quoted_lines_do_not_unindex_their_block(tmp_path):
+    # One quoted field every 50 rows, several in every block.
+    lines = [f"{i}\tWO2005{i:06d}\tDE\t0.5" for i in range(2_000)]
+    for i in range(0, 2_000, 50):
+        lines[i] = f'"{i}"\tWO2005{i:06d}\tDE\t0.5'
+    path = tmp_path / "regpat.txt"
+    path.write_bytes(text(lines))
+
+    meta = build_regpat_index(path)
+    assert meta["n_lines"] == 2_000
+    assert meta["n_pct"] == 2_000 - 40
+    assert meta["unsplit_bytes"] < 0.05 * path.stat().st_size
+
+    wanted = ["WO2005000007", "WO2005000050", "WO2005001234"]
+    looked_up, stats = scan(path, wanted)
+    assert stats[0].get("index")
+    pd.testing.assert_frame_equal(looked_up, scan(path, wanted, prefilter=False, use_index=False)[0])
+    assert looked_up["pct_nbr"].tolist() == wanted
+
+
+def test_header_only_file(tmp_path):
+    path = tmp_path / "regpat.txt"
+    path.write_text(HEADER + "\n", encoding="utf-8")
+    meta = build_regpat_index(path)
+    assert meta["n_lines"] == meta["n_pct"] == 0
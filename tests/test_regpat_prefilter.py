@@ -0,0 +1,110 @@
+import codecs
+
+import pandas as pd
+import pytest
+
+from pipeline import regpat
+from pipeline.regpat import load_regpat_filtered_many
+
+HEADER = "app_nbr\tpct_nbr\tctry_code\tinv_share"
+WANTED = [f"WO2005{i:06d}" for i in range(0, 60, 2)]
+
+
+def rows(n: int = 60) -> list[str]:
+    return [f"{i}\tWO2005{i:06d}\t{'DEUSFRJP'[2 * (i % 4):2 * (i % 4) + 2]}\t0.{i % 9 + 1}" for i in range(n)]
+
+
+def quoted() -> list[str]:
+    lines = rows()
+    lines[10] = '10\t"WO2005000010"\tFR\t"0.25"'
+    lines[20] = '20\t"WO2005000020"\t"DE"\t0.5'
+    return lines
+
+
+def quoted_separator() -> list[str]:
+    lines = rows()
+    lines[4] = '"4\twith a tab"\tWO2005000004\tUS\t0.5'
+    return lines
+
+
+def bare_cr() -> list[str]:
+    # read_csv ends a line at a lone \r, so this holds two rows; the second is wanted.
+    lines = rows()
+    lines[21] = "WO2005000001\tx\r22\tWO2005000022\tUS"
+    del lines[22]
+    return lines
+
+
+def wrong_field_count() -> list[str]:
+    lines = rows()
+    lines[6] = "6\tWO2005000006\tDE"
+    lines[8] = "8\tWO2005000008"
+    lines[10] = "10\tWO2005000010\tDE\t0.5\textra"
+    return lines
+
+
+def pct_last() -> list[str]:
+    # Fields map to the header from the left, also in a block whose first line
+    # has the extra field (read_csv would otherwise make app_nbr the index).
+    lines = [f"{i}\tDE\t0.5\tWO2005{i:06d}" for i in range(60)]
+    lines[12] = "12\tDE\t0.5\tWO2005000012\textra"
+    return lines
+
+
+def padded_and_empty() -> list[str]:
+    lines = rows()
+    lines[2] = "2\t\tDE\t0.5"
+    lines[4] = "4\t WO2005000004\tDE\t0.5"
+    lines[6] = "6\tWO2005000006 \tUS\t0.5"
+    lines[8] = "8\tWO2005000008\t\t0.5"
+    lines[12] = "12\two2005000012\tFR\t0.5"
+    return lines
+
+
+def text(lines: list[str], newline: str = "\n", header: str = HEADER) -> bytes:
+    return (newline.join([header, *lines]) + newline).encode("utf-8")
+
+
+CASES = {
+    "plain": text(rows()),
+    "no_final_newline": text(rows()).rstrip(b"\n"),
+    "quoted": text(quoted()),
+    "quoted_separator": text(quoted_separator()),
+    "crlf": text(rows(), "\r\n"),
+    "bare_cr": text(bare_cr()),
+    "blank_lines": text([*rows()[:10], "", "", *rows()[10:30], "", *rows()[30:], ""]),
+    "crlf_blank_lines": text([*rows()[:10], "", *rows()[10:]], "\r\n"),
+    "wrong_field_count": text(wrong_field_count()),
+    "pct_last": text(pct_last(), header="app_nbr\tctry_code\tinv_share\tpct_nbr"),
+    "bom": codecs.BOM_UTF8 + text(rows()),
+    "padded_and_empty": text(padded_and_empty()),
+}
+
+
+@pytest.fixture(params=[None, 256], ids=["one_block", "small_blocks"])
+def block_bytes(request, monkeypatch):
+    """One block for the whole file, or blocks of a few lines so clean and odd blocks mix."""
+    if request.param is not None:
+        monkeypatch.setattr(regpat, "PREFILTER_BLOCK_BYTES", request.param)
+    return request.param
+
+
+def scan(path, **kwargs) -> tuple[pd.DataFrame, list[dict]]:
+    stats: list[dict] = []
+    frame = load_regpat_filtered_many(path, {"a": WANTED}, chunk_stats=stats, use_index=False, **kwargs)["a"]
+    return frame.reset_index(drop=True), stats
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_prefilter_matches_full_parse(tmp_path, case, block_bytes):
+    path = tmp_path / "regpat.txt"
+    path.write_bytes(CASES[case])
+
+    expected, _ = scan(path, prefilter=False)
+    assert len(expected)
+    prefiltered, stats = scan(path)
+    pd.testing.assert_frame_equal(prefiltered, expected)
+    if case in ("plain", "no_final_newline", "crlf", "blank_lines", "bom"):
+        # These are filtered on raw bytes, not parsed whole.
+        assert all(s["rows_parsed"] < s["rows"] or not s["rows"] for s in stats)
+
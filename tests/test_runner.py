@@ -0,0 +1,143 @@
+import json
+import multiprocessing
+
+import pandas as pd
+import pytest
+from bq_stub import StubClient, bq_result
+from regpat_data import write_regpat
+
+from pipeline import regpat
+from pipeline.bq_fetch import BQConfig, QueryCache, QueryJobs
+from pipeline.runner import COUNTS_TABLE, execute_pipeline
+
+CFG = BQConfig(project_id="demo", location="US")
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    bq = bq_result(40)
+    query_file = tmp_path / "q.sql"
+    query_file.write_text("SELECT publication_number, filing_date FROM t", encoding="utf-8")
+    regpat_file = write_regpat(tmp_path / "regpat.txt", [f"WO2005{i:06d}" for i in range(0, 40, 2)])
+    return bq, query_file, regpat_file
+
+
+def run(tmp_path, bq, query_file, regpat_file, out_dir, cache_dir=None, **kwargs):
+    """One pipeline run; bq is a result frame or a StubClient."""
+    jobs = QueryJobs(CFG, client=bq if isinstance(bq, StubClient) else StubClient(bq))
+    try:
+        execute_pipeline(
+            query_file=query_file,
+            regpat_file=regpat_file,
+            out_dir=out_dir,
+            cache_dir=cache_dir or tmp_path / "cache",
+            chunksize=1_000,
+            regpat_sep="\t",
+            project_id=CFG.project_id,
+            location=CFG.location,
+            query_cache=QueryCache((cache_dir or tmp_path / "cache") / "bq"),
+            query_jobs=jobs,
+            **kwargs,
+        )
+    finally:
+        jobs.close()
+    return json.loads((out_dir / "run_metadata.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("keep_regpat_filtered", [False, True])
+def test_new_out_dir_gets_its_own_outputs(tmp_path, inputs, keep_regpat_filtered):
+    first = run(tmp_path, *inputs, tmp_path / "outA", keep_regpat_filtered=keep_regpat_filtered)
+    again = run(tmp_path, *inputs, tmp_path / "outA", keep_regpat_filtered=keep_regpat_filtered)
+    assert "executed" not in again["stages"].values()
+
+    second = run(tmp_path, *inputs, tmp_path / "outB", keep_regpat_filtered=keep_regpat_filtered)
+    assert "executed" in second["stages"].values()
+    outputs = second["outputs"]
+    for path in [outputs[COUNTS_TABLE], outputs["cube"]]:
+        assert path.startswith(str(tmp_path / "outB"))
+    pd.testing.assert_frame_equal(pd.read_csv(outputs[COUNTS_TABLE]), pd.read_csv(first["outputs"][COUNTS_TABLE]))
+    assert sorted(p.name for p in (tmp_path / "outB").iterdir()) == sorted(p.name for p in (tmp_path / "outA").iterdir())
+
+
+def counts_of(meta: dict) -> pd.DataFrame:
+    counts = pd.read_csv(meta["outputs"][COUNTS_TABLE])
+    return counts.sort_values(list(counts.columns[:2])).reset_index(drop=True)
+
+
+def test_incremental_refresh_equals_full_run(tmp_path, inputs):
+    _, query_file, regpat_file = inputs
+    query_file.write_text("SELECT publication_number, filing_date, publication_date FROM t", encoding="utf-8")
+    table = bq_result(40).assign(publication_date=[20060101 + i for i in range(40)])
+    # Numbers 30 and 32 are in RegPat but not yet in the table.
+    later = table["publication_number"].isin(["WO-2005000030-A1", "WO-2005000032-A1"])
+    table.loc[later, "filing_date"] = [20040101, 20040102]
+    # The last row fetched has the watermark date, so it is fetched again.
+    table.loc[39, "filing_date"] = 20060101
+    client = StubClient(table[~later].reset_index(drop=True))
+    run(tmp_path, client, query_file, regpat_file, tmp_path / "out", incremental_column="publication_date")
+    watermark = int(client.results["publication_date"].max())
+
+    # Then 30 arrives with the watermark's own date, 32 after it, and 2 is
+    # republished with a filing date in another year. Its old year, 2005, is
+    # not recomputed, so its earlier rows must not be kept.
+    table.loc[later, "publication_date"] = [watermark, watermark + 7]
+    moved = table["publication_number"] == "WO-2005000002-A1"
+    table.loc[moved, ["filing_date", "publication_date"]] = [20030101, watermark + 5]
+    client.results = table
+    incremental = run(tmp_path, client, query_file, regpat_file, tmp_path / "out", incremental_column="publication_date")
+    assert incremental["incremental"]["recomputed_years"] == [2003, 2004, 2006]
+
+    full = run(tmp_path, table, query_file, regpat_file, tmp_path / "full", cache_dir=tmp_path / "full_cache")
+    pd.testing.assert_frame_equal(counts_of(incremental), counts_of(full))
+
+
+@pytest.mark.parametrize("keep_regpat_filtered", [False, True])
+def test_workers_give_the_same_outputs(tmp_path, monkeypatch, keep_regpat_filtered):
+    # Blocks of a few hundred lines, so each worker's byte range is read in
+    # several budget-sized blocks (the workers are forked with these values),
+    # and a budget small enough for kept rows to be spilled.
+    monkeypatch.setattr(regpat, "MIN_PREFILTER_BLOCK_BYTES", 16 << 10)
+    monkeypatch.setattr(regpat, "PREFILTER_BLOCK_BYTES", 64 << 10)
+    bq = bq_result(5_000)
+    query_file = tmp_path / "q.sql"
+    query_file.write_text("SELECT publication_number, filing_date FROM t", encoding="utf-8")
+    regpat_file = write_regpat(tmp_path / "regpat.txt", [f"WO2005{i:06d}" for i in range(0, 5_000, 2)], n_other=5_000)
+
+    metas = {}
+    for workers in (1, 2):
+        out_dir = tmp_path / f"out{workers}"
+        metas[workers] = run(
+            tmp_path,
+            bq,
+            query_file,
+            regpat_file,
+            out_dir,
+            cache_dir=tmp_path / f"cache{workers}",
+            workers=workers,
+            memory_budget=1 << 18,
+            keep_regpat_filtered=keep_regpat_filtered,
+        )
+
+    one, two = metas[1]["outputs"], metas[2]["outputs"]
+    for name in [COUNTS_TABLE, "match_diagnostics"]:
+        pd.testing.assert_frame_equal(pd.read_csv(two[name]), pd.read_csv(one[name]))
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(two["match_diagnostics_by_pct"]), pd.read_parquet(one["match_diagnostics_by_pct"])
+    )
+    if keep_regpat_filtered:
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(tmp_path / "cache2" / "regpat_filtered.parquet"),
+            pd.read_parquet(tmp_path / "cache1" / "regpat_filtered.parquet"),
+        )
+
+    scans = {
+        workers: next(stage for stage in meta["stage_metrics"] if stage["stage"] == "regpat_scan")
+        for workers, meta in metas.items()
+    }
+    assert scans[1]["rows_in"] == scans[2]["rows_in"]
+    assert len(scans[1]["chunks"]) > 1
+    if keep_regpat_filtered:
+        assert scans[1]["rows_spilled"] and scans[2]["rows_spilled"]
+    if multiprocessing.get_start_method() == "fork":
+        ranges = {tuple(chunk["byte_range"]) for chunk in scans[2]["chunks"]}
+        assert len(scans[2]["chunks"]) > len(ranges) > 1
@@ -0,0 +1,80 @@
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from regpat_data import write_regpat
+
+from pipeline.serve import CountService, RegpatMemory, make_server
+
+PCT_NBRS = [f"WO2005{i:06d}" for i in range(20)]
+
+
+@pytest.fixture
+def service(tmp_path):
+    memory = RegpatMemory.load(write_regpat(tmp_path / "regpat.txt", PCT_NBRS))
+    return CountService(memory, tmp_path / "bq_cache")
+
+
+def test_stale_socket_is_replaced(tmp_path, service):
+    path = tmp_path / "serve.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+
+    server = make_server(service, socket_path=path)
+    server.server_close()
+
+
+def test_other_file_at_socket_path_is_kept(tmp_path, service):
+    path = tmp_path / "data.txt"
+    path.write_text("keep me", encoding="utf-8")
+
+    with pytest.raises(FileExistsError, match="not a socket"):
+        make_server(service, socket_path=path)
+    assert path.read_text(encoding="utf-8") == "keep me"
+
+
+@pytest.fixture
+def post(service):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+
+    def send(body: dict) -> tuple[int, dict]:
+        request = urllib.request.Request(f"http://{host}:{port}/counts", data=json.dumps(body).encode("utf-8"))
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as exc:
+            return exc.code, json.load(exc)
+
+    yield send
+    server.shutdown()
+    server.server_close()
+
+
+def test_counts_with_filing_dates(post):
+    status, reply = post({"pct_nbrs": PCT_NBRS[:3], "filing_dates": ["2004-05-01", 20040501, None]})
+    assert status == 200
+    assert {row["filing_year"] for row in reply["counts"]} == {2004}
+
+
+@pytest.mark.parametrize("bad", [{"a": 1}, [20040501], 2004.5, True, 10**30])
+def test_bad_filing_date_is_a_400(post, bad):
+    status, reply = post({"pct_nbrs": PCT_NBRS[:1], "filing_dates": [bad]})
+    assert status == 400
+    assert "filing_dates" in reply["error"]
+
+
+def test_unexpected_error_is_a_500(post, service, monkeypatch):
+    def fail(request):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(service, "counts", fail)
+    status, reply = post({"pct_nbrs": PCT_NBRS[:1]})
+    assert status == 500
+    assert "RuntimeError" in reply["error"]